@@ -3,7 +3,78 @@ from unittest.mock import patch
 
 import pytest
 
+from wb.cloud_agent.bandwidth import OutboundScheduler
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.engine import arbiter
 from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.traffic import metered_link
+
+
+@pytest.fixture(autouse=True)
+def connectivity_file(tmp_path):
+    with patch.object(device_connectivity, "path", str(tmp_path / "connectivity.json")):
+        yield device_connectivity.path
+
+
+@pytest.fixture(autouse=True)
+def engine_lock_file(tmp_path):
+    with patch.object(arbiter, "lock_file", str(tmp_path / "engine.lock")):
+        yield arbiter.lock_file
+
+
+@pytest.fixture(autouse=True)
+def no_dns_lookups():
+    # Tests must not depend on the network, the transport falls back to curl's own resolving
+    with patch("wb.cloud_agent.resolver._lookup", side_effect=OSError("DNS is disabled in tests")) as mock:
+        yield mock
+
+
+@pytest.fixture(autouse=True)
+def unmetered_link():
+    with patch.object(metered_link, "is_metered", return_value=False) as mock:
+        yield mock
+
+
+@pytest.fixture(autouse=True)
+def no_traffic_files():
+    with patch.dict("wb.cloud_agent.traffic._meters", clear=True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def outbound():
+    with patch("wb.cloud_agent.bandwidth.outbound", OutboundScheduler()) as scheduler:
+        yield scheduler
+
+
+@pytest.fixture(autouse=True)
+def fresh_endpoints():
+    with patch.dict("wb.cloud_agent.endpoints._selectors", clear=True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_snapshots():
+    with patch.dict("wb.cloud_agent.snapshot._snapshots", clear=True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_path_probes():
+    # Interface probes connect to the cloud host, tests set interface states themselves
+    with (
+        patch.dict("wb.cloud_agent.paths._selectors", clear=True),
+        patch("wb.cloud_agent.paths.PathSelector.start"),
+        patch("wb.cloud_agent.paths.is_metered_interface", side_effect=lambda i: i.startswith("wwan")),
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_link_watcher():
+    # Without the rtnetlink subscription waits for the network are plain time.sleep()
+    with patch("wb.cloud_agent.netlink.LinkWatcher.start"):
+        yield
 
 
 @pytest.fixture
@@ -40,7 +111,7 @@ def mock_subprocess_run():
 
 @pytest.fixture
 def mock_subprocess(mock_subprocess_run):  # pylint: disable=redefined-outer-name
-    def _inner(http_status, body, meta=None, headers=None):
+    def _inner(http_status, body, meta=None, headers=None, stderr=b""):
         if headers is None:
             headers = f"HTTP/1.1 {http_status.value} {http_status.phrase}\r\n\r\n"
         if meta is None:
@@ -49,6 +120,7 @@ def mock_subprocess(mock_subprocess_run):  # pylint: disable=redefined-outer-nam
 
         mock_subprocess_run.return_value.returncode = 0
         mock_subprocess_run.return_value.stdout = stdout
+        mock_subprocess_run.return_value.stderr = stderr
         return stdout
 
     return _inner
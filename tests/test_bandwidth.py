@@ -0,0 +1,109 @@
+# pylint: disable=redefined-outer-name
+
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent.bandwidth import (
+    BULK,
+    INTERACTIVE,
+    REPORT,
+    OutboundScheduler,
+    TokenBucket,
+    outbound_slot,
+    request_class,
+)
+
+WAIT_S = 0.2
+
+
+@pytest.fixture
+def mock_monotonic():
+    with patch("time.monotonic", return_value=1000.0) as _mock_monotonic:
+        yield _mock_monotonic
+
+
+def run_in_thread(
+    scheduler: OutboundScheduler, cls: str, **kwargs
+) -> tuple[threading.Thread, threading.Event]:
+    admitted = threading.Event()
+
+    def request() -> None:
+        with scheduler.admit(cls, **kwargs):
+            admitted.set()
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    return thread, admitted
+
+
+@pytest.mark.parametrize(
+    "endpoint, cls",
+    [
+        ("events/?limit=10", INTERACTIVE),
+        ("events/confirm/", INTERACTIVE),
+        ("metrics-collector-log/", REPORT),
+        ("upload-diagnostic/", BULK),
+    ],
+)
+def test_request_class(endpoint, cls):
+    assert request_class(endpoint) == cls
+
+
+def test_token_bucket_burst_then_rate(mock_monotonic):
+    bucket = TokenBucket(rate=1000, burst=5000)
+
+    assert bucket.take(4000) is None
+    assert bucket.take(4000) == 1000  # paced
+
+    bucket.paced_transfer_done()
+    mock_monotonic.return_value += 3
+    assert bucket.take(3000) is None
+    assert bucket.take(1) == 1000
+
+
+def test_report_waits_for_interactive():
+    scheduler = OutboundScheduler()
+
+    with scheduler.admit(INTERACTIVE):
+        thread, admitted = run_in_thread(scheduler, REPORT)
+        assert not admitted.wait(WAIT_S)
+
+    thread.join()
+    assert admitted.is_set()
+
+
+def test_long_poll_does_not_hold_back_reports():
+    scheduler = OutboundScheduler()
+
+    with scheduler.admit(INTERACTIVE, idle=True):
+        thread, admitted = run_in_thread(scheduler, BULK)
+        assert admitted.wait(WAIT_S)
+
+    thread.join()
+
+
+def test_queue_wait_is_limited():
+    scheduler = OutboundScheduler()
+
+    with patch("wb.cloud_agent.bandwidth.OUTBOUND_MAX_QUEUE_WAIT_S", 0.05), scheduler.admit(REPORT):
+        with scheduler.admit(BULK) as (_rate, waited):
+            assert waited >= 0.05
+
+
+def test_outbound_slot_paces_bulk_and_counts_wait(settings, outbound):
+    outbound.bucket.burst = 0
+
+    with (
+        patch("wb.cloud_agent.bandwidth.get_counters") as mock_counters,
+        outbound_slot(settings, "upload-diagnostic/", 1000, bulk_rate=4096) as rate,
+    ):
+        assert rate == 4096
+
+    mock_counters.return_value.add.assert_any_call("queue_requests_bulk")
+
+
+def test_outbound_slot_does_not_pace_interactive(settings):
+    with outbound_slot(settings, "events/?limit=10&wait=60", 10**9, bulk_rate=4096) as rate:
+        assert rate is None
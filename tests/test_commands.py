@@ -1,21 +1,37 @@
 # pylint: disable=redefined-outer-name
 
 import subprocess
+import threading
+import time
 from argparse import Namespace
+from concurrent.futures import Future
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from wb.cloud_agent.commands import (
+    _initial_versions_stamp,
+    _report_package_upgrades,
     add_on_premise_provider,
     add_provider,
     del_all_providers,
     del_controller_from_cloud,
     del_provider,
     run_daemon,
-    show_providers,
+)
+from wb.cloud_agent.constants import (
+    ENGINE_CHECK_ATTEMPTS,
+    LINK_OFFLINE_MAX_WAIT_S,
+    PACKAGES_SETTLE_S,
 )
 from wb.cloud_agent.handlers.curl import CloudNetworkError
+from wb.cloud_agent.handlers.push import PushChannelError
+
+
+@pytest.fixture(autouse=True)
+def mock_check_engine():
+    with patch("wb.cloud_agent.commands.check_engine") as mock:
+        yield mock
 
 
 @pytest.fixture
@@ -26,38 +42,6 @@ def mock_mqtt_cloud_agent():
         yield mock_instance
 
 
-def test_show_providers_empty():
-    options = Namespace()
-
-    with (
-        patch("wb.cloud_agent.commands.get_provider_names", return_value=[]),
-        patch("wb.cloud_agent.commands.load_providers_data", return_value=[]),
-        patch("wb.cloud_agent.commands.show_providers_table") as mock_show,
-    ):
-        result = show_providers(options)
-
-        assert result == 0
-        mock_show.assert_called_once_with([])
-
-
-def test_show_providers_with_data():
-    options = Namespace()
-    providers = [MagicMock(name="provider1"), MagicMock(name="provider2")]
-
-    with (
-        patch(
-            "wb.cloud_agent.commands.get_provider_names",
-            return_value=["provider1", "provider2"],
-        ),
-        patch("wb.cloud_agent.commands.load_providers_data", return_value=providers),
-        patch("wb.cloud_agent.commands.show_providers_table") as mock_show,
-    ):
-        result = show_providers(options)
-
-        assert result == 0
-        mock_show.assert_called_once_with(providers)
-
-
 @pytest.mark.usefixtures("mock_mqtt_cloud_agent")
 def test_add_provider_success(mock_mqtt_cloud_agent):
     options = Namespace(base_url="https://example.com/", name=None)
@@ -304,23 +288,59 @@ def test_del_controller_from_cloud_success():
         mock_delete.assert_called_once_with(mock_settings)
 
 
-@pytest.mark.usefixtures("mock_mqtt_cloud_agent")
-def test_run_daemon_startup_failure():
+def test_run_daemon_engine_key_mismatch(mock_check_engine):
+    mock_check_engine.side_effect = ValueError("Key does not match cert")
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app"),
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable") as mock_wait,
+        patch("time.sleep") as mock_sleep,
+    ):
+        assert run_daemon(Namespace(provider_name="test", broker=None)) == 6
+
+    mock_wait.assert_not_called()
+    # Confirmed by rereading the chip before the service is stopped for good
+    assert mock_check_engine.call_count == ENGINE_CHECK_ATTEMPTS
+    assert mock_sleep.call_count == ENGINE_CHECK_ATTEMPTS - 1
+
+
+def test_run_daemon_engine_key_misread(mock_check_engine, mock_mqtt_cloud_agent):
+    mock_check_engine.side_effect = [ValueError("Key does not match cert"), None]
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app"),
+        patch(
+            "wb.cloud_agent.commands.fetch_start_up_response", side_effect=CloudNetworkError("Network error")
+        ),
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("time.sleep"),
+    ):
+        assert run_daemon(Namespace(provider_name="test", broker=None)) == 1
+
+    assert mock_check_engine.call_count == 2
+    mock_mqtt_cloud_agent.start.assert_called_once()
+
+
+def test_run_daemon_startup_failure(mock_mqtt_cloud_agent):
     options = Namespace(provider_name="test", broker=None)
 
     with (
         patch("wb.cloud_agent.commands.configure_app") as mock_config,
         patch("wb.cloud_agent.commands.wait_for_cloud_reachable") as mock_wait,
         patch(
-            "wb.cloud_agent.commands.make_start_up_request",
+            "wb.cloud_agent.commands.fetch_start_up_response",
             side_effect=CloudNetworkError("Startup failed"),
         ),
         patch("wb.cloud_agent.commands.send_packages_version"),
     ):
         mock_settings = MagicMock()
         mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
         mock_settings.broker_url = "tcp://localhost:1883"
         mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
         mock_settings.ping_period_seconds = 7
         mock_config.return_value = mock_settings
 
@@ -328,10 +348,46 @@ def test_run_daemon_startup_failure():
 
         assert result == 1
 
-        mock_wait.assert_called_once_with(mock_settings.cloud_base_url, mock_settings.ping_period_seconds)
+        # The failed start-up request is followed by the staged probe
+        mock_wait.assert_called_once()
+        assert mock_wait.call_args.args == (mock_settings.cloud_base_url, mock_settings.ping_period_seconds)
 
         mock_config.assert_called_once()
 
+    # The virtual device doesn't stay "connecting"
+    mock_mqtt_cloud_agent.remove_vdev.assert_called_once()
+    mock_mqtt_cloud_agent.stop.assert_called_once()
+
+
+@pytest.mark.usefixtures("mock_mqtt_cloud_agent")
+def test_run_daemon_start_up_request_doubles_as_probe():
+    options = Namespace(provider_name="test", broker=None)
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable") as mock_wait,
+        patch("wb.cloud_agent.commands.fetch_start_up_response") as mock_start_up,
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request", return_value=None),
+        patch("time.sleep", side_effect=KeyboardInterrupt),
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+    mock_start_up.assert_called_once()
+    mock_wait.assert_not_called()
+
 
 @pytest.mark.usefixtures("mock_mqtt_cloud_agent")
 def test_run_daemon_with_custom_broker():
@@ -340,7 +396,7 @@ def test_run_daemon_with_custom_broker():
     with (
         patch("wb.cloud_agent.commands.configure_app") as mock_config,
         patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
-        patch("wb.cloud_agent.commands.make_start_up_request"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
         patch("wb.cloud_agent.commands.send_packages_version"),
         patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
         patch("wb.cloud_agent.commands.make_event_request"),
@@ -348,8 +404,12 @@ def test_run_daemon_with_custom_broker():
     ):  # Stop the loop
         mock_settings = MagicMock()
         mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
         mock_settings.broker_url = "tcp://localhost:1883"
         mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
         mock_config.return_value = mock_settings
 
         try:
@@ -368,7 +428,7 @@ def test_run_daemon_event_loop_with_timeout():
     with (
         patch("wb.cloud_agent.commands.configure_app") as mock_config,
         patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
-        patch("wb.cloud_agent.commands.make_start_up_request"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
         patch("wb.cloud_agent.commands.send_packages_version"),
         patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
         patch("wb.cloud_agent.commands.make_event_request") as mock_event,
@@ -376,8 +436,12 @@ def test_run_daemon_event_loop_with_timeout():
     ):
         mock_settings = MagicMock()
         mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
         mock_settings.broker_url = "tcp://localhost:1883"
         mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
         mock_config.return_value = mock_settings
 
         mock_event.side_effect = [
@@ -401,7 +465,7 @@ def test_run_daemon_event_loop_with_exception(mock_mqtt_cloud_agent):
     with (
         patch("wb.cloud_agent.commands.configure_app") as mock_config,
         patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
-        patch("wb.cloud_agent.commands.make_start_up_request"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
         patch("wb.cloud_agent.commands.send_packages_version"),
         patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
         patch("wb.cloud_agent.commands.make_event_request") as mock_event,
@@ -409,8 +473,12 @@ def test_run_daemon_event_loop_with_exception(mock_mqtt_cloud_agent):
     ):
         mock_settings = MagicMock()
         mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
         mock_settings.broker_url = "tcp://localhost:1883"
         mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
         mock_config.return_value = mock_settings
 
         # First call: Exception, second call: success and status ok, third: KeyboardInterrupt
@@ -431,3 +499,331 @@ def test_run_daemon_event_loop_with_exception(mock_mqtt_cloud_agent):
             call for call in mock_mqtt_cloud_agent.publish_ctrl.call_args_list if call[0][0] == "status"
         ]
         assert len(status_calls) >= 2
+
+
+@pytest.mark.usefixtures("mock_mqtt_cloud_agent")
+def test_run_daemon_long_poll_rearms_immediately():
+    options = Namespace(provider_name="test", broker=None)
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("time.sleep") as mock_sleep,
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_enabled = True
+        mock_settings.long_poll_timeout = 60
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_config.return_value = mock_settings
+
+        mock_event.side_effect = [None, CloudNetworkError("Network error"), KeyboardInterrupt()]
+
+        with patch("random.uniform", return_value=7), pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+        # Failed request is retried after a randomized backoff
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0, pytest.approx(7, abs=0.1)]
+
+
+@pytest.mark.usefixtures("mock_mqtt_cloud_agent")
+def test_run_daemon_waits_for_network_only_after_network_failure():
+    options = Namespace(provider_name="test", broker=None)
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("wb.cloud_agent.commands.link_watcher") as mock_watcher,
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_enabled = True
+        mock_settings.long_poll_timeout = 60
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_config.return_value = mock_settings
+
+        mock_event.side_effect = [None, CloudNetworkError("Network error"), KeyboardInterrupt()]
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+        # A cloud on the LAN is polled as usual without a default route
+        assert [call.kwargs["offline_delay"] for call in mock_watcher.sleep.call_args_list] == [
+            None,
+            LINK_OFFLINE_MAX_WAIT_S,
+        ]
+
+
+@pytest.mark.usefixtures("mock_mqtt_cloud_agent")
+def test_run_daemon_drains_event_backlog():
+    options = Namespace(provider_name="test", broker=None)
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("time.sleep") as mock_sleep,
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_settings.events_pending = None
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+
+        mock_event.side_effect = [10, 10, 0, KeyboardInterrupt()]
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+        # Polled faster after recent events
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0, 0, pytest.approx(5, abs=0.1)]
+
+
+def test_run_daemon_push_channel_fallback_to_polling(mock_mqtt_cloud_agent):
+    options = Namespace(provider_name="test", broker=None)
+
+    def push_channel(_settings, _mqtt, on_connected, _on_alive):
+        on_connected()
+        raise PushChannelError("Push channel is lost")
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.run_push_channel", side_effect=push_channel) as mock_push,
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("time.sleep"),
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = True
+        mock_settings.poll_phase = None
+        mock_config.return_value = mock_settings
+
+        mock_event.side_effect = [None, KeyboardInterrupt()]
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+        # Push channel is retried only after PUSH_RETRY_INTERVAL_S of polling
+        mock_push.assert_called_once()
+        assert mock_event.call_count == 2
+        mock_mqtt_cloud_agent.publish_ctrl.assert_any_call("status", "ok")
+
+
+def test_run_daemon_upkeep_goes_on_while_push_channel_is_connected(mock_mqtt_cloud_agent):
+    options = Namespace(provider_name="test", broker=None)
+
+    def push_channel(_settings, _mqtt, on_connected, on_alive):
+        on_connected()
+        on_alive()
+        raise KeyboardInterrupt()
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.run_push_channel", side_effect=push_channel),
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("wb.cloud_agent.commands.process_uptime", return_value=12.34),
+        patch("wb.cloud_agent.commands.get_snapshot") as mock_snapshot,
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.push_enabled = True
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+        mock_snapshot.return_value.warm_start.return_value = None
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+    mock_event.assert_not_called()
+    mock_snapshot.return_value.confirm.assert_called_once()
+    mock_mqtt_cloud_agent.publish_ctrl.assert_any_call("startup_time", "12.3")
+    mock_mqtt_cloud_agent.publish_traffic.assert_called_once()
+
+
+def test_report_package_upgrades(settings):
+    stamp = (1_000_000_000, 100)
+    upgraded = (int((time.time() - PACKAGES_SETTLE_S - 1) * 1e9), 120)
+
+    with (
+        patch("wb.cloud_agent.commands.package_index") as mock_index,
+        patch("wb.cloud_agent.commands.send_packages_version") as mock_send,
+    ):
+        mock_index.stamp.return_value = stamp
+        assert _report_package_upgrades(settings, stamp) == stamp
+        mock_send.assert_not_called()
+
+        mock_index.stamp.return_value = upgraded
+        assert _report_package_upgrades(settings, stamp) == upgraded
+        mock_send.assert_called_once_with(settings)
+
+
+def test_report_package_upgrades_waits_for_dpkg(settings):
+    stamp = (1_000_000_000, 100)
+
+    with (
+        patch("wb.cloud_agent.commands.package_index") as mock_index,
+        patch("wb.cloud_agent.commands.send_packages_version") as mock_send,
+    ):
+        mock_index.stamp.return_value = (time.time_ns(), 120)
+        assert _report_package_upgrades(settings, stamp) == stamp
+
+    mock_send.assert_not_called()
+
+
+def test_report_package_upgrades_survives_errors(settings):
+    with (
+        patch("wb.cloud_agent.commands.package_index") as mock_index,
+        patch("wb.cloud_agent.commands.send_packages_version", side_effect=ValueError("bad status")),
+    ):
+        mock_index.stamp.return_value = (0, 120)
+        assert _report_package_upgrades(settings, None) is None
+
+
+def test_initial_versions_stamp_failed_report_is_retried():
+    versions_report = Future()
+    versions_report.set_exception(ValueError("bad status"))
+
+    assert _initial_versions_stamp(versions_report) is None
+
+
+def test_run_daemon_start_up_request_goes_along_with_mqtt(mock_mqtt_cloud_agent):
+    options = Namespace(provider_name="test", broker=None)
+    requested = threading.Event()
+    mqtt_waited_for_request = []
+
+    def fetch_start_up_response(_settings):
+        requested.set()
+        return {"activated": True, "activationLink": ""}
+
+    mock_mqtt_cloud_agent.start.side_effect = lambda **_: mqtt_waited_for_request.append(requested.wait(5))
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.fetch_start_up_response", side_effect=fetch_start_up_response),
+        patch("wb.cloud_agent.commands.apply_start_up_response") as mock_apply,
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request", return_value=None),
+        patch("time.sleep", side_effect=KeyboardInterrupt),
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+    assert mqtt_waited_for_request == [True]
+    # The response is published on the virtual device
+    mock_mqtt_cloud_agent.publish_vdev.assert_called_once()
+    mock_apply.assert_called_once()
+
+
+def test_run_daemon_reports_time_to_first_poll(mock_mqtt_cloud_agent):
+    options = Namespace(provider_name="test", broker=None)
+    versions_sent = threading.Event()
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable"),
+        patch("wb.cloud_agent.commands.fetch_start_up_response"),
+        # Off the critical path: the first poll doesn't wait for the version report
+        patch("wb.cloud_agent.commands.send_packages_version", side_effect=lambda _: versions_sent.wait(5)),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="http://link"),
+        patch("wb.cloud_agent.commands.make_event_request") as mock_event,
+        patch("wb.cloud_agent.commands.process_uptime", return_value=12.34),
+        patch("time.sleep", side_effect=KeyboardInterrupt),
+    ):
+        mock_settings = MagicMock()
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+        mock_event.return_value = None
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+        versions_sent.set()
+
+    mock_event.assert_called_once()
+    mock_mqtt_cloud_agent.publish_ctrl.assert_any_call("startup_time", "12.3")
+    mock_mqtt_cloud_agent.publish_ctrl.assert_any_call("activation_link", "http://link")
+
+
+def test_run_daemon_warm_start(mock_mqtt_cloud_agent, tmp_path):
+    options = Namespace(provider_name="test", broker=None)
+    snapshot = {"activated": False, "activationLink": "https://example.com/activate"}
+
+    with (
+        patch("wb.cloud_agent.commands.configure_app") as mock_config,
+        patch("wb.cloud_agent.commands.wait_for_cloud_reachable") as mock_wait,
+        patch("wb.cloud_agent.commands.fetch_start_up_response") as mock_start_up,
+        patch("wb.cloud_agent.commands.apply_start_up_response") as mock_apply,
+        patch("wb.cloud_agent.commands.send_packages_version"),
+        patch("wb.cloud_agent.commands.read_activation_link", return_value="https://example.com/activate"),
+        patch("wb.cloud_agent.commands.make_event_request", return_value=None),
+        patch("wb.cloud_agent.snapshot.AgentSnapshot.warm_start", return_value=snapshot),
+        patch("time.sleep", side_effect=KeyboardInterrupt),
+    ):
+        mock_settings = MagicMock()
+        mock_settings.provider_name = "test"
+        mock_settings.snapshot_file = tmp_path / "snapshot.json"
+        mock_settings.cloud_base_url = "https://example.com"
+        mock_settings.cloud_agent_url = "https://agent.example.com/api-agent/v1/"
+        mock_settings.request_period_seconds = 10
+        mock_settings.long_poll_timeout = 0
+        mock_settings.push_enabled = False
+        mock_settings.poll_phase = None
+        mock_settings.data_saver = False
+        mock_config.return_value = mock_settings
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon(options)
+
+    # The first poll checks reachability, the start-up response comes from the snapshot
+    mock_wait.assert_not_called()
+    mock_start_up.assert_not_called()
+    mock_apply.assert_called_once_with(mock_settings, snapshot, mock_mqtt_cloud_agent)
@@ -0,0 +1,109 @@
+# pylint: disable=redefined-outer-name
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent.connectivity import ConnectivityState
+from wb.cloud_agent.constants import (
+    CONNECTIVITY_BACKOFF_AFTER,
+    CONNECTIVITY_FRESH_S,
+    CONNECTIVITY_PROBE_MAX_INTERVAL_S,
+)
+
+HOST = "agent.example.com"
+OTHER_PID = os.getpid() + 1
+
+
+@pytest.fixture
+def state(tmp_path):
+    return ConnectivityState(str(tmp_path / "connectivity.json"))
+
+
+def other_agent(state):
+    """The same state as seen by another agent process."""
+    return patch("os.getpid", return_value=OTHER_PID), ConnectivityState(state.path)
+
+
+def test_reachable_host_is_shared(state):
+    assert not state.is_reachable(HOST)
+
+    with patch("time.monotonic", return_value=1000):
+        state.record_host(HOST, True, 10)
+        assert ConnectivityState(state.path).is_reachable(HOST)
+    with patch("time.monotonic", return_value=1000 + CONNECTIVITY_FRESH_S):
+        assert not state.is_reachable(HOST)
+
+
+def test_one_agent_at_a_time_tries_unreachable_host(state):
+    assert state.wait_for_turn(HOST) == 0  # unknown host, anyone may try
+    assert state.record_host(HOST, False, 10) == 10
+
+    getpid, other = other_agent(state)
+    with getpid:
+        assert other.wait_for_turn(HOST) == pytest.approx(10, abs=1)
+
+    # This agent's turn goes on, the others wait for its result
+    assert state.wait_for_turn(HOST) == 0
+
+
+def test_turn_passes_to_another_agent_after_backoff(state):
+    with patch("time.monotonic", return_value=1000):
+        state.record_host(HOST, False, 10)
+
+    getpid, other = other_agent(state)
+    with getpid, patch("time.monotonic", return_value=1011):
+        assert other.wait_for_turn(HOST) == 0
+    with patch("time.monotonic", return_value=1012):
+        assert state.wait_for_turn(HOST) > 0
+
+
+def test_collective_backoff(state):
+    delays = [state.record_host(HOST, False, 10) for _ in range(CONNECTIVITY_BACKOFF_AFTER + 8)]
+
+    assert delays[:CONNECTIVITY_BACKOFF_AFTER] == [10] * CONNECTIVITY_BACKOFF_AFTER
+    assert delays[CONNECTIVITY_BACKOFF_AFTER : CONNECTIVITY_BACKOFF_AFTER + 2] == [20, 40]
+    assert delays[-1] == CONNECTIVITY_PROBE_MAX_INTERVAL_S
+
+    assert state.record_host(HOST, True, 10) == 10
+    assert state.record_host(HOST, False, 10) == 10
+
+
+def test_link_up_resets_backoff(state):
+    for _ in range(CONNECTIVITY_BACKOFF_AFTER + 2):
+        state.record_host(HOST, False, 10)
+    state.record_link(False)
+
+    state.record_link(True)
+
+    getpid, other = other_agent(state)
+    with getpid:
+        assert other.wait_for_turn(HOST) == 0
+    assert state.record_host(HOST, False, 10) == 10
+
+
+def test_dns_failing(state):
+    assert not state.dns_failing()
+
+    state.record_dns(False)
+    assert ConnectivityState(state.path).dns_failing()
+
+    state.record_dns(True)
+    assert not state.dns_failing()
+
+
+def test_state_not_shared_without_file(tmp_path):
+    state = ConnectivityState(str(tmp_path / "missing" / "connectivity.json"))
+
+    assert state.record_host(HOST, False, 10) == 10
+    assert state.wait_for_turn(HOST) == 0
+
+
+def test_invalid_file(state):
+    with open(state.path, "w", encoding="utf-8") as file:
+        file.write("[1, 2]")
+
+    assert not state.is_reachable(HOST)
+    state.record_host(HOST, True, 10)
+    assert state.is_reachable(HOST)
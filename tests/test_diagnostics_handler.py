@@ -64,3 +64,32 @@ def test_upload_diagnostic_selects_latest_file(settings, mock_subprocess, tmp_pa
 
     assert diag_file1.exists()
     assert not diag_file2.exists()
+
+
+def test_upload_diagnostic_deferred_on_metered_link(settings, mock_subprocess, tmp_path, unmetered_link):
+    mock_subprocess(status.OK, '{"result": "ok"}')
+    settings.diag_archive = tmp_path
+    settings.data_saver = True
+    (tmp_path / "diag_20231201.zip").write_text("fake diagnostic data")
+    unmetered_link.side_effect = [True, True, False]
+
+    with patch("wb.cloud_agent.handlers.diagnostics.time.sleep") as mock_sleep:
+        upload_diagnostic(settings)
+
+    mock_sleep.assert_called_once()
+    assert not (tmp_path / "diag_20231201.zip").exists()
+
+
+def test_upload_diagnostic_not_deferred_without_data_saver(
+    settings, mock_subprocess, tmp_path, unmetered_link
+):
+    mock_subprocess(status.OK, '{"result": "ok"}')
+    settings.diag_archive = tmp_path
+    settings.data_saver = False
+    unmetered_link.return_value = True
+    (tmp_path / "diag_20231201.zip").write_text("fake diagnostic data")
+
+    with patch("wb.cloud_agent.handlers.diagnostics.time.sleep") as mock_sleep:
+        upload_diagnostic(settings)
+
+    mock_sleep.assert_not_called()
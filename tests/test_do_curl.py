@@ -1,11 +1,39 @@
+# pylint: disable=redefined-outer-name
+
+import gzip
 import json
+from contextlib import contextmanager
 from http import HTTPStatus as status
-from subprocess import CalledProcessError
+from subprocess import CalledProcessError, TimeoutExpired
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from wb.cloud_agent.constants import CLIENT_CERT_ERROR_MSG
-from wb.cloud_agent.handlers.curl import CloudNetworkError, do_curl, handle_curl_output
+from wb.cloud_agent.constants import (
+    CLIENT_CERT_ERROR_MSG,
+    LONG_POLL_MAX_TIMEOUT_S,
+    RETRY_AFTER_MAX_S,
+    UPLINK_SOCKET,
+)
+from wb.cloud_agent.handlers.curl import (
+    DEFAULT_RETRY_POLICY,
+    CloudBusyError,
+    CloudNetworkError,
+    RetryPolicy,
+    do_curl,
+    get_retry_policy,
+    handle_curl_output,
+)
+from wb.cloud_agent.handlers.libcurl import LibcurlError
+from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.snapshot import AgentSnapshot
+from wb.cloud_agent.traffic import Traffic
+
+
+@pytest.fixture(autouse=True)
+def mock_sleep():
+    with patch("time.sleep") as _mock_sleep:
+        yield _mock_sleep
 
 
 def test_do_curl_success_response(settings, mock_subprocess):
@@ -37,6 +65,16 @@ def test_do_curl_certs_error(mock_subprocess_run, settings):
     )
 
 
+def test_do_curl_certs_error_after_engine_check(mock_subprocess_run, settings):
+    settings.engine_checked = True
+    mock_subprocess_run.side_effect = CalledProcessError(returncode=58, cmd=["curl"], output=b"", stderr=b"")
+
+    with pytest.raises(CloudNetworkError, match="crypto chip"):
+        do_curl(settings=settings)
+
+    mock_subprocess_run.assert_called_once()
+
+
 def test_do_curl_generic_error(mock_subprocess_run, settings):
     mock_subprocess_run.side_effect = CalledProcessError(
         returncode=57, cmd=["curl"], output=b"", stderr=b"some low-level curl error"
@@ -66,6 +104,19 @@ def test_handle_curl_output_with_poll_interval(settings, mock_subprocess):
     assert settings.request_period_seconds == x_poll_interval
 
 
+def test_handle_curl_output_saves_tuned_settings(settings, mock_subprocess, tmp_path):
+    settings.snapshot_file = tmp_path / "snapshot.json"
+    headers = f"HTTP/1.1 {status.OK} OK\r\nx-poll-interval: 42\r\nx-metrics-log-enabled: 0\r\n\r\n"
+    stdout = mock_subprocess(status.OK, "{}", headers=headers)
+
+    handle_curl_output(settings, stdout)
+
+    restarted = AppSettings(provider_name="default")
+    AgentSnapshot(settings.snapshot_file).warm_start(restarted)
+    assert restarted.request_period_seconds == 42
+    assert restarted.metrics_log_enabled is False
+
+
 def test_handle_curl_output_without_poll_interval(settings, mock_subprocess):
     request_period_seconds = settings.request_period_seconds
     input_data = {"msg": "no poll header"}
@@ -83,7 +134,7 @@ def test_handle_curl_output_invalid_json(settings, mock_subprocess):
 
     output_data, status_code = handle_curl_output(settings, stdout)
 
-    assert output_data == {}  # fallback
+    assert output_data == {}  # fallback  # pylint: disable=use-implicit-booleaness-not-comparison
     assert status_code == status.OK
 
 
@@ -123,6 +174,43 @@ def test_do_curl_multipart_post_method(mock_subprocess_run, settings, mock_subpr
     assert f"file=@{test_file}" in args
 
 
+def test_do_curl_paces_bulk_upload(mock_subprocess_run, settings, mock_subprocess, tmp_path, outbound):
+    mock_subprocess(status.OK, "{}")
+    outbound.bucket.burst = 1024
+    test_file = tmp_path / "diag.zip"
+    test_file.write_bytes(b"x" * 2048)
+
+    do_curl(settings, method="multipart-post", endpoint="upload-diagnostic/", params=test_file)
+
+    args = mock_subprocess_run.call_args[0][0]
+    assert args[args.index("--limit-rate") + 1] == str(outbound.bucket.rate)
+
+
+def test_do_curl_falls_back_to_next_interface(mock_subprocess_run, settings, mock_subprocess, mock_sleep):
+    settings.interfaces = {"interactive": ["eth0", "wwan0"], "bulk": ["eth0"]}
+    stdout = mock_subprocess(status.OK, "{}")
+    mock_subprocess_run.side_effect = [
+        CalledProcessError(returncode=7, cmd=["curl"]),
+        MagicMock(stdout=stdout),
+    ]
+
+    do_curl(settings, endpoint="events/")
+
+    interfaces = [
+        call.args[0][call.args[0].index("--interface") + 1] for call in mock_subprocess_run.call_args_list
+    ]
+    assert interfaces == ["eth0", "wwan0"]
+    assert mock_sleep.call_count == 1
+
+
+def test_do_curl_default_route_without_interfaces(mock_subprocess_run, settings, mock_subprocess):
+    mock_subprocess(status.OK, "{}")
+
+    do_curl(settings, endpoint="events/")
+
+    assert "--interface" not in mock_subprocess_run.call_args[0][0]
+
+
 def test_do_curl_post_method_with_params(mock_subprocess_run, settings, mock_subprocess):
     mock_subprocess(status.OK, '{"result": "success"}')
     params = {"key": "value", "number": 123}
@@ -138,6 +226,42 @@ def test_do_curl_post_method_with_params(mock_subprocess_run, settings, mock_sub
     assert "-d" in args
 
 
+def test_do_curl_post_compressed_body(mock_subprocess_run, settings, mock_subprocess):
+    headers = f"HTTP/1.1 {status.OK.value} OK\r\nAccept-Encoding: gzip\r\n\r\n"
+    mock_subprocess(status.OK, "{}", headers=headers)
+    params = {"log": "x" * 4096}
+
+    do_curl(settings, method="post", endpoint="metrics-collector-log/", params=params)
+    assert settings.request_encoding == "gzip"
+    do_curl(settings, method="post", endpoint="metrics-collector-log/", params=params)
+
+    args = mock_subprocess_run.call_args.args[0]
+    assert "-d" not in args
+    assert args[args.index("--data-binary") + 1] == "@-"
+    assert "Content-Encoding: gzip" in args
+    assert json.loads(gzip.decompress(mock_subprocess_run.call_args.kwargs["input"])) == params
+
+
+def test_handle_curl_output_msgpack(settings):
+    headers = "HTTP/1.1 200 OK\r\nContent-Type: application/msgpack\r\n\r\n"
+    stdout = headers.encode() + b"\x81\xa2id\x01|||" + b'{"code": "200"}'
+
+    with patch("wb.cloud_agent.handlers.curl.decode_body", return_value={"id": 1}) as mock_decode:
+        data, code = handle_curl_output(settings, stdout)
+
+    assert (data, code) == ({"id": 1}, 200)
+    mock_decode.assert_called_once_with(b"\x81\xa2id\x01", "application/msgpack")
+
+
+def test_handle_curl_output_counts_payload_bytes(settings, mock_subprocess):
+    stdout = mock_subprocess(status.OK, '{"a": 1}', meta='{"code": "200", "size_download": "30.000000"}')
+
+    with patch("wb.cloud_agent.handlers.curl.record_payload") as mock_record:
+        handle_curl_output(settings, stdout)
+
+    mock_record.assert_called_once_with(settings, received=8, received_wire=30)
+
+
 def test_do_curl_put_method(mock_subprocess_run, settings, mock_subprocess):
     mock_subprocess(status.OK, '{"result": "success"}')
     data, code = do_curl(settings, method="put", params={"data": "test"})
@@ -168,11 +292,79 @@ def test_do_curl_custom_retry_opts(mock_subprocess_run, settings, mock_subproces
     assert data == {"result": "success"}
     assert code == 200
 
+    # Retries are made by the agent, not by curl
+    args = mock_subprocess_run.call_args[0][0]
+    assert args[args.index("--retry") + 1] == "0"
+    assert args[args.index("--connect-timeout") + 1] == "10"
+
+
+def test_do_curl_retries_within_deadline(mock_subprocess_run, settings, mock_subprocess, mock_sleep):
+    stdout = mock_subprocess(status.OK, '{"result": "success"}')
+    mock_subprocess_run.side_effect = [
+        CalledProcessError(returncode=7, cmd=["curl"]),
+        CalledProcessError(returncode=35, cmd=["curl"]),
+        MagicMock(stdout=stdout),
+    ]
+
+    data, _ = do_curl(settings, endpoint="agent-start-up/")
+
+    assert data == {"result": "success"}
+    assert mock_subprocess_run.call_count == 3
+    assert mock_sleep.call_count == 2
+    # Every attempt gets the time left of the budget
+    max_times = [
+        float(call.args[0][call.args[0].index("--max-time") + 1])
+        for call in mock_subprocess_run.call_args_list
+    ]
+    assert all(max_time <= DEFAULT_RETRY_POLICY.deadline for max_time in max_times)
+
+
+def test_do_curl_gives_up_when_budget_is_spent(mock_subprocess_run, settings, mock_sleep):
+    mock_subprocess_run.side_effect = CalledProcessError(returncode=7, cmd=["curl"])
+    retry_policy = RetryPolicy(deadline=10, retries=100)
+    clock = [0.0]
+    mock_sleep.side_effect = lambda delay: clock.append(clock[-1] + delay)
+
+    with patch("time.monotonic", side_effect=lambda: clock[-1]), pytest.raises(CloudNetworkError):
+        do_curl(settings, endpoint="events/", retry_policy=retry_policy)
+
+    assert sum(call.args[0] for call in mock_sleep.call_args_list) < 10
+
+
+def test_do_curl_hung_process_is_network_error(mock_subprocess_run, settings):
+    mock_subprocess_run.side_effect = TimeoutExpired("curl", 70)
+
+    with pytest.raises(CloudNetworkError):
+        do_curl(settings, endpoint="events/")
+
+    assert mock_subprocess_run.call_count == get_retry_policy(settings, "events/").retries + 1
+
+
+def test_get_retry_policy(settings):
+    events_policy = get_retry_policy(settings, "events/?limit=10")
+
+    assert events_policy.deadline < get_retry_policy(settings, "upload-diagnostic/").deadline
+    assert get_retry_policy(settings, "agent-start-up/") == DEFAULT_RETRY_POLICY
+
+
+def test_do_curl_with_cloud_tuning(mock_subprocess_run, settings, mock_subprocess):
+    tuning = '{"*": {"compressed": true}, "events/": {"connect_timeout": 5, "long_poll_timeout": 90}}'
+    mock_subprocess(status.OK, "{}", headers=f"HTTP/1.1 200 OK\r\nx-agent-tuning: {tuning}\r\n\r\n")
+
+    with patch.dict("wb.cloud_agent.tuning._tunings", clear=True):
+        do_curl(settings, endpoint="agent-start-up/")
+        do_curl(settings, endpoint="events/")
+
+        assert get_retry_policy(settings, "events/").connect_timeout == 5
+        assert (
+            get_retry_policy(settings, "agent-start-up/").connect_timeout
+            == DEFAULT_RETRY_POLICY.connect_timeout
+        )
+
     args = mock_subprocess_run.call_args[0][0]
-    assert "--retry" in args
-    assert "3" in args
-    assert "--connect-timeout" in args
-    assert "10" in args
+    assert args[args.index("--connect-timeout") + 1] == "5"
+    assert "--compressed" in args
+    assert settings.long_poll_timeout == 90
 
 
 def test_handle_curl_output_invalid_status_code_format(settings, mock_subprocess):
@@ -180,3 +372,331 @@ def test_handle_curl_output_invalid_status_code_format(settings, mock_subprocess
 
     with pytest.raises(ValueError, match="Invalid data in response"):
         handle_curl_output(settings, stdout)
+
+
+def test_do_curl_libcurl_transport(mock_subprocess_run, settings):
+    settings.transport = "libcurl"
+    headers = b"HTTP/1.1 200 OK\r\nx-poll-interval: 30\r\n\r\n"
+
+    with (
+        patch("wb.cloud_agent.handlers.curl.libcurl.is_available", return_value=True),
+        patch("wb.cloud_agent.handlers.curl.libcurl.perform", return_value=(headers, b'{"a": 1}', 200)),
+    ):
+        data, code = do_curl(settings, endpoint="events/")
+
+    assert data == {"a": 1}
+    assert code == 200
+    assert settings.request_period_seconds == 30
+    mock_subprocess_run.assert_not_called()
+
+
+def test_do_curl_libcurl_transport_network_error(settings):
+    settings.transport = "libcurl"
+
+    with (
+        patch("wb.cloud_agent.handlers.curl.libcurl.is_available", return_value=True),
+        patch(
+            "wb.cloud_agent.handlers.curl.libcurl.perform",
+            side_effect=LibcurlError(6, "Could not resolve host"),
+        ),
+        pytest.raises(CloudNetworkError),
+    ):
+        do_curl(settings, endpoint="events/")
+
+
+def test_do_curl_libcurl_transport_fallback_to_curl(settings, mock_subprocess):
+    settings.transport = "libcurl"
+    mock_subprocess(status.OK, '{"result": "success"}')
+
+    with patch("wb.cloud_agent.handlers.curl.libcurl.is_available", return_value=False):
+        data, code = do_curl(settings)
+
+    assert data == {"result": "success"}
+    assert code == 200
+
+
+def test_do_curl_uses_resolved_addresses(mock_subprocess_run, settings, mock_subprocess):
+    mock_subprocess(
+        status.OK, "{}", meta='{"code": "200", "url": "https://agent/events/", "ip": "192.0.2.1"}'
+    )
+
+    with (
+        patch("wb.cloud_agent.handlers.curl.get_resolve_entry", return_value="host:443:192.0.2.1"),
+        patch("wb.cloud_agent.handlers.curl.record_connected") as mock_connected,
+    ):
+        do_curl(settings, endpoint="events/")
+
+    args = mock_subprocess_run.call_args[0][0]
+    assert args[args.index("--resolve") + 1] == "host:443:192.0.2.1"
+    mock_connected.assert_called_once_with(settings, "https://agent/events/", "192.0.2.1")
+
+
+def test_do_curl_fails_over_to_next_endpoint(mock_subprocess_run, settings, mock_sleep):
+    settings.agent_urls = [
+        "https://agent-a.example.com/api-agent/v1/",
+        "https://agent-b.example.com/api-agent/v1/",
+    ]
+    ok = MagicMock(stdout=b'HTTP/1.1 200 OK\r\n\r\n{"a": 1}|||{"code": "200"}')
+    mock_subprocess_run.side_effect = [CalledProcessError(returncode=7, cmd=["curl"]), ok, ok]
+
+    with patch("wb.cloud_agent.handlers.curl.curl_supports_ssl_sessions", return_value=False):
+        assert do_curl(settings, endpoint="events/") == ({"a": 1}, 200)
+        # The failed endpoint is skipped by the next requests too
+        do_curl(settings, endpoint="events/")
+
+    urls = [call.args[0][-1] for call in mock_subprocess_run.call_args_list]
+    assert urls == [
+        "https://agent-a.example.com/api-agent/v1/events/",
+        "https://agent-b.example.com/api-agent/v1/events/",
+        "https://agent-b.example.com/api-agent/v1/events/",
+    ]
+    mock_sleep.assert_called_once_with(0)
+
+
+def test_do_curl_budget_spent_in_queue(mock_subprocess_run, settings):
+    clock = [0.0]
+
+    @contextmanager
+    def slow_slot(*_):
+        clock.append(clock[-1] + 20)
+        yield None
+
+    with (
+        patch("time.monotonic", side_effect=lambda: clock[-1]),
+        patch("wb.cloud_agent.handlers.curl.outbound_slot", slow_slot),
+        pytest.raises(CloudNetworkError) as exc_info,
+    ):
+        do_curl(settings, endpoint="events/", retry_policy=RetryPolicy(deadline=10, retries=0))
+
+    assert isinstance(exc_info.value.__cause__, TimeoutError)
+    mock_subprocess_run.assert_not_called()
+
+
+def test_do_curl_uplink_transport(mock_subprocess_run, settings, mock_subprocess):
+    settings.transport = "uplink"
+    mock_subprocess(status.OK, '{"a": 1}')
+
+    with patch("os.path.exists", return_value=True):
+        data, code = do_curl(settings, endpoint="events/")
+
+    assert data == {"a": 1}
+    assert code == 200
+    args = mock_subprocess_run.call_args[0][0]
+    assert args[args.index("--unix-socket") + 1] == UPLINK_SOCKET
+    assert args[-1] == "http://uplink/default/events/"
+    assert "--cert" not in args
+    assert any(arg.startswith("x-uplink-options: --connect-timeout 15 --retry 0") for arg in args)
+
+
+def test_do_curl_uplink_transport_records_traffic(settings, mock_subprocess):
+    settings.transport = "uplink"
+    headers = "HTTP/1.1 200 OK\r\nx-uplink-traffic: 300 500 4000 1\r\n\r\n"
+    mock_subprocess(status.OK, "{}", headers=headers)
+
+    with (
+        patch("os.path.exists", return_value=True),
+        patch("wb.cloud_agent.handlers.curl.record_traffic") as mock_record,
+    ):
+        do_curl(settings, endpoint="events/")
+
+    mock_record.assert_called_once_with(settings, "events/", Traffic(300, 500, 4000, 1))
+
+
+def test_do_curl_uplink_transport_records_measurements(mock_subprocess_run, settings, mock_subprocess):
+    settings.transport = "uplink"
+    headers = (
+        "HTTP/1.1 200 OK\r\n"
+        "x-uplink-measurements: tls_full=1 engine_wait_s=0.25 bad=x address=192.0.2.1 rtt=0.05\r\n\r\n"
+    )
+    mock_subprocess(status.OK, "{}", headers=headers)
+
+    with (
+        patch("os.path.exists", return_value=True),
+        patch(
+            "wb.cloud_agent.handlers.curl.get_resolve_entry", return_value="agent.example.com:443:192.0.2.1"
+        ),
+        patch("wb.cloud_agent.handlers.libcurl.record_measurements") as mock_record,
+    ):
+        do_curl(settings, endpoint="events/")
+
+    args = mock_subprocess_run.call_args[0][0]
+    assert "x-uplink-resolve: agent.example.com:443:192.0.2.1" in args
+    url, measurements = mock_record.call_args.args[1:]
+    assert url == settings.cloud_agent_url + "events/"
+    assert measurements.counters == {"tls_full": 1, "engine_wait_s": 0.25}
+    assert (measurements.address, measurements.rtt) == ("192.0.2.1", 0.05)
+
+
+def test_do_curl_records_traffic(settings, mock_subprocess):
+    meta = json.dumps(
+        {"code": "200", "size_request": "150", "size_upload": "12", "size_header": "90", "size_download": "8"}
+    )
+    mock_subprocess(status.OK, '{"a": 1}', meta=meta)
+
+    with patch("wb.cloud_agent.handlers.curl.record_traffic") as mock_record:
+        do_curl(settings, method="post", endpoint="events/confirm/", params={"ids": [1]})
+
+    mock_record.assert_called_once_with(
+        settings, "events/confirm/", Traffic(sent=162, received=98, requests=1)
+    )
+
+
+def test_do_curl_uplink_transport_error(mock_subprocess_run, settings, mock_subprocess):
+    settings.transport = "uplink"
+    mock_subprocess(status.BAD_GATEWAY, "", headers="HTTP/1.1 502 Bad Gateway\r\nx-uplink-error: 7\r\n\r\n")
+
+    with patch("os.path.exists", return_value=True), pytest.raises(CloudNetworkError):
+        do_curl(settings, endpoint="events/")
+
+    assert mock_subprocess_run.call_count == 4  # events/ policy: 3 retries
+
+
+def test_do_curl_uplink_transport_other_error(settings, mock_subprocess):
+    settings.transport = "uplink"
+    mock_subprocess(status.BAD_GATEWAY, "", headers="HTTP/1.1 502 Bad Gateway\r\nx-uplink-error: 35\r\n\r\n")
+
+    with patch("os.path.exists", return_value=True), pytest.raises(RuntimeError, match="curl error 35"):
+        do_curl(settings, endpoint="events/")
+
+
+def test_do_curl_uplink_transport_fallback_to_curl(mock_subprocess_run, settings, mock_subprocess):
+    settings.transport = "uplink"
+    mock_subprocess(status.OK, "{}")
+
+    with patch("os.path.exists", return_value=False):
+        do_curl(settings, endpoint="events/")
+
+    assert "--cert" in mock_subprocess_run.call_args[0][0]
+
+
+@pytest.mark.parametrize(
+    "verbose, kind",
+    [
+        (b"* SSL reusing session with ALPN 'http/1.1'\n* SSL connection using TLSv1.3\n", "resumed"),
+        # The session has been rejected, the server has sent its certificate
+        (b"* SSL reusing session\n* TLSv1.3 (IN), TLS handshake, Certificate (11):\n", "full"),
+        (b"* TLSv1.3 (IN), TLS handshake, Certificate (11):\n", "full"),
+    ],
+)
+def test_do_curl_uses_tls_session_file(mock_subprocess_run, settings, mock_subprocess, verbose, kind):
+    mock_subprocess(status.OK, "{}", stderr=verbose)
+
+    with (
+        patch("wb.cloud_agent.handlers.curl.curl_supports_ssl_sessions", return_value=True),
+        patch("wb.cloud_agent.handlers.curl.record_tls_handshake") as mock_record,
+        patch("wb.cloud_agent.handlers.curl.engine_access") as mock_engine,
+    ):
+        do_curl(settings, endpoint="events/")
+
+    args = mock_subprocess_run.call_args[0][0]
+    assert args[-4:] == [
+        "--ssl-sessions",
+        str(settings.tls_sessions_file),
+        "-v",
+        settings.cloud_agent_url + "events/",
+    ]
+    mock_record.assert_called_once_with(settings, kind)
+    # Resumption is not known before the run
+    mock_engine.assert_called_once()
+
+
+def test_do_curl_without_tls_session_file(mock_subprocess_run, settings, mock_subprocess):
+    mock_subprocess(status.OK, "{}")
+    settings.tls_session_cache = False
+
+    with patch("wb.cloud_agent.handlers.curl.record_tls_handshake") as mock_record:
+        do_curl(settings, endpoint="events/")
+
+    assert "--ssl-sessions" not in mock_subprocess_run.call_args[0][0]
+    mock_record.assert_called_once_with(settings, "full")
+
+
+@pytest.mark.parametrize(
+    "header_value, long_poll_timeout",
+    [("55", 55), ("0", 0), ("100000", LONG_POLL_MAX_TIMEOUT_S)],
+)
+def test_handle_curl_output_with_long_poll_timeout(
+    settings, mock_subprocess, header_value, long_poll_timeout
+):
+    headers = f"HTTP/1.1 {status.NO_CONTENT} No Content\r\nx-long-poll-timeout: {header_value}\r\n\r\n"
+    stdout = mock_subprocess(status.NO_CONTENT, "", headers=headers)
+
+    handle_curl_output(settings, stdout)
+
+    assert settings.long_poll_timeout == long_poll_timeout
+
+
+def test_handle_curl_output_long_poll_disabled(settings, mock_subprocess):
+    settings.long_poll_enabled = False
+    headers = f"HTTP/1.1 {status.NO_CONTENT} No Content\r\nx-long-poll-timeout: 55\r\n\r\n"
+    stdout = mock_subprocess(status.NO_CONTENT, "", headers=headers)
+
+    handle_curl_output(settings, stdout)
+
+    assert settings.long_poll_timeout == 0
+
+
+def test_handle_curl_output_with_events_pending(settings, mock_subprocess):
+    stdout = mock_subprocess(status.OK, "{}", headers="HTTP/1.1 200 OK\r\nx-events-pending: 42\r\n\r\n")
+
+    handle_curl_output(settings, stdout)
+
+    assert settings.events_pending == 42
+
+
+def test_handle_curl_output_with_poll_phase(settings, mock_subprocess):
+    stdout = mock_subprocess(status.OK, "{}", headers="HTTP/1.1 200 OK\r\nx-poll-phase: 3.5\r\n\r\n")
+
+    handle_curl_output(settings, stdout)
+
+    assert settings.poll_phase == 3.5
+
+
+def test_do_curl_busy_error_carries_retry_after_of_its_response(settings, mock_subprocess):
+    mock_subprocess(
+        status.SERVICE_UNAVAILABLE,
+        "",
+        headers="HTTP/1.1 503 Service Unavailable\r\nRetry-After: 7000\r\n\r\n",
+    )
+    retry_policy = RetryPolicy(deadline=10, retries=0)
+
+    assert do_curl(settings, endpoint="events/", retry_policy=retry_policy)[1] == status.SERVICE_UNAVAILABLE
+    with pytest.raises(CloudBusyError) as exc_info:
+        do_curl(settings, endpoint="events/", retry_policy=retry_policy, busy_error=True)
+
+    assert exc_info.value.retry_after == RETRY_AFTER_MAX_S
+    assert not hasattr(settings, "retry_after")
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["x-poll-interval: 5s", "x-long-poll-timeout: soon", "x-events-pending: many", "x-poll-phase: nan"],
+)
+def test_handle_curl_output_ignores_malformed_headers(settings, mock_subprocess, header):
+    settings.long_poll_enabled = True
+    stdout = mock_subprocess(status.OK, '{"a": 1}', headers=f"HTTP/1.1 200 OK\r\n{header}\r\n\r\n")
+
+    assert handle_curl_output(settings, stdout) == ({"a": 1}, status.OK)
+
+    defaults = AppSettings(provider_name="default")
+    assert settings.request_period_seconds == defaults.request_period_seconds
+    assert settings.long_poll_timeout == defaults.long_poll_timeout
+    assert settings.events_pending is None
+    assert settings.poll_phase is None
+
+
+def test_handle_curl_output_header_names_are_case_insensitive(settings, mock_subprocess):
+    settings.long_poll_enabled = True
+    headers = (
+        "HTTP/1.1 200 OK\r\nX-Poll-Interval: 42\r\nX-Metrics-Log-Enabled: 0\r\n"
+        "X-Long-Poll-Timeout: 60\r\nX-Events-Pending: 3\r\nX-Poll-Phase: 0.5\r\n\r\n"
+    )
+    stdout = mock_subprocess(status.OK, "{}", headers=headers)
+
+    handle_curl_output(settings, stdout)
+
+    assert settings.request_period_seconds == 42
+    assert settings.metrics_log_enabled is False
+    assert settings.long_poll_timeout == 60
+    assert settings.events_pending == 3
+    assert settings.poll_phase == 0.5
@@ -0,0 +1,72 @@
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from wb.cloud_agent.dpkg import PackageIndex, parse_dpkg_status
+
+STATUS = """Package: wb-mqtt-db
+Status: install ok installed
+Priority: optional
+Version: 2.13.0
+Description: Wiren Board MQTT database
+ A continuation line: with a colon
+Depends: libc6
+
+Package: python3-paho-mqtt
+Status: hold ok installed
+Version: 1.5.1-1
+
+Package: frpc
+Status: deinstall ok config-files
+Version: 0.51.3
+
+Package: libfoo
+Architecture: armhf
+Status: install ok installed
+Version: 1.0
+"""
+
+
+@pytest.fixture
+def status_file(tmp_path):
+    path = tmp_path / "status"
+    path.write_text(STATUS)
+    return path
+
+
+def test_parse_dpkg_status():
+    assert parse_dpkg_status(STATUS) == {
+        "wb-mqtt-db": "2.13.0",
+        "python3-paho-mqtt": "1.5.1-1",
+        "libfoo": "1.0",
+    }
+
+
+def test_index_is_rebuilt_when_status_changes(status_file, tmp_path):
+    index = PackageIndex(str(status_file), str(tmp_path / "packages.json"))
+    assert index.versions()["wb-mqtt-db"] == "2.13.0"
+
+    status_file.write_text(STATUS.replace("2.13.0", "2.14.0"))
+    os.utime(status_file, ns=(1, 1))
+
+    assert index.versions()["wb-mqtt-db"] == "2.14.0"
+
+
+def test_index_is_shared_through_cache_file(status_file, tmp_path):
+    cache_file = tmp_path / "packages.json"
+    PackageIndex(str(status_file), str(cache_file)).versions()
+    stat = status_file.stat()
+    # Another instance takes the versions from the cache while the status file is the same
+    status_file.write_text(STATUS.replace("2.13.0", "2.13.9"))
+    os.utime(status_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert PackageIndex(str(status_file), str(cache_file)).versions()["wb-mqtt-db"] == "2.13.0"
+
+
+def test_index_without_dpkg(tmp_path):
+    index = PackageIndex(str(tmp_path / "missing"), str(tmp_path / "packages.json"))
+
+    assert index.stamp() is None
+    assert index.versions() == {}
@@ -0,0 +1,100 @@
+# pylint: disable=redefined-outer-name
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent.endpoints import Endpoint, EndpointSelector, parse_endpoints
+
+DEFAULT_URL = "https://agent.example.com/api-agent/v1/"
+URL_A = "https://agent-a.example.com/api-agent/v1/"
+URL_B = "https://agent-b.example.com/api-agent/v1/"
+
+
+@pytest.fixture
+def endpoints_file(tmp_path):
+    return tmp_path / "endpoints.json"
+
+
+def test_parse_endpoints():
+    entries = [
+        URL_A,
+        {"url": "https://agent-b.example.com/api-agent/v1", "weight": 2},
+        "ftp://x/",
+        {"weight": 1},
+    ]
+
+    assert parse_endpoints(entries) == [Endpoint(URL_A), Endpoint(URL_B, weight=2.0)]
+
+
+def test_default_endpoint(endpoints_file):
+    assert EndpointSelector(endpoints_file, DEFAULT_URL).select() == DEFAULT_URL
+
+
+def test_first_endpoint_until_measured(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL, [URL_A, URL_B])
+
+    assert selector.select() == URL_A
+
+
+def test_failover_and_cooldown(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL, [URL_A, URL_B])
+
+    with patch("time.monotonic", return_value=1000):
+        assert selector.record_failure(URL_A + "events/")
+        assert selector.select() == URL_B
+    with patch("time.monotonic", return_value=1400):
+        # Cooldown is over, but B works and A has failed recently
+        selector.record_rtt(URL_B, 0.1)
+        assert selector.select() == URL_B
+
+
+def test_single_endpoint_failure_has_no_failover(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL)
+
+    assert not selector.record_failure(DEFAULT_URL)
+    assert selector.select() == DEFAULT_URL
+
+
+def test_selects_faster_endpoint_with_hysteresis(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL, [URL_A, URL_B])
+    selector.record_rtt(URL_A, 0.2)
+    assert selector.select() == URL_A
+
+    selector.record_rtt(URL_B, 0.18)
+    assert selector.select() == URL_A  # not worth a new connection
+
+    selector.record_rtt(URL_B, 0.05)
+    selector.record_rtt(URL_B, 0.05)
+    assert selector.select() == URL_B
+
+
+def test_weight(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL, [URL_A, {"url": URL_B, "weight": 3}])
+    selector.record_rtt(URL_A, 0.1)
+    selector.record_rtt(URL_B, 0.2)
+
+    assert selector.select() == URL_B
+
+
+def test_update_from_cloud_is_saved(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL)
+
+    selector.update([URL_A, {"url": URL_B, "weight": 2}])
+
+    assert selector.select() == URL_A
+    assert json.loads(endpoints_file.read_text()) == [
+        {"url": URL_A, "weight": 1.0},
+        {"url": URL_B, "weight": 2.0},
+    ]
+    assert EndpointSelector(endpoints_file, DEFAULT_URL).select() == URL_A
+
+
+def test_config_overrides_cloud(endpoints_file):
+    selector = EndpointSelector(endpoints_file, DEFAULT_URL, [URL_B])
+
+    selector.update([URL_A])
+
+    assert selector.select() == URL_B
+    assert not endpoints_file.exists()
@@ -0,0 +1,113 @@
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent import engine
+
+
+def test_arbiter_serializes_threads(engine_lock_file):
+    arbiter = engine.EngineArbiter(engine_lock_file)
+    order = []
+
+    def use_chip(name):
+        arbiter.acquire()
+        order.append(f"{name} start")
+        time.sleep(0.05)
+        order.append(f"{name} end")
+        arbiter.release()
+
+    threads = [threading.Thread(target=use_chip, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert order[0][0] == order[1][0] and order[2][0] == order[3][0]
+
+
+def test_arbiter_works_without_lock_file(tmp_path):
+    arbiter = engine.EngineArbiter(str(tmp_path / "missing" / "engine.lock"))
+
+    arbiter.acquire()
+    arbiter.release()
+    arbiter.acquire()
+    arbiter.release()
+
+
+def test_engine_access_records_use(settings):
+    with patch("wb.cloud_agent.engine.get_counters") as mock_counters:
+        with engine.engine_access(settings):
+            pass
+
+    counters = mock_counters.return_value
+    counters.add.assert_any_call("engine_uses", 1)
+    assert {call.args[0] for call in counters.add.call_args_list} == {
+        "engine_uses",
+        "engine_wait_s",
+        "engine_busy_s",
+    }
+
+
+def test_engine_access_max_hold(settings):
+    with patch("wb.cloud_agent.engine.get_counters"):
+        with engine.engine_access(settings, max_hold=0.01):
+            time.sleep(0.1)
+            # Released by the timer, other users don't wait for the block to finish
+            assert engine.arbiter.acquire() < 0.1
+            engine.arbiter.release()
+
+
+def test_check_engine_key_matches_cert(settings, mock_subprocess_run):
+    mock_subprocess_run.return_value.stdout = b"-----BEGIN PUBLIC KEY-----\nabc\n"
+
+    with patch("wb.cloud_agent.engine.get_counters"):
+        engine.check_engine(settings)
+
+    assert settings.engine_checked
+    engine_args = mock_subprocess_run.call_args_list[1].args[0]
+    assert engine_args[:4] == ["openssl", "pkey", "-engine", "ateccx08"]
+    assert settings.client_cert_engine_key in engine_args
+
+
+def test_check_engine_key_mismatch(settings, mock_subprocess_run):
+    mock_subprocess_run.side_effect = [
+        subprocess.CompletedProcess([], 0, stdout=b"cert key"),
+        subprocess.CompletedProcess([], 0, stdout=b"other key"),
+    ]
+
+    with patch("wb.cloud_agent.engine.get_counters"), pytest.raises(ValueError, match="does not match"):
+        engine.check_engine(settings)
+
+    assert not settings.engine_checked
+
+
+def test_check_engine_chip_error(settings, mock_subprocess_run):
+    mock_subprocess_run.side_effect = [
+        subprocess.CompletedProcess([], 0, stdout=b"cert key"),
+        subprocess.CalledProcessError(1, ["openssl"], stderr=b"i2c error"),
+    ]
+
+    with patch("wb.cloud_agent.engine.get_counters"), pytest.raises(engine.EngineError, match="i2c error"):
+        engine.check_engine(settings)
+
+
+def test_measure_signing(settings, mock_subprocess_run):
+    result = engine.measure_signing(settings, 3)
+
+    assert mock_subprocess_run.call_count == 3
+    assert len(result.latencies) == len(result.waits) == 3
+    args = mock_subprocess_run.call_args.args[0]
+    assert args[:3] == ["openssl", "pkeyutl", "-sign"]
+    assert "ENG" in args
+    assert "ops/s" in result.summary()
+
+
+def test_measure_signing_software_key(settings, mock_subprocess_run):
+    engine.measure_signing(settings, 2, software_key=True)
+
+    assert mock_subprocess_run.call_args_list[0].args[0][1] == "ecparam"
+    assert "ENG" not in mock_subprocess_run.call_args.args[0]
+    assert mock_subprocess_run.call_count == 3
@@ -3,7 +3,10 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+from wb.cloud_agent.constants import DATA_SAVER_LONG_POLL_TIMEOUT_S
+from wb.cloud_agent.handlers.curl import CloudBusyError
 from wb.cloud_agent.handlers.events import (
+    EventBacklog,
     event_confirm,
     event_delete_controller,
     make_event_request,
@@ -200,10 +203,185 @@ def test_event_delete_controller_invalid_status(settings, mock_subprocess):
 
 def test_make_event_request_no_content(settings, mock_subprocess):
     mock_subprocess(status.NO_CONTENT, "")
-    assert make_event_request(settings, mqtt=MagicMock()) is None
+    assert make_event_request(settings, mqtt=MagicMock()) == 0
 
 
 def test_make_event_request_invalid_status(settings, mock_subprocess):
     mock_subprocess(status.BAD_REQUEST, '{"error": "bad request"}')
     with pytest.raises(ValueError, match="Not a 200 status while retrieving event"):
         make_event_request(settings, mqtt=MagicMock())
+
+
+def test_make_event_request_long_poll(settings):
+    settings.long_poll_timeout = 60
+
+    with patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl:
+        mock_curl.return_value = ({}, status.NO_CONTENT)
+
+        make_event_request(settings, mqtt=MagicMock())
+
+    kwargs = mock_curl.call_args.kwargs
+    assert kwargs["endpoint"] == "events/?limit=10&wait=60"
+    assert kwargs["retry_policy"].deadline == 75
+    assert kwargs["retry_policy"].retries == 0
+
+
+def test_make_event_request_long_poll_in_data_saver_mode(settings):
+    settings.long_poll_timeout = 60
+    settings.data_saver = True
+
+    with patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl:
+        mock_curl.return_value = ({}, status.NO_CONTENT)
+
+        make_event_request(settings, mqtt=MagicMock())
+
+    kwargs = mock_curl.call_args.kwargs
+    assert kwargs["endpoint"] == f"events/?limit=10&wait={DATA_SAVER_LONG_POLL_TIMEOUT_S}"
+    assert kwargs["retry_policy"].deadline == DATA_SAVER_LONG_POLL_TIMEOUT_S + 15
+
+
+def test_make_event_request_long_poll_disabled(settings):
+    settings.long_poll_timeout = 60
+    settings.long_poll_enabled = False
+
+    with patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl:
+        mock_curl.return_value = ({}, status.NO_CONTENT)
+
+        make_event_request(settings, mqtt=MagicMock())
+
+    assert mock_curl.call_args.kwargs["endpoint"] == "events/?limit=10"
+    assert mock_curl.call_args.kwargs["retry_policy"] is None
+
+
+def test_make_event_request_batch(settings):
+    mock_mqtt = MagicMock()
+    curl_calls_before_post_handler = []
+    events = [
+        {"id": "event1", "code": "update_activation_link", "payload": {"activationLink": "http://a"}},
+        {"id": "event2", "code": "delete_provider", "payload": {}},
+    ]
+
+    with (
+        patch("wb.cloud_agent.services.activation.write_to_file"),
+        patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl,
+        patch.dict(
+            "wb.cloud_agent.handlers.events.POST_HANDLERS",
+            {"delete_provider": lambda *_: curl_calls_before_post_handler.append(mock_curl.call_count)},
+        ),
+    ):
+        mock_curl.side_effect = [({"events": events}, status.OK), ({}, status.NO_CONTENT)]
+
+        make_event_request(settings, mock_mqtt)
+
+    mock_mqtt.publish_ctrl.assert_called_once_with("activation_link", "http://a")
+    assert mock_curl.call_args.kwargs["endpoint"] == "events/confirm/"
+    assert mock_curl.call_args.kwargs["params"] == {"ids": ["event1", "event2"]}
+    assert curl_calls_before_post_handler == [2]
+
+
+def test_make_event_request_batch_confirms_handled_on_error(settings):
+    events = [
+        {"id": "event1", "code": "unknown_event", "payload": {}},
+        {"id": "event2", "code": "update_tunnel_config", "payload": {}},
+        {"id": "event3", "code": "unknown_event", "payload": {}},
+    ]
+
+    with (
+        patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl,
+        patch.dict(
+            "wb.cloud_agent.handlers.events.HANDLERS",
+            {"update_tunnel_config": MagicMock(side_effect=OSError)},
+        ),
+    ):
+        mock_curl.side_effect = [({"events": events}, status.OK), ({}, status.NO_CONTENT)]
+
+        with pytest.raises(OSError):
+            make_event_request(settings, MagicMock())
+
+    assert mock_curl.call_count == 2
+    assert mock_curl.call_args.kwargs["params"] == {"ids": ["event1"]}
+
+
+def test_make_event_request_batch_post_handles_confirmed_on_error(settings):
+    events = [
+        {"id": "event1", "code": "delete_provider", "payload": {}},
+        {"id": "event2", "code": "update_tunnel_config", "payload": {}},
+    ]
+    mock_post_handler = MagicMock()
+
+    with (
+        patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl,
+        patch.dict(
+            "wb.cloud_agent.handlers.events.HANDLERS",
+            {"update_tunnel_config": MagicMock(side_effect=OSError("tunnel"))},
+        ),
+        patch.dict("wb.cloud_agent.handlers.events.POST_HANDLERS", {"delete_provider": mock_post_handler}),
+    ):
+        mock_curl.side_effect = [({"events": events}, status.OK), ({}, status.NO_CONTENT)]
+
+        with pytest.raises(OSError, match="tunnel"):
+            make_event_request(settings, MagicMock())
+
+    assert mock_curl.call_args.kwargs["params"] == {"ids": ["event1"]}
+    mock_post_handler.assert_called_once()
+
+
+def test_make_event_request_batch_confirm_error_keeps_event_error(settings):
+    events = [
+        {"id": "event1", "code": "delete_provider", "payload": {}},
+        {"id": "event2", "code": "update_tunnel_config", "payload": {}},
+    ]
+    mock_post_handler = MagicMock()
+
+    with (
+        patch("wb.cloud_agent.handlers.events.do_curl") as mock_curl,
+        patch.dict(
+            "wb.cloud_agent.handlers.events.HANDLERS",
+            {"update_tunnel_config": MagicMock(side_effect=OSError("tunnel"))},
+        ),
+        patch.dict("wb.cloud_agent.handlers.events.POST_HANDLERS", {"delete_provider": mock_post_handler}),
+    ):
+        mock_curl.side_effect = [({"events": events}, status.OK), ({}, status.BAD_GATEWAY)]
+
+        with pytest.raises(OSError, match="tunnel"):
+            make_event_request(settings, MagicMock())
+
+    # Not confirmed, the event comes again
+    mock_post_handler.assert_not_called()
+
+
+def test_event_backlog_drains_until_no_content(settings):
+    backlog = EventBacklog()
+
+    backlog.update(settings, 10)
+    backlog.update(settings, 5)
+    assert backlog.draining
+    assert backlog.drained == 15
+
+    backlog.update(settings, 0)
+    assert not backlog.draining
+
+
+def test_event_backlog_stops_on_empty_pending_queue(settings):
+    backlog = EventBacklog()
+    settings.events_pending = 0
+
+    backlog.update(settings, 1)
+
+    assert not backlog.draining
+
+
+@pytest.mark.parametrize("http_status", [status.TOO_MANY_REQUESTS, status.SERVICE_UNAVAILABLE])
+def test_make_event_request_cloud_busy(settings, mock_subprocess, http_status):
+    mock_subprocess(
+        http_status,
+        "",
+        headers=f"HTTP/1.1 {http_status.value} {http_status.phrase}\r\nRetry-After: 30\r\n\r\n",
+    )
+
+    with patch("time.sleep") as mock_sleep, pytest.raises(CloudBusyError) as exc_info:
+        make_event_request(settings, mqtt=MagicMock())
+
+    assert exc_info.value.retry_after == 30
+    # Retried within the request budget
+    mock_sleep.assert_called_with(30)
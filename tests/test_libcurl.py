@@ -0,0 +1,341 @@
+# pylint: disable=redefined-outer-name
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from wb.cloud_agent.handlers import libcurl
+from wb.cloud_agent.traffic import Traffic
+
+RETRY_OPTS = ("--connect-timeout", "45", "--retry", "8", "--retry-max-time", "120", "--retry-all-errors")
+
+
+class FakeCurlError(Exception):
+    pass
+
+
+@pytest.fixture
+def mock_pycurl():
+    fake_pycurl = MagicMock()
+    fake_pycurl.error = FakeCurlError
+    with (
+        patch.object(libcurl, "pycurl", fake_pycurl),
+        patch.object(libcurl, "_idle_handles", []),
+        patch("time.sleep"),
+    ):
+        libcurl._get_share.cache_clear()  # pylint: disable=protected-access
+        yield fake_pycurl
+
+
+def make_response(  # pylint: disable=too-many-arguments
+    handle,
+    http_code,
+    *,
+    body=b"{}",
+    headers=(b"HTTP/1.1 200 OK\r\n", b"\r\n"),
+    num_connects=1,
+    debug_text=b"",
+    active_socket=-1,
+):
+    def perform():
+        options = {call.args[0]: call.args[1] for call in handle.setopt.call_args_list}
+        if libcurl.pycurl.DEBUGFUNCTION in options:
+            options[libcurl.pycurl.DEBUGFUNCTION](libcurl.pycurl.INFOTYPE_TEXT, debug_text)
+        elif num_connects:
+            options[libcurl.pycurl.SOCKOPTFUNCTION](5, 0)
+        for line in headers:
+            options[libcurl.pycurl.HEADERFUNCTION](line)
+        options[libcurl.pycurl.WRITEFUNCTION](body)
+
+    handle.perform.side_effect = perform
+    handle.getinfo.side_effect = {
+        libcurl.pycurl.RESPONSE_CODE: http_code,
+        libcurl.pycurl.NUM_CONNECTS: num_connects,
+        libcurl.pycurl.PRIMARY_IP: "192.0.2.1",
+        libcurl.pycurl.NAMELOOKUP_TIME: 0.01,
+        libcurl.pycurl.CONNECT_TIME: 0.06,
+        libcurl.pycurl.SIZE_DOWNLOAD: float(len(body)),
+        libcurl.pycurl.SIZE_UPLOAD: 0.0,
+        libcurl.pycurl.REQUEST_SIZE: 100,
+        libcurl.pycurl.HEADER_SIZE: sum(len(line) for line in headers),
+        libcurl.pycurl.ACTIVESOCKET: active_socket,
+    }.get
+
+
+def test_parse_retry_opts():
+    opts = libcurl.parse_retry_opts(RETRY_OPTS)
+
+    assert opts == libcurl.RetryOptions(
+        connect_timeout=45, retries=8, retry_all_errors=True, retry_max_time=120
+    )
+
+
+def test_parse_retry_opts_limit_rate():
+    assert libcurl.parse_retry_opts(["--limit-rate", "32768"]).limit_rate == 32768
+
+
+def test_parse_retry_opts_interface():
+    assert libcurl.parse_retry_opts(["--interface", "wwan0"]).interface == "wwan0"
+
+
+def test_parse_retry_opts_exponential_delay():
+    opts = libcurl.parse_retry_opts(["--retry", "3", "--max-time", "7"])
+
+    assert opts.max_time == 7
+    assert [opts.delay(attempt) for attempt in (1, 2, 3)] == [1, 2, 4]
+
+
+def test_perform_reuses_handle(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200, body=b'{"result": "ok"}')
+
+    libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+    headers, body, code = libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+
+    mock_pycurl.Curl.assert_called_once()
+    assert handle.reset.call_count == 2
+    assert headers == b"HTTP/1.1 200 OK\r\n\r\n"
+    assert body == b'{"result": "ok"}'
+    assert code == 200
+    handle.setopt.assert_any_call(mock_pycurl.URL, settings.cloud_agent_url + "events/")
+    handle.setopt.assert_any_call(mock_pycurl.SSLENGINE, "ateccx08")
+    handle.setopt.assert_any_call(mock_pycurl.SSLKEY, settings.client_cert_engine_key)
+    handle.setopt.assert_any_call(mock_pycurl.SHARE, mock_pycurl.CurlShare.return_value)
+
+
+def test_perform_sends_encoded_body(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200)
+
+    with patch("wb.cloud_agent.handlers.libcurl.accept_header", return_value="Accept: application/msgpack"):
+        libcurl.perform(
+            settings, "post", "events/", libcurl.RawBody(b"\x1f\x8b", "application/json", "gzip"), RETRY_OPTS
+        )
+
+    handle.setopt.assert_any_call(
+        mock_pycurl.HTTPHEADER,
+        ["Accept: application/msgpack", "Content-Type: application/json", "Content-Encoding: gzip"],
+    )
+    handle.setopt.assert_any_call(mock_pycurl.POSTFIELDS, b"\x1f\x8b")
+
+
+@pytest.mark.parametrize(
+    "num_connects, debug_text, kind",
+    [
+        (0, b"", "reused"),
+        (1, b"SSL reusing session ID\n", "resumed"),
+        (1, b"SSL re-using session ID\n", "resumed"),
+        (1, b"SSL reusing session ID\nTLSv1.3 (IN), TLS handshake, Certificate (11):\n", "full"),
+        (1, b"TLSv1.3 (OUT), TLS handshake, Client hello (1):\n", "full"),
+    ],
+)
+def test_perform_measures_tls_handshake(mock_pycurl, settings, num_connects, debug_text, kind):
+    make_response(mock_pycurl.Curl.return_value, 200, num_connects=num_connects, debug_text=debug_text)
+    measurements = libcurl.Measurements()
+
+    libcurl.perform(settings, "get", "events/", None, RETRY_OPTS, measurements=measurements)
+
+    assert measurements.counters[f"tls_{kind}"] == 1
+
+
+def test_perform_records_measurements_for_provider(mock_pycurl, settings):
+    make_response(mock_pycurl.Curl.return_value, 200, body=b"{}")
+
+    with (
+        patch("wb.cloud_agent.handlers.libcurl.get_resolve_entry", return_value=None) as mock_resolve,
+        patch("wb.cloud_agent.handlers.libcurl.record_measurements") as mock_record,
+    ):
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+
+    url = settings.cloud_agent_url + "events/"
+    mock_resolve.assert_called_once_with(settings, url)
+    measurements = mock_record.call_args.args[2]
+    assert mock_record.call_args.args[:2] == (settings, url)
+    assert measurements.address == "192.0.2.1"
+    assert measurements.rtt == pytest.approx(0.05)
+    assert measurements.counters["body_bytes_received_wire"] == 2
+
+
+def test_perform_adds_measurements_to_given_ones(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200)
+    measurements = libcurl.Measurements()
+
+    with (
+        patch("wb.cloud_agent.handlers.libcurl.get_resolve_entry") as mock_resolve,
+        patch("wb.cloud_agent.handlers.libcurl.record_measurements") as mock_record,
+    ):
+        libcurl.perform(
+            settings,
+            "get",
+            "events/",
+            None,
+            RETRY_OPTS,
+            measurements=measurements,
+            resolve_entry="agent.example.com:443:192.0.2.7",
+        )
+
+    # The caller owns the DNS cache and the stats files
+    mock_resolve.assert_not_called()
+    mock_record.assert_not_called()
+    handle.setopt.assert_any_call(mock_pycurl.RESOLVE, ["agent.example.com:443:192.0.2.7"])
+    assert measurements.address == "192.0.2.1"
+
+
+def test_perform_keeps_last_response_headers(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(
+        handle,
+        200,
+        headers=(
+            b"HTTP/1.1 100 Continue\r\n",
+            b"\r\n",
+            b"HTTP/1.1 200 OK\r\n",
+            b"x-poll-interval: 5\r\n",
+            b"\r\n",
+        ),
+    )
+
+    headers, _, _ = libcurl.perform(settings, "multipart-post", "upload-diagnostic/", "/tmp/a.zip", [])
+
+    assert headers == b"HTTP/1.1 200 OK\r\nx-poll-interval: 5\r\n\r\n"
+
+
+def test_perform_retries_transient_http_status(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 503)
+
+    _, _, code = libcurl.perform(settings, "get", "events/", None, ["--retry", "2"])
+
+    assert code == 503
+    assert handle.perform.call_count == 3
+
+
+def test_perform_raises_curl_exit_code(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    handle.perform.side_effect = FakeCurlError(7, "Failed to connect")
+
+    with pytest.raises(libcurl.LibcurlError) as exc_info:
+        libcurl.perform(settings, "get", "events/", None, ["--retry", "3"])
+
+    assert exc_info.value.returncode == 7
+    handle.perform.assert_called_once()
+
+
+def test_perform_retries_all_errors(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    handle.perform.side_effect = FakeCurlError(7, "Failed to connect")
+
+    with pytest.raises(libcurl.LibcurlError):
+        libcurl.perform(settings, "get", "events/", None, ["--retry", "8", "--retry-all-errors"])
+
+    assert handle.perform.call_count == 9
+
+
+def test_perform_stops_retrying_after_retry_max_time(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    handle.perform.side_effect = FakeCurlError(7, "Failed to connect")
+    clock = [0.0]
+    libcurl.time.sleep.side_effect = lambda delay: clock.append(clock[-1] + delay)
+
+    with patch("time.monotonic", side_effect=lambda: clock[-1]), pytest.raises(libcurl.LibcurlError):
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+
+    # 1 + 2 + 4 + 8 + 16 + 32 s of delays fit into 120 s, the next 64 s one does not
+    assert handle.perform.call_count == 7
+
+
+def test_perform_honors_retry_after(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(
+        handle, 429, headers=(b"HTTP/1.1 429 Too Many Requests\r\n", b"Retry-After: 17\r\n", b"\r\n")
+    )
+
+    _, _, code = libcurl.perform(settings, "get", "events/", None, ["--retry", "1"])
+
+    assert code == 429
+    libcurl.time.sleep.assert_called_once_with(17)
+
+
+def test_perform_holds_engine_for_tls_handshake(mock_pycurl, settings):
+    make_response(
+        mock_pycurl.Curl.return_value, 200, debug_text=b"TLSv1.3 (OUT), TLS handshake, Client hello (1):\n"
+    )
+
+    measurements = libcurl.Measurements()
+
+    libcurl.perform(settings, "get", "events/", None, RETRY_OPTS, measurements=measurements)
+
+    assert measurements.counters["engine_uses"] == 1
+    assert libcurl.arbiter.acquire() < 1  # released after the transfer
+    libcurl.arbiter.release()
+
+
+def test_perform_does_not_hold_engine_on_reused_connection(mock_pycurl, settings):
+    make_response(mock_pycurl.Curl.return_value, 200, num_connects=0)
+    measurements = libcurl.Measurements()
+
+    libcurl.perform(settings, "get", "events/", None, RETRY_OPTS, measurements=measurements)
+
+    assert "engine_uses" not in measurements.counters
+
+
+def test_perform_verbose_only_for_new_connections(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200, active_socket=5)
+
+    with patch("wb.cloud_agent.handlers.libcurl.tcp_bytes", return_value=None):
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+        handle.setopt.assert_any_call(mock_pycurl.VERBOSE, 1)
+
+        # The connection is kept alive, the next request goes over it
+        handle.setopt.reset_mock()
+        make_response(handle, 200, active_socket=5, num_connects=0)
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+
+    assert (mock_pycurl.VERBOSE, 1) not in [call.args for call in handle.setopt.call_args_list]
+
+
+def test_perform_holds_engine_if_kept_connection_is_closed(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200, active_socket=5)
+
+    measurements = libcurl.Measurements()
+
+    with patch("wb.cloud_agent.handlers.libcurl.tcp_bytes", return_value=None):
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS)
+        handle.setopt.reset_mock()
+        # The server has closed the connection after the check, a new one is made
+        libcurl.perform(settings, "get", "events/", None, RETRY_OPTS, measurements=measurements)
+
+    assert measurements.counters["engine_uses"] == 1
+    assert measurements.counters["tls_full"] == 1
+
+
+def test_perform_measures_traffic(mock_pycurl, settings):
+    handle = mock_pycurl.Curl.return_value
+    make_response(handle, 200, body=b"{}", active_socket=5)
+
+    with (
+        patch("wb.cloud_agent.handlers.libcurl.tcp_bytes", return_value=(1100, 4000)),
+        patch("wb.cloud_agent.handlers.libcurl.record_traffic") as mock_record,
+    ):
+        libcurl.perform(settings, "get", "events/?limit=10", None, RETRY_OPTS)
+
+    # HTTP: 100 bytes of request, 19 of response headers and 2 of body, the rest of TCP payload is TLS
+    mock_record.assert_called_once_with(
+        settings, "events/?limit=10", Traffic(sent=100, received=21, tls=4979, requests=1)
+    )
+
+
+def test_perform_adds_traffic_to_given_counter(mock_pycurl, settings):
+    make_response(mock_pycurl.Curl.return_value, 503)
+    traffic = Traffic()
+
+    with patch("wb.cloud_agent.handlers.libcurl.record_traffic") as mock_record:
+        libcurl.perform(
+            settings, "get", "events/", None, ["--retry", "1", "--retry-delay", "0"], traffic=traffic
+        )
+
+    mock_record.assert_not_called()
+    assert traffic.requests == 2
@@ -1,9 +1,13 @@
+import json
+import logging
+import subprocess
+import sys
 from argparse import ArgumentTypeError
 from unittest.mock import patch
 
 import pytest
 
-from wb.cloud_agent.main import main, validate_url
+from wb.cloud_agent.main import STARTUP_BUDGETS_S, _lazy_command, main, validate_url
 
 
 def test_validate_url_valid_https():
@@ -79,3 +83,50 @@ def test_main_with_cloud_unbind(monkeypatch):
 
         assert result == 0
         mock_unbind.assert_called_once()
+
+
+LOAD_COMMAND_SCRIPT = """
+import json, subprocess, sys, time
+from importlib import import_module
+
+def no_subprocess(*args, **kwargs):
+    raise AssertionError(f"subprocess at import: {args}")
+
+subprocess.Popen = no_subprocess
+started = time.perf_counter()
+import_module(sys.argv[1])
+elapsed = time.perf_counter() - started
+heavy = [m for m in ("requests", "wb_common.mqtt_client", "tabulate") if m in sys.modules]
+print(json.dumps({"elapsed": elapsed, "heavy": heavy}))
+"""
+
+
+@pytest.mark.parametrize(
+    "command, module, heavy",
+    [
+        ("show_providers", "wb.cloud_agent.status", []),
+        ("run_daemon", "wb.cloud_agent.commands", ["wb_common.mqtt_client"]),
+    ],
+)
+def test_command_startup_budget(command, module, heavy):
+    """Модули команды загружаются без подпроцессов и укладываются в бюджет времени."""
+    result = subprocess.run(
+        [sys.executable, "-c", LOAD_COMMAND_SCRIPT, module], capture_output=True, check=True, timeout=60
+    )
+    measured = json.loads(result.stdout)
+
+    assert measured["heavy"] == heavy
+    assert measured["elapsed"] < STARTUP_BUDGETS_S[command]
+
+
+def test_command_over_startup_budget_is_warned_about(caplog):
+    command = _lazy_command("wb.cloud_agent.status", "show_providers")
+
+    with (
+        patch("wb.cloud_agent.status.show_providers", return_value=0),
+        patch("time.perf_counter", side_effect=[0.0, STARTUP_BUDGETS_S["show_providers"] + 1]),
+        caplog.at_level(logging.WARNING),
+    ):
+        assert command(None) == 0
+
+    assert "show_providers loaded in 1.300 s, over its budget of 0.3 s" in caplog.text
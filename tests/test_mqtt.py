@@ -5,6 +5,7 @@ from unittest.mock import MagicMock, call, patch
 import pytest
 
 from wb.cloud_agent.mqtt import MQTTCloudAgent
+from wb.cloud_agent.traffic import Traffic, TrafficMeter
 
 
 @pytest.fixture
@@ -221,3 +222,21 @@ def test_update_providers_list(mqtt_cloud_agent):
     mqtt_cloud_agent.client.publish.assert_called_once_with(
         "/wb-cloud-agent/providers", "provider1,provider2", retain=True, qos=2
     )
+
+
+def test_publish_traffic(mqtt_cloud_agent, settings, tmp_path):
+    meter = TrafficMeter(tmp_path / "traffic.json")
+    meter.add("events/", Traffic(sent=100, received=200, tls=700, requests=1))
+
+    mqtt_cloud_agent.publish_traffic(meter, data_saver=True)
+
+    publish = mqtt_cloud_agent.client.publish
+    publish.assert_any_call(f"{settings.mqtt_prefix}/controls/traffic_today", "1000", retain=True, qos=2)
+    publish.assert_any_call(f"{settings.mqtt_prefix}/controls/traffic_month", "1000", retain=True, qos=2)
+    publish.assert_any_call(f"{settings.mqtt_prefix}/controls/data_saver", "1", retain=True, qos=2)
+    publish.assert_any_call(
+        "/wb-cloud-agent/default/traffic",
+        '{"events/": {"received": 200, "requests": 1, "sent": 100, "tls": 700}}',
+        retain=True,
+        qos=2,
+    )
@@ -0,0 +1,82 @@
+# pylint: disable=protected-access,redefined-outer-name
+
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent import netlink
+from wb.cloud_agent.netlink import LinkWatcher
+
+IPV6_ROUTES = (
+    "00000000000000000000000000000000 00 00000000000000000000000000000000 00 "
+    "fe800000000000000000000000000001 00000400 00000001 00000000 00000003 wwan0\n"
+    "00000000000000000000000000000000 00 00000000000000000000000000000000 00 "
+    "00000000000000000000000000000000 ffffffff 00000001 00000000 00200200 lo\n"
+    "20010db8000000000000000000000000 40 00000000000000000000000000000000 00 "
+    "00000000000000000000000000000000 00000100 00000001 00000000 00000001 eth0\n"
+)
+
+
+@pytest.fixture
+def routes():
+    with patch("wb.cloud_agent.netlink.default_routes", return_value=frozenset()) as mock:
+        yield mock
+
+
+@pytest.fixture
+def watcher(routes):
+    watcher = LinkWatcher()
+    watcher._running = True
+    watcher._routes = routes.return_value
+    return watcher
+
+
+def test_default_routes(tmp_path):
+    routes_file = tmp_path / "ipv6_route"
+    routes_file.write_text(IPV6_ROUTES)
+
+    with (
+        patch.object(netlink, "IPV6_ROUTES_FILE", str(routes_file)),
+        patch("wb.cloud_agent.netlink.default_route_interfaces", return_value=["eth0"]),
+    ):
+        assert netlink.default_routes() == {"eth0", "wwan0"}
+
+
+def test_sleep_without_watcher():
+    with patch("time.sleep") as mock_sleep:
+        assert not LinkWatcher().sleep(5, offline_delay=300)
+
+    mock_sleep.assert_called_once_with(5)
+
+
+def test_sleep_wakes_up_when_route_appears(watcher, routes):
+    def link_up():
+        routes.return_value = frozenset({"eth0"})
+        watcher.update()
+
+    timer = threading.Timer(0.1, link_up)
+    timer.start()
+    try:
+        # Without a default route the sleep lasts until one appears
+        assert watcher.sleep(0.01, offline_delay=30)
+    finally:
+        timer.cancel()
+
+
+def test_sleep_online_keeps_delay(watcher, routes):
+    routes.return_value = frozenset({"eth0"})
+    watcher.update()
+
+    assert not watcher.sleep(0.01, offline_delay=30)
+
+
+def test_route_loss_does_not_wake_up(watcher, routes):
+    routes.return_value = frozenset({"eth0"})
+    watcher.update()
+    generation = watcher._generation
+
+    routes.return_value = frozenset()
+    watcher.update()
+
+    assert watcher._generation == generation
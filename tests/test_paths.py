@@ -0,0 +1,170 @@
+# pylint: disable=redefined-outer-name
+
+import socket
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from wb.cloud_agent import paths
+from wb.cloud_agent.bandwidth import BULK, INTERACTIVE, REPORT
+from wb.cloud_agent.paths import PathSelector
+
+AGENT_URL = "https://agent.example.com/api-agent/v1/"
+
+
+@pytest.fixture
+def mock_probe():
+    with patch("wb.cloud_agent.paths.probe_interface") as mock:
+        yield mock
+
+
+@pytest.fixture
+def route_interfaces():
+    with patch("wb.cloud_agent.paths.default_route_interfaces", return_value=["wwan0", "eth0"]) as mock:
+        yield mock
+
+
+def make_selector(config):
+    return PathSelector(config, AGENT_URL, lambda host: ["192.0.2.1"])
+
+
+@pytest.mark.usefixtures("route_interfaces")
+def test_disabled_by_default():
+    selector = make_selector({})
+
+    assert not selector.enabled
+    assert selector.select(INTERACTIVE) is None
+    assert selector.select(BULK) is None
+
+
+def test_configured_interfaces_by_class():
+    selector = make_selector({"interactive": ["eth0", "wwan0"], "bulk": ["wlan0"]})
+
+    assert selector.select(INTERACTIVE) == "eth0"
+    assert selector.select(REPORT) == "eth0"
+    assert selector.select(BULK) == "wlan0"
+    assert selector.candidates() == ["eth0", "wwan0", "wlan0"]
+
+
+def test_configured_class_not_listed_follows_default_route():
+    assert make_selector({"bulk": ["eth0"]}).select(INTERACTIVE) is None
+
+
+def test_fallback_until_probe_succeeds(mock_probe):
+    selector = make_selector({"interactive": ["eth0", "wwan0"]})
+
+    selector.record_failure("eth0")
+    assert selector.select(INTERACTIVE) == "wwan0"
+
+    mock_probe.return_value = 0.05
+    selector.probe()
+    assert selector.select(INTERACTIVE) == "eth0"
+    mock_probe.assert_any_call("eth0", ["192.0.2.1"], 443, 5)
+
+
+def test_all_interfaces_down_follow_default_route(mock_probe):
+    mock_probe.side_effect = OSError("Network is unreachable")
+    selector = make_selector({"interactive": ["eth0", "wwan0"]})
+
+    selector.probe()
+
+    assert selector.select(INTERACTIVE) is None
+
+
+@pytest.mark.usefixtures("route_interfaces")
+def test_auto_bulk_takes_unmetered_interface(mock_probe):
+    mock_probe.return_value = 0.05
+    selector = make_selector("auto")
+    selector.probe()
+
+    # wwan0 has the default route, but it is metered
+    assert selector.select(BULK) == "eth0"
+    assert selector.is_unmetered("eth0")
+    assert selector.select(INTERACTIVE) == "wwan0"
+
+
+@pytest.mark.usefixtures("route_interfaces")
+def test_auto_interactive_takes_most_reliable_interface(mock_probe):
+    mock_probe.side_effect = lambda interface, *args: 0.05 if interface == "eth0" else 0.2
+    selector = make_selector("auto")
+    selector.probe()
+    selector.record_failure("wwan0")
+    mock_probe.side_effect = None
+    mock_probe.return_value = 0.05
+    selector.probe()
+
+    assert selector.select(INTERACTIVE) == "eth0"
+
+
+def test_auto_bulk_without_unmetered_interface(route_interfaces, mock_probe):
+    route_interfaces.return_value = ["wwan0", "wwan1"]
+    mock_probe.return_value = 0.05
+    selector = make_selector("auto")
+    selector.probe()
+
+    assert selector.select(BULK) is None
+
+
+def test_auto_single_interface_follows_default_route(route_interfaces):
+    route_interfaces.return_value = ["eth0"]
+
+    assert make_selector("auto").select(INTERACTIVE) is None
+
+
+def test_probe_without_addresses_keeps_states(mock_probe):
+    selector = PathSelector({"interactive": ["eth0"]}, AGENT_URL, MagicMock(side_effect=OSError("no DNS")))
+
+    selector.probe()
+
+    mock_probe.assert_not_called()
+    assert selector.select(INTERACTIVE) == "eth0"
+
+
+def test_probe_interface_binds_socket():
+    mock_socket = MagicMock()
+    mock_socket.__enter__.return_value = mock_socket
+    mock_socket.connect.side_effect = [OSError("Connection refused"), None]
+
+    with patch("socket.socket", return_value=mock_socket):
+        paths.probe_interface("eth0", ["2001:db8::1", "192.0.2.1"], 443, 5)
+
+    mock_socket.setsockopt.assert_called_with(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, b"eth0")
+    mock_socket.connect.assert_called_with(("192.0.2.1", 443))
+
+
+def test_probe_interface_no_addresses():
+    with pytest.raises(OSError):
+        paths.probe_interface("eth0", [], 443, 5)
+
+
+def test_get_paths_follows_config(settings):
+    settings.interfaces = {"bulk": ["eth0"]}
+    selector = paths.get_paths(settings)
+    assert paths.get_paths(settings) is selector
+
+    settings.interfaces = "auto"
+    assert paths.get_paths(settings) is not selector
+    assert paths.get_paths(settings).config == "auto"
+
+
+def test_unmetered_bulk_path(settings):
+    assert not paths.unmetered_bulk_path(settings)
+
+    settings.interfaces = {"bulk": ["eth0"]}
+    assert paths.unmetered_bulk_path(settings)
+
+
+def test_nmcli_is_not_asked_under_lock(mock_probe):
+    selector = make_selector({"interactive": ["eth0", "wwan0"]})
+    lock_held = []
+
+    def is_metered_interface(_interface):
+        lock_held.append(selector._lock.locked())  # pylint: disable=protected-access
+        return False
+
+    mock_probe.return_value = 0.05
+    with patch("wb.cloud_agent.paths.is_metered_interface", side_effect=is_metered_interface):
+        assert selector.select(INTERACTIVE) == "eth0"
+        selector.probe()
+
+    assert lock_held and not any(lock_held)
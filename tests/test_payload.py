@@ -0,0 +1,81 @@
+# pylint: disable=redefined-outer-name
+
+import gzip
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from wb.cloud_agent import payload
+from wb.cloud_agent.constants import REQUEST_COMPRESSION_MIN_BYTES
+
+
+@pytest.fixture(autouse=True)
+def mock_counters():
+    with patch("wb.cloud_agent.payload.get_counters") as mock:
+        yield mock.return_value
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [("gzip", "gzip"), ("zstd, gzip;q=0.5", "gzip"), ("identity", None), ("", None)],
+)
+def test_update_request_encoding(settings, accept_encoding, encoding):
+    payload.update_request_encoding(settings, accept_encoding)
+
+    assert settings.request_encoding == encoding
+
+
+def test_encode_json_body_not_negotiated(settings, mock_counters):
+    params = {"log": "x" * REQUEST_COMPRESSION_MIN_BYTES}
+
+    data, encoding = payload.encode_json_body(settings, params)
+
+    assert encoding is None
+    assert json.loads(data) == params
+    mock_counters.add.assert_any_call("body_bytes_sent_wire", len(data))
+
+
+def test_encode_json_body_gzip(settings, mock_counters):
+    settings.request_encoding = "gzip"
+    params = {"log": "x" * REQUEST_COMPRESSION_MIN_BYTES}
+
+    data, encoding = payload.encode_json_body(settings, params)
+
+    assert encoding == "gzip"
+    assert json.loads(gzip.decompress(data)) == params
+    mock_counters.add.assert_any_call("body_bytes_sent", len(json.dumps(params)))
+    mock_counters.add.assert_any_call("body_bytes_sent_wire", len(data))
+
+
+def test_encode_json_body_small_is_not_compressed(settings):
+    settings.request_encoding = "gzip"
+
+    data, encoding = payload.encode_json_body(settings, {"ids": [1]})
+
+    assert encoding is None
+    assert data == b'{"ids": [1]}'
+
+
+def test_decode_body_json():
+    assert payload.decode_body(b'{"id": 1}', "application/json") == {"id": 1}
+    assert payload.decode_body(b'{"id": 1}', None) == {"id": 1}
+    assert payload.decode_body(b"", None) == {}
+    assert payload.decode_body(b"not json", "application/json") == {}
+
+
+def test_decode_body_msgpack():
+    mock_msgpack = MagicMock()
+    mock_msgpack.unpackb.return_value = {"id": 1}
+
+    with patch.object(payload, "msgpack", mock_msgpack):
+        assert payload.decode_body(b"\x81\xa2id\x01", "application/msgpack; charset=binary") == {"id": 1}
+        assert payload.accept_header() == "Accept: application/msgpack, application/json;q=0.9"
+
+    mock_msgpack.unpackb.assert_called_once_with(b"\x81\xa2id\x01")
+
+
+def test_no_msgpack_without_module():
+    with patch.object(payload, "msgpack", None):
+        assert payload.accept_header() is None
+        assert payload.decode_body(b"\x81\xa2id\x01", "application/msgpack") == {}
@@ -1,58 +1,178 @@
-from unittest.mock import MagicMock, patch
+# pylint: disable=redefined-outer-name
 
-import requests
+import os
+import socket
+import threading
+from unittest.mock import patch
 
-from wb.cloud_agent.handlers.ping import wait_for_cloud_reachable
+import pytest
 
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.handlers.ping import (
+    DNS,
+    HTTP,
+    TCP,
+    TLS,
+    ProbeResult,
+    probe_cloud,
+    wait_for_cloud_reachable,
+)
 
-def test_wait_for_cloud_success_first_try():
-    """HEAD возвращает 200 с первой попытки — сразу выходим."""
-    with patch("requests.head") as mock_head:
-        mock_head.return_value.status_code = 200
+OK = ProbeResult()
+
+
+def failed(stage: str) -> ProbeResult:
+    return ProbeResult(failed_stage=stage, error="error")
+
+
+@pytest.fixture
+def http_server():
+    """Локальный сервер, отвечающий на каждое соединение заданной строкой."""
+    server = socket.create_server(("127.0.0.1", 0))
+    answer = {"data": b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"}
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(4096)
+                conn.sendall(answer["data"])
 
+    threading.Thread(target=serve, daemon=True).start()
+    yield server.getsockname()[1], answer
+    server.close()
+
+
+def test_wait_for_cloud_success_first_try():
+    """Проба успешна с первой попытки — сразу выходим."""
+    with patch("wb.cloud_agent.handlers.ping.probe_cloud", return_value=OK) as mock_probe:
         wait_for_cloud_reachable("https://example.com", interval=5)
 
-        mock_head.assert_called_once_with("https://example.com", timeout=15, allow_redirects=True)
+        mock_probe.assert_called_once_with("https://example.com")
 
 
 def test_wait_for_cloud_success_after_retries():
-    """HEAD два раза возвращает ошибку, на третьей попытке — OK."""
-    with patch("requests.head") as mock_head, patch("time.sleep") as mock_sleep:
-        mock_head.side_effect = [
-            MagicMock(status_code=500),  # fail
-            MagicMock(status_code=404),  # fail
-            MagicMock(status_code=200),  # success
-        ]
+    """Проба два раза неуспешна, на третьей попытке — OK."""
+    with (
+        patch("wb.cloud_agent.handlers.ping.probe_cloud") as mock_probe,
+        patch("time.sleep") as mock_sleep,
+    ):
+        mock_probe.side_effect = [failed(HTTP), failed(TCP), OK]
 
         wait_for_cloud_reachable("https://cloud", interval=2)
 
-        assert mock_head.call_count == 3
+        assert mock_probe.call_count == 3
         assert mock_sleep.call_count == 2
         mock_sleep.assert_called_with(2)
 
 
-def test_wait_for_cloud_exception_then_success():
-    """HEAD первый раз бросает исключение, затем успешный ответ."""
-    with patch("requests.head") as mock_head, patch("time.sleep") as mock_sleep:
-        mock_head.side_effect = [
-            requests.RequestException("DNS error"),  # exception
-            MagicMock(status_code=200),  # success
-        ]
+def test_wait_for_cloud_reports_failures():
+    """Классификация неудачных проб передаётся в on_failure."""
+    results = []
+    with (
+        patch("wb.cloud_agent.handlers.ping.probe_cloud", side_effect=[failed(DNS), failed(TLS), OK]),
+        patch("time.sleep"),
+    ):
+        wait_for_cloud_reachable("https://cloud", interval=3, on_failure=results.append)
 
-        wait_for_cloud_reachable("https://cloud", interval=3)
+    assert [result.failed_stage for result in results] == [DNS, TLS]
+    assert results[0].describe() == "DNS lookup has failed: error"
 
-        assert mock_head.call_count == 2
-        mock_sleep.assert_called_once_with(3)
 
+def test_wait_for_cloud_backs_off():
+    """После нескольких неудач интервал между пробами растёт экспоненциально."""
+    with (
+        patch("wb.cloud_agent.handlers.ping.probe_cloud", side_effect=[failed(TCP)] * 5 + [OK]),
+        patch("time.sleep") as mock_sleep,
+    ):
+        wait_for_cloud_reachable("http://localhost", interval=10)
 
-def test_wait_for_cloud_custom_period():
-    """Проверяем кастомный period."""
-    with patch("requests.head") as mock_head, patch("time.sleep") as mock_sleep:
-        mock_head.side_effect = [
-            MagicMock(status_code=503),  # fail
-            MagicMock(status_code=200),  # OK
-        ]
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [10, 10, 10, 20, 40]
 
-        wait_for_cloud_reachable("http://localhost", interval=10)
 
-        mock_sleep.assert_called_once_with(10)
+def test_wait_for_cloud_reachable_checked_by_another_agent():
+    """Хост недавно проверен другим агентом — не проверяем сами."""
+    device_connectivity.record_host("cloud", True, 5)
+
+    with patch("wb.cloud_agent.handlers.ping.probe_cloud") as mock_probe:
+        wait_for_cloud_reachable("https://cloud", interval=5)
+
+    mock_probe.assert_not_called()
+
+
+def test_wait_for_cloud_waits_for_another_agent():
+    """Другой агент проверяет хост — ждём его результата."""
+    with patch("os.getpid", return_value=os.getpid() + 1):
+        device_connectivity.record_host("cloud", False, 7)
+
+    with (
+        patch("wb.cloud_agent.handlers.ping.probe_cloud", return_value=OK) as mock_probe,
+        patch("time.sleep") as mock_sleep,
+    ):
+        mock_sleep.side_effect = lambda _: device_connectivity.record_host("cloud", True, 7)
+
+        wait_for_cloud_reachable("https://cloud", interval=5)
+
+    assert mock_sleep.call_args.args[0] == pytest.approx(7, abs=1)
+    mock_probe.assert_not_called()
+
+
+def test_probe_cloud_stages(http_server):
+    """Все стадии пройдены, время каждой измерено."""
+    port, _ = http_server
+
+    result = probe_cloud(f"http://127.0.0.1:{port}/")
+
+    assert result.ok, result.describe()
+    assert list(result.timings) == [DNS, TCP, HTTP]
+
+
+def test_probe_cloud_http_error(http_server):
+    port, answer = http_server
+    answer["data"] = b"HTTP/1.1 503 Service Unavailable\r\n\r\n"
+
+    result = probe_cloud(f"http://127.0.0.1:{port}/")
+
+    assert result.failed_stage == HTTP
+    assert "503" in result.error
+
+
+def test_probe_cloud_tls_error(http_server):
+    """Сервер без TLS — рукопожатие не удаётся."""
+    port, _ = http_server
+
+    result = probe_cloud(f"https://127.0.0.1:{port}/", timeout=5)
+
+    assert result.failed_stage == TLS
+    assert list(result.timings) == [DNS, TCP, TLS]
+
+
+def test_probe_cloud_connection_refused():
+    with socket.create_server(("127.0.0.1", 0)) as sock:
+        port = sock.getsockname()[1]
+
+    result = probe_cloud(f"http://127.0.0.1:{port}/")
+
+    assert result.failed_stage == TCP
+
+
+def test_probe_cloud_dns_error():
+    with patch("socket.getaddrinfo", side_effect=socket.gaierror("Name or service not known")):
+        result = probe_cloud("https://cloud.example.com")
+
+    assert result.failed_stage == DNS
+    assert result.describe() == "DNS lookup has failed: Name or service not known"
+
+
+def test_probe_cloud_dns_timeout():
+    released = threading.Event()
+
+    with patch("socket.getaddrinfo", side_effect=lambda *_, **__: released.wait(5) and []):
+        result = probe_cloud("https://cloud.example.com", timeout=0.1)
+    released.set()
+
+    assert result.failed_stage == DNS
+    assert result.describe() == "DNS lookup has failed: timed out after 0.1 s"
@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from wb.cloud_agent.handlers import push
+from wb.cloud_agent.handlers.push import PushChannelError, run_push_channel
+
+
+def test_run_push_channel_not_available(settings):
+    on_connected = MagicMock()
+
+    with (
+        patch("wb.cloud_agent.handlers.push.libcurl.is_websocket_available", return_value=False),
+        pytest.raises(PushChannelError),
+    ):
+        run_push_channel(settings, MagicMock(), on_connected, MagicMock())
+
+    on_connected.assert_not_called()
+
+
+def test_run_push_channel_handles_and_confirms_event(settings):
+    mock_mqtt = MagicMock()
+    on_connected = MagicMock()
+    on_alive = MagicMock()
+    messages = [
+        (
+            b'{"id": "event123", "code": "update_activation_link", '
+            b'"payload": {"activationLink": "http://example.com/activate"}}',
+            "text",
+        ),
+        (b"", "close"),
+    ]
+
+    with (
+        patch("wb.cloud_agent.handlers.push.libcurl.is_websocket_available", return_value=True),
+        patch("wb.cloud_agent.handlers.push.libcurl.open_websocket") as mock_open,
+        patch("wb.cloud_agent.handlers.push.libcurl.ws_recv_message", side_effect=messages),
+        patch("wb.cloud_agent.handlers.push.libcurl.ws_send") as mock_send,
+        patch("wb.cloud_agent.services.activation.write_to_file"),
+        pytest.raises(PushChannelError),
+    ):
+        run_push_channel(settings, mock_mqtt, on_connected, on_alive)
+
+    on_connected.assert_called_once()
+    on_alive.assert_called_once()
+    mock_mqtt.publish_ctrl.assert_called_once_with("activation_link", "http://example.com/activate")
+    mock_send.assert_called_once_with(mock_open.return_value, b'{"type": "confirm", "id": "event123"}')
+    mock_open.return_value.close.assert_called_once()
+
+
+def test_push_channel_pings_silent_server(settings):
+    handle = MagicMock()
+
+    with (
+        patch("wb.cloud_agent.handlers.push.libcurl.ws_recv_message", return_value=None),
+        patch("wb.cloud_agent.handlers.push.libcurl.ws_send") as mock_send,
+        pytest.raises(PushChannelError, match="ping"),
+    ):
+        push._receive_events(settings, MagicMock(), handle, MagicMock())  # pylint: disable=protected-access
+
+    mock_send.assert_called_once_with(handle, b"", kind="ping")
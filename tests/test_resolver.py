@@ -0,0 +1,116 @@
+# pylint: disable=redefined-outer-name
+
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent import resolver
+
+
+@pytest.fixture
+def host_cache(tmp_path):
+    return resolver.HostCache(tmp_path / "dns_cache.json")
+
+
+def test_resolve_caches_for_ttl(host_cache, no_dns_lookups):
+    no_dns_lookups.side_effect = None
+    no_dns_lookups.return_value = (["2001:db8::1", "192.0.2.1"], 120)
+
+    with patch("time.time", return_value=1000):
+        assert host_cache.resolve("agent.example.com") == (["2001:db8::1", "192.0.2.1"], False)
+    with patch("time.time", return_value=1100):
+        host_cache.resolve("agent.example.com")
+    assert no_dns_lookups.call_count == 1
+
+    with patch("time.time", return_value=1121):
+        host_cache.resolve("agent.example.com")
+    assert no_dns_lookups.call_count == 2
+
+
+def test_resolve_serves_stale_when_resolver_fails(host_cache, no_dns_lookups):
+    no_dns_lookups.side_effect = [(["192.0.2.1"], 60), OSError("timeout")]
+
+    with patch("time.time", return_value=1000):
+        host_cache.resolve("agent.example.com")
+    with patch("time.time", return_value=2000):
+        assert host_cache.resolve("agent.example.com") == (["192.0.2.1"], True)
+        # Next requests don't wait for the failed resolver
+        assert host_cache.resolve("agent.example.com") == (["192.0.2.1"], False)
+    assert no_dns_lookups.call_count == 2
+
+
+def test_resolve_fails_without_cached_entry(host_cache):
+    with pytest.raises(OSError):
+        host_cache.resolve("agent.example.com")
+
+
+def test_cache_survives_restart(tmp_path, no_dns_lookups):
+    no_dns_lookups.side_effect = None
+    no_dns_lookups.return_value = (["2001:db8::1", "192.0.2.1"], 60)
+    path = tmp_path / "dns_cache.json"
+
+    resolver.HostCache(path).resolve("agent.example.com")
+    resolver.HostCache(path).connected("agent.example.com", "192.0.2.1")
+
+    assert json.loads(path.read_text())["agent.example.com"]["family"] == 4
+    no_dns_lookups.side_effect = OSError("timeout")
+    assert resolver.HostCache(path).resolve("agent.example.com")[0] == ["192.0.2.1"]
+
+
+def test_preferred_family_is_reset_after_connect_failure(host_cache, no_dns_lookups):
+    no_dns_lookups.side_effect = None
+    no_dns_lookups.return_value = (["2001:db8::1", "192.0.2.1"], 60)
+    host_cache.resolve("agent.example.com")
+
+    host_cache.connected("agent.example.com", "192.0.2.1")
+    assert host_cache.resolve("agent.example.com")[0] == ["192.0.2.1"]
+
+    host_cache.connect_failed("agent.example.com")
+    assert host_cache.resolve("agent.example.com")[0] == ["2001:db8::1", "192.0.2.1"]
+
+
+def test_get_resolve_entry(settings, host_cache, no_dns_lookups):
+    no_dns_lookups.side_effect = None
+    no_dns_lookups.return_value = (["2001:db8::1", "192.0.2.1"], 60)
+
+    with patch("wb.cloud_agent.resolver.get_host_cache", return_value=host_cache):
+        entry = resolver.get_resolve_entry(settings, settings.cloud_agent_url)
+
+    assert entry == "agent.wirenboard.cloud:443:[2001:db8::1],192.0.2.1"
+
+
+@pytest.mark.parametrize(
+    "dns_cache, url",
+    [(False, "https://agent.wirenboard.cloud/api-agent/v1/"), (True, "https://192.0.2.1/api-agent/v1/")],
+)
+def test_get_resolve_entry_skipped(settings, no_dns_lookups, dns_cache, url):
+    settings.dns_cache = dns_cache
+
+    assert resolver.get_resolve_entry(settings, url) is None
+    no_dns_lookups.assert_not_called()
+
+
+@pytest.mark.parametrize("dns_cache", [True, False])
+def test_resolve_addresses(settings, host_cache, no_dns_lookups, dns_cache):
+    settings.dns_cache = dns_cache
+    no_dns_lookups.side_effect = None
+    no_dns_lookups.return_value = (["192.0.2.1"], 60)
+
+    with patch("wb.cloud_agent.resolver.get_host_cache", return_value=host_cache):
+        assert resolver.resolve_addresses(settings, "agent.wirenboard.cloud") == ["192.0.2.1"]
+        assert resolver.resolve_addresses(settings, "2001:db8::1") == ["2001:db8::1"]
+
+    no_dns_lookups.assert_called_once_with("agent.wirenboard.cloud")
+
+
+def test_system_lookup_times_out():
+    released = threading.Event()
+
+    with (
+        patch("socket.getaddrinfo", side_effect=lambda *_, **__: released.wait(5) and []),
+        pytest.raises(TimeoutError),
+    ):
+        resolver.getaddrinfo("agent.example.com", None, 0.1)
+    released.set()
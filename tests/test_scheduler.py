@@ -0,0 +1,118 @@
+# pylint: disable=redefined-outer-name
+
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent.constants import DATA_SAVER_POLL_SLOWDOWN, POLL_BACKOFF_MAX_S
+from wb.cloud_agent.scheduler import PollScheduler
+
+
+@pytest.fixture(autouse=True)
+def mock_uniform():
+    # No random phase unless a test sets it up
+    with patch("random.uniform", return_value=0) as _mock_uniform:
+        yield _mock_uniform
+
+
+@pytest.fixture
+def mock_monotonic():
+    with patch("time.monotonic", return_value=1000.0) as _mock_monotonic:
+        yield _mock_monotonic
+
+
+def test_next_delay_keeps_fixed_rate(settings, mock_monotonic):
+    scheduler = PollScheduler(settings)
+
+    mock_monotonic.return_value += 3  # request duration
+    scheduler.on_events(0)
+
+    assert scheduler.next_delay() == 7
+
+
+def test_next_delay_skips_missed_ticks(settings, mock_monotonic):
+    scheduler = PollScheduler(settings)
+
+    mock_monotonic.return_value += 25
+    scheduler.on_events(0)
+
+    assert scheduler.next_delay() == 0
+
+
+def test_next_delay_backoff_with_full_jitter(settings, mock_monotonic):
+    scheduler = PollScheduler(settings)
+
+    with patch("random.uniform", side_effect=lambda low, high: high) as mock_uniform:
+        delays = []
+        for _ in range(8):
+            scheduler.on_failure()
+            delays.append(scheduler.next_delay())
+            mock_monotonic.return_value += delays[-1]
+
+    assert mock_uniform.call_args.args[0] == 0
+    assert delays == [20, 40, 80, 160, 320, POLL_BACKOFF_MAX_S, POLL_BACKOFF_MAX_S, POLL_BACKOFF_MAX_S]
+
+    scheduler.on_events(0)
+    assert scheduler.next_delay() == 10
+
+
+@pytest.mark.usefixtures("mock_monotonic")
+def test_next_delay_in_data_saver_mode(settings):
+    settings.data_saver = True
+    scheduler = PollScheduler(settings)
+
+    assert scheduler.next_delay() == 10 * DATA_SAVER_POLL_SLOWDOWN
+
+
+@pytest.mark.usefixtures("mock_monotonic")
+def test_next_delay_after_events_and_pending_activation(settings):
+    scheduler = PollScheduler(settings)
+    assert scheduler.next_delay(activation_pending=True) == 30
+
+    scheduler = PollScheduler(settings)
+    settings.events_pending = 0
+    scheduler.on_events(1)
+    assert scheduler.next_delay(activation_pending=True) == 5
+
+
+@pytest.mark.usefixtures("mock_monotonic")
+def test_next_delay_long_poll(settings):
+    settings.long_poll_timeout = 60
+    scheduler = PollScheduler(settings)
+
+    scheduler.on_events(0)
+
+    assert scheduler.next_delay() == 0
+
+
+def test_next_delay_honors_retry_after(settings, mock_uniform):
+    scheduler = PollScheduler(settings)
+    mock_uniform.return_value = 4
+
+    scheduler.on_failure(retry_after=120)
+
+    assert scheduler.next_delay() == pytest.approx(124)
+    mock_uniform.assert_called_with(0, settings.request_period_seconds)
+
+
+@pytest.mark.usefixtures("mock_monotonic")
+def test_next_delay_random_phase_after_start(settings, mock_uniform):
+    mock_uniform.return_value = 6
+
+    scheduler = PollScheduler(settings)
+    scheduler.on_events(0)
+
+    assert scheduler.next_delay() == 4
+
+
+@pytest.mark.usefixtures("mock_monotonic")
+def test_next_delay_server_poll_phase(settings):
+    settings.poll_phase = 3
+    scheduler = PollScheduler(settings)
+    scheduler.on_events(0)
+
+    with patch("time.time", return_value=1_000_000_005):
+        assert scheduler.next_delay() == 8
+
+    with patch("time.time", return_value=1_000_000_002.5):
+        assert scheduler.next_delay() == 10.5
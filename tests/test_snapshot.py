@@ -0,0 +1,99 @@
+import json
+import time
+from unittest.mock import patch
+
+from wb.cloud_agent.constants import SNAPSHOT_FRESH_S, UNKNOWN_LINK
+from wb.cloud_agent.snapshot import SNAPSHOT_VERSION, AgentSnapshot
+
+START_UP = {"activated": False, "activationLink": "https://example.com/activate"}
+
+
+def test_warm_start_within_freshness_window(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    AgentSnapshot(path).save_start_up(START_UP)
+
+    assert AgentSnapshot(path).warm_start(settings) == START_UP
+
+
+def test_stale_snapshot(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    AgentSnapshot(path).save_start_up(START_UP)
+
+    with patch("time.time", return_value=time.time() + SNAPSHOT_FRESH_S + 1):
+        assert AgentSnapshot(path).warm_start(settings) is None
+    # The clock has been set back
+    with patch("time.time", return_value=time.time() - 60):
+        assert AgentSnapshot(path).warm_start(settings) is None
+
+
+def test_confirmed_by_polls(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    with patch("time.time", return_value=time.time() - SNAPSHOT_FRESH_S - 1):
+        AgentSnapshot(path).save_start_up(START_UP)
+
+    snapshot = AgentSnapshot(path)
+    assert snapshot.warm_start(settings) is None
+    snapshot.confirm()
+    assert AgentSnapshot(path).warm_start(settings) == START_UP
+
+
+def test_other_version_is_ignored(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    path.write_text(
+        json.dumps({"version": SNAPSHOT_VERSION + 1, "start_up": START_UP, "confirmed_at": time.time()}),
+        encoding="utf-8",
+    )
+
+    assert AgentSnapshot(path).warm_start(settings) is None
+
+
+def test_tuned_settings_are_restored(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    settings.request_period_seconds = 60
+    settings.metrics_log_enabled = False
+    AgentSnapshot(path).save_tuned(settings)
+
+    settings.request_period_seconds = 10
+    settings.metrics_log_enabled = True
+    AgentSnapshot(path).warm_start(settings)
+
+    assert settings.request_period_seconds == 60
+    assert settings.metrics_log_enabled is False
+
+
+def test_invalid_tuned_settings_are_ignored(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    path.write_text(
+        json.dumps({"version": SNAPSHOT_VERSION, "tuned": {"request_period_seconds": True}}), encoding="utf-8"
+    )
+
+    AgentSnapshot(path).warm_start(settings)
+
+    assert settings.request_period_seconds == 10
+
+
+def test_versions_digest(tmp_path):
+    path = tmp_path / "snapshot.json"
+    AgentSnapshot(path).save_versions_digest("abc")
+
+    assert AgentSnapshot(path).versions_digest() == "abc"
+    assert AgentSnapshot(tmp_path / "missing.json").versions_digest() is None
+
+
+def test_activation_link_updates_start_up(settings, tmp_path):
+    path = tmp_path / "snapshot.json"
+    snapshot = AgentSnapshot(path)
+    snapshot.save_start_up({**START_UP, "agentEndpoints": ["https://agent.example.com"]})
+
+    snapshot.save_activation_link(UNKNOWN_LINK)
+
+    assert AgentSnapshot(path).warm_start(settings) == {
+        "activated": True,
+        "activationLink": "",
+        "agentEndpoints": ["https://agent.example.com"],
+    }
+    snapshot.save_activation_link("https://example.com/new")
+    assert AgentSnapshot(path).warm_start(settings)["activationLink"] == "https://example.com/new"
+    # Nothing to update without a start-up response
+    AgentSnapshot(tmp_path / "empty.json").save_activation_link(UNKNOWN_LINK)
+    assert not (tmp_path / "empty.json").exists()
@@ -10,6 +10,7 @@ from wb.cloud_agent.handlers.startup import (
     on_message,
     send_packages_version,
 )
+from wb.cloud_agent.snapshot import get_snapshot
 
 
 def test_make_start_up_request_activated(settings):
@@ -29,6 +30,33 @@ def test_make_start_up_request_activated(settings):
         mock_write.assert_called_once_with(settings, UNKNOWN_LINK, mock_mqtt)
 
 
+def test_make_start_up_request_saves_snapshot(settings, tmp_path):
+    settings.snapshot_file = tmp_path / "snapshot.json"
+    status_data = {"activated": False, "activationLink": "http://example.com/activate"}
+
+    with (
+        patch("wb.cloud_agent.handlers.startup.write_activation_link"),
+        patch("wb.cloud_agent.handlers.startup.do_curl", return_value=(status_data, status.OK)),
+    ):
+        make_start_up_request(settings, MagicMock())
+
+    assert get_snapshot(settings).warm_start(settings) == status_data
+
+
+def test_make_start_up_request_agent_endpoints(settings):
+    endpoints = ["https://agent-a.example.com/api-agent/v1/"]
+    status_data = {"activated": True, "activationLink": "", "agentEndpoints": endpoints}
+
+    with (
+        patch("wb.cloud_agent.handlers.startup.write_activation_link"),
+        patch("wb.cloud_agent.handlers.startup.do_curl", return_value=(status_data, status.OK)),
+        patch("wb.cloud_agent.handlers.startup.get_endpoints") as mock_endpoints,
+    ):
+        make_start_up_request(settings, MagicMock())
+
+    mock_endpoints.return_value.update.assert_called_once_with(endpoints)
+
+
 def test_make_start_up_request_not_activated_with_link(settings):
     mock_mqtt = MagicMock()
     status_data = {
@@ -126,18 +154,48 @@ def test_send_packages_version_success(settings):
         assert args[1]["params"]["crypto_engine_key"] == settings.client_cert_engine_key
 
 
+def test_send_packages_version_only_when_changed(settings, tmp_path):
+    settings.snapshot_file = tmp_path / "snapshot.json"
+    versions = {"agent_version": "1.7.0", "wb_mqtt_db_version": "2.13.0"}
+
+    with (
+        patch("wb.cloud_agent.handlers.startup.do_curl", return_value=({}, status.OK)) as mock_curl,
+        patch("wb.cloud_agent.handlers.startup.collect_package_versions", return_value=versions),
+    ):
+        send_packages_version(settings)
+        send_packages_version(settings)
+        assert mock_curl.call_count == 1
+
+        versions["wb_mqtt_db_version"] = "2.14.0"
+        send_packages_version(settings)
+        assert mock_curl.call_count == 2
+
+
+def test_send_packages_version_failure_is_sent_again(settings, tmp_path):
+    settings.snapshot_file = tmp_path / "snapshot.json"
+
+    with (
+        patch("wb.cloud_agent.handlers.startup.do_curl", return_value=({}, status.BAD_REQUEST)) as mock_curl,
+        patch("wb.cloud_agent.handlers.startup.collect_package_versions", return_value={"a": "1"}),
+    ):
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                send_packages_version(settings)
+
+    assert mock_curl.call_count == 2
+
+
 def test_collect_package_versions():
     with (
-        patch("wb.cloud_agent.handlers.startup.get_apt_package_version", return_value="1.2.3"),
+        patch("wb.cloud_agent.handlers.startup.get_package_version", return_value="1.2.3"),
         patch("wb.cloud_agent.handlers.startup.platform.python_version", return_value="3.9.2"),
         patch("wb.cloud_agent.handlers.startup.agent_package_version", "1.7.0"),
-        patch("wb.cloud_agent.handlers.startup.frpc_package_version", "0.51.3"),
     ):
         got = collect_package_versions(MagicMock(client_cert_engine_key="ATECCx08:00:02:C0:00"))
 
     assert got == {
         "agent_version": "1.7.0",
-        "frpc_version": "0.51.3",
+        "frpc_version": "1.2.3",
         "python_version": "3.9.2",
         "mqttrpc_version": "1.2.3",
         "paho_mqtt_version": "1.2.3",
@@ -150,7 +208,8 @@ def test_send_packages_version_failure(settings):
     with patch("wb.cloud_agent.handlers.startup.do_curl") as mock_curl:
         mock_curl.return_value = ({"error": "bad request"}, status.BAD_REQUEST)
 
-        send_packages_version(settings)
+        with pytest.raises(ValueError):
+            send_packages_version(settings)
 
 
 def test_on_message_success(settings):
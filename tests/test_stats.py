@@ -0,0 +1,49 @@
+import json
+import logging
+
+from wb.cloud_agent.stats import Counters, log_summary
+
+
+def test_counters_add_and_flush(tmp_path):
+    path = tmp_path / "stats.json"
+    counters = Counters(path, flush_interval=3600)
+
+    counters.add("tls_full")
+    counters.add("tls_reused", 2)
+
+    assert not path.exists()
+    counters.flush(force=True)
+    assert json.loads(path.read_text()) == {"tls_full": 1, "tls_reused": 2}
+
+
+def test_counters_loaded_after_restart(tmp_path):
+    path = tmp_path / "stats.json"
+    path.write_text(json.dumps({"tls_resumed": 5, "broken": "value"}))
+
+    counters = Counters(path)
+    counters.add("tls_resumed")
+
+    assert counters.snapshot() == {"tls_resumed": 6}
+
+
+def test_counters_invalid_file(tmp_path):
+    path = tmp_path / "stats.json"
+    path.write_text("not a json")
+
+    assert not Counters(path).snapshot()
+
+
+def test_counters_flush_without_provider_dir(tmp_path):
+    path = tmp_path / "deleted_provider" / "stats.json"
+    counters = Counters(path, flush_interval=0)
+
+    counters.add("tls_full")
+
+    assert not path.parent.exists()
+
+
+def test_log_summary_resumption_rate(caplog):
+    with caplog.at_level(logging.INFO):
+        log_summary({"tls_reused": 10, "tls_resumed": 3, "tls_full": 1})
+
+    assert "10 reused, 3 handshakes resumed, 1 full handshakes (resumption rate 75%)" in caplog.text
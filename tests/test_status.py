@@ -0,0 +1,36 @@
+from argparse import Namespace
+from unittest.mock import MagicMock, patch
+
+from wb.cloud_agent.status import show_providers
+
+
+def test_show_providers_empty():
+    options = Namespace()
+
+    with (
+        patch("wb.cloud_agent.status.get_provider_names", return_value=[]),
+        patch("wb.cloud_agent.status.load_providers_data", return_value=[]),
+        patch("wb.cloud_agent.status.show_providers_table") as mock_show,
+    ):
+        result = show_providers(options)
+
+        assert result == 0
+        mock_show.assert_called_once_with([])
+
+
+def test_show_providers_with_data():
+    options = Namespace()
+    providers = [MagicMock(name="provider1"), MagicMock(name="provider2")]
+
+    with (
+        patch(
+            "wb.cloud_agent.status.get_provider_names",
+            return_value=["provider1", "provider2"],
+        ),
+        patch("wb.cloud_agent.status.load_providers_data", return_value=providers),
+        patch("wb.cloud_agent.status.show_providers_table") as mock_show,
+    ):
+        result = show_providers(options)
+
+        assert result == 0
+        mock_show.assert_called_once_with(providers)
@@ -0,0 +1,74 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent.taskgraph import TaskGraph, process_uptime
+
+
+def test_tasks_run_after_dependencies():
+    order = []
+    graph = TaskGraph()
+    graph.add("network", lambda: order.append("network") or "response")
+    graph.add("local", lambda: order.append("local"))
+    graph.add("both", lambda: order.append("both"), after=["network", "local"])
+
+    assert graph.wait("network", "both") == ["response", None]
+    assert order[-1] == "both"
+    graph.shutdown()
+
+
+def test_local_task_does_not_wait_for_network():
+    network_done = threading.Event()
+    graph = TaskGraph()
+    graph.add("network", lambda: network_done.wait(5))
+    graph.add("local", lambda: "published")
+
+    # Completes while the network task still blocks
+    assert graph.wait("local") == ["published"]
+    assert not graph.future("network").done()
+    network_done.set()
+    graph.shutdown()
+
+
+def test_failure_propagates_to_dependents():
+    called = []
+
+    def fail():
+        raise ConnectionError("unreachable")
+
+    graph = TaskGraph()
+    graph.add("reachable", fail)
+    graph.add("start_up", lambda: called.append("start_up"), after=["reachable"])
+
+    with pytest.raises(ConnectionError):
+        graph.wait("start_up")
+    assert not called
+    graph.shutdown()
+
+
+def test_too_many_tasks():
+    graph = TaskGraph(max_tasks=1)
+    graph.add("first", lambda: None)
+
+    with pytest.raises(ValueError):
+        graph.add("second", lambda: None)
+    graph.shutdown()
+
+
+def test_process_uptime(tmp_path):
+    stat_file = tmp_path / "stat"
+    # starttime (field 22) is 1000 ticks after boot, the name has spaces and parentheses
+    stat_file.write_text("42 (wb cloud (agent)) S " + " ".join(["0"] * 18) + " 1000 0 0\n", encoding="utf-8")
+
+    with (
+        patch("wb.cloud_agent.taskgraph.PROC_STAT_FILE", str(stat_file)),
+        patch("os.sysconf", return_value=100),
+        patch("time.clock_gettime", return_value=25.5),
+    ):
+        assert process_uptime() == pytest.approx(15.5)
+
+
+def test_process_uptime_without_proc(tmp_path):
+    with patch("wb.cloud_agent.taskgraph.PROC_STAT_FILE", str(tmp_path / "missing")):
+        assert process_uptime() >= 0
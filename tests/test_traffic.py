@@ -0,0 +1,136 @@
+import datetime
+import json
+import socket
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from wb.cloud_agent import traffic
+from wb.cloud_agent.constants import TRAFFIC_HISTORY_DAYS
+from wb.cloud_agent.traffic import Traffic, TrafficMeter
+
+ROUTES = (
+    "Iface\tDestination\tGateway\tFlags\tRefCnt\tUse\tMetric\tMask\tMTU\tWindow\tIRTT\n"
+    "eth0\t00000000\t0102A8C0\t0003\t0\t0\t100\t00000000\t0\t0\t0\n"
+    "ppp0\t00000000\t00000000\t0001\t0\t0\t50\t00000000\t0\t0\t0\n"
+    "eth0\t0002A8C0\t00000000\t0001\t0\t0\t100\t00FFFFFF\t0\t0\t0\n"
+)
+
+
+def test_traffic_meter_counts_by_endpoint(tmp_path):
+    meter = TrafficMeter(tmp_path / "traffic.json", flush_interval=0)
+
+    meter.add("events/?limit=10&wait=60", Traffic(sent=100, received=200, tls=50, requests=1))
+    meter.add("events/?limit=10", Traffic(sent=100, received=300, requests=1))
+    meter.add("diagnostic-status/", Traffic(sent=10, received=20, requests=1))
+
+    assert meter.day() == {
+        "events/": Traffic(sent=200, received=500, tls=50, requests=2),
+        "diagnostic-status/": Traffic(sent=10, received=20, requests=1),
+    }
+    assert meter.month_total() == 780
+    assert TrafficMeter(tmp_path / "traffic.json").day() == meter.day()
+
+
+def test_traffic_meter_drops_old_days(tmp_path):
+    path = tmp_path / "traffic.json"
+    today = datetime.date.today()
+    old_day = (today - datetime.timedelta(days=TRAFFIC_HISTORY_DAYS + 1)).isoformat()
+    path.write_text(json.dumps({old_day: {"events/": {"sent": 1, "received": 1, "tls": 0, "requests": 1}}}))
+
+    meter = TrafficMeter(path)
+    meter.add("events/", Traffic(sent=1, requests=1))
+
+    assert list(json.loads(path.read_text())) == [today.isoformat()]
+
+
+def test_traffic_meter_invalid_file(tmp_path):
+    path = tmp_path / "traffic.json"
+    path.write_text('{"2026-01-01": {"events/": {"unknown": 1}}}')
+
+    assert TrafficMeter(path).day() == {}
+
+
+def test_tcp_bytes():
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        with socket.create_connection(server.getsockname()) as client:
+            conn, _ = server.accept()
+            with conn:
+                client.sendall(b"x" * 1000)
+                assert len(conn.recv(4096)) == 1000
+
+                reading = traffic.tcp_bytes(conn.fileno())
+
+    if reading is None:
+        pytest.skip("TCP_INFO byte counters are not supported")
+    assert reading == (0, 1000)
+
+
+def test_tcp_bytes_not_a_socket():
+    assert traffic.tcp_bytes(-1) is None
+
+
+def test_default_route_interface(tmp_path):
+    routes_file = tmp_path / "route"
+    routes_file.write_text(ROUTES)
+
+    with patch.object(traffic, "ROUTES_FILE", str(routes_file)):
+        assert traffic.default_route_interface() == "ppp0"
+        assert traffic.default_route_interfaces() == ["ppp0", "eth0"]
+
+
+@pytest.mark.parametrize(
+    "interface, nmcli_output, metered",
+    [
+        ("eth0", b"yes\n", True),
+        ("wwan0", b"no (guessed)\n", False),
+        ("wwan0", b"unknown\n", True),
+        ("eth0", b"unknown\n", False),
+    ],
+)
+def test_is_metered_interface(mock_subprocess_run, interface, nmcli_output, metered):
+    mock_subprocess_run.return_value.stdout = nmcli_output
+
+    assert traffic.is_metered_interface(interface) is metered
+
+
+def test_is_metered_interface_without_network_manager(mock_subprocess_run):
+    mock_subprocess_run.side_effect = FileNotFoundError("nmcli")
+
+    assert traffic.is_metered_interface("ppp0") is True
+    assert traffic.is_metered_interface("eth0") is False
+
+
+def test_metered_link_monitor_caches_result():
+    monitor = traffic.MeteredLinkMonitor()
+
+    with (
+        patch("wb.cloud_agent.traffic.default_route_interface", return_value="ppp0"),
+        patch("wb.cloud_agent.traffic.is_metered_interface", return_value=True) as mock_metered,
+    ):
+        assert monitor.is_metered() is True
+        assert monitor.is_metered() is True
+
+    mock_metered.assert_called_once_with("ppp0")
+
+
+@pytest.mark.parametrize("data_saver, metered, active", [(True, False, True), (False, True, False)])
+def test_data_saver_config(settings, unmetered_link, data_saver, metered, active):
+    settings.data_saver = data_saver
+    unmetered_link.return_value = metered
+
+    assert traffic.data_saver_active(settings) is active
+
+
+def test_data_saver_auto(settings, unmetered_link):
+    assert traffic.data_saver_active(settings) is False
+
+    unmetered_link.return_value = True
+    assert traffic.data_saver_active(settings) is True
+
+
+def test_nmcli_timeout_falls_back_to_name(mock_subprocess_run):
+    mock_subprocess_run.side_effect = subprocess.TimeoutExpired("nmcli", 5)
+
+    assert traffic.is_metered_interface("ppp0") is True
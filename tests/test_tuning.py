@@ -0,0 +1,49 @@
+import json
+
+from wb.cloud_agent.constants import LONG_POLL_MAX_TIMEOUT_S
+from wb.cloud_agent.tuning import Tuning, parse_tuning
+
+
+def test_parse_tuning_clamps_and_validates():
+    tuning = parse_tuning(
+        {
+            "*": {"connect_timeout": 0, "retries": True, "unknown": 1},
+            "events/": {"deadline": "30", "long_poll_timeout": 100000, "compressed": False},
+            "metrics-collector-log/": 5,
+        }
+    )
+
+    assert tuning == {
+        "*": {"connect_timeout": 1},
+        "events/": {"long_poll_timeout": LONG_POLL_MAX_TIMEOUT_S, "compressed": False},
+    }
+
+
+def test_tuning_for_endpoint_longest_prefix_wins(tmp_path):
+    tuning = Tuning(tmp_path / "tuning.json")
+    tuning.update(json.dumps({"*": {"retries": 1, "deadline": 10}, "events/": {"retries": 2}}))
+
+    assert tuning.for_endpoint("events/?limit=10") == {"retries": 2, "deadline": 10}
+    assert tuning.for_endpoint("agent-start-up/") == {"retries": 1, "deadline": 10}
+
+
+def test_tuning_persisted(tmp_path):
+    path = tmp_path / "tuning.json"
+    header = json.dumps({"events/": {"retries": 2}})
+
+    assert Tuning(path).update(header)
+
+    tuning = Tuning(path)
+    assert tuning.for_endpoint("events/") == {"retries": 2}
+    assert not tuning.update(header)
+
+
+def test_tuning_invalid_header_keeps_values(tmp_path):
+    tuning = Tuning(tmp_path / "tuning.json")
+    tuning.update(json.dumps({"events/": {"retries": 2}}))
+
+    assert not tuning.update("{broken")
+    assert tuning.for_endpoint("events/") == {"retries": 2}
+
+    assert tuning.update("{}")
+    assert not tuning.for_endpoint("events/")
@@ -0,0 +1,142 @@
+# pylint: disable=redefined-outer-name
+
+import json
+import socket
+import threading
+from http.client import HTTPConnection
+from unittest.mock import ANY, patch
+
+import pytest
+
+from wb.cloud_agent import uplink
+from wb.cloud_agent.handlers.libcurl import LibcurlError, RawBody
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path):
+        super().__init__("uplink")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+@pytest.fixture
+def uplink_server(tmp_path, settings):
+    socket_path = str(tmp_path / "uplink.sock")
+    with (
+        patch("wb.cloud_agent.uplink.APP_DATA_DIR", str(tmp_path)),
+        patch(
+            "wb.cloud_agent.uplink.get_provider_settings",
+            side_effect=lambda name: settings if name == "default" else None,
+        ),
+        uplink.UplinkServer(socket_path) as server,
+    ):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server, UnixHTTPConnection(socket_path)
+        server.shutdown()
+        thread.join()
+
+
+def test_uplink_forwards_request(uplink_server, settings):
+    server, conn = uplink_server
+    cloud_headers = b"HTTP/1.1 200 OK\r\nx-poll-interval: 5\r\nTransfer-Encoding: chunked\r\n\r\n"
+
+    with patch(
+        "wb.cloud_agent.uplink.libcurl.perform", return_value=(cloud_headers, b'{"id": 1}', 200)
+    ) as mock_perform:
+        conn.request(
+            "POST",
+            "/default/events/confirm/",
+            body=json.dumps({"ids": [1]}),
+            headers={"Content-Type": "application/json", "x-uplink-options": "--max-time 30 --compressed"},
+        )
+        response = conn.getresponse()
+
+        assert response.status == 200
+        assert response.read() == b'{"id": 1}'
+        assert response.getheader("x-poll-interval") == "5"
+        assert response.getheader("Transfer-Encoding") is None
+
+    mock_perform.assert_called_once_with(
+        settings,
+        "post",
+        "events/confirm/",
+        RawBody(b'{"ids": [1]}', "application/json"),
+        ["--max-time", "30", "--compressed"],
+        agent_url=None,
+        traffic=ANY,
+        measurements=ANY,
+        resolve_entry=None,
+    )
+    assert server.counters.get("uplink_bytes_sent") == 12
+
+
+def test_uplink_reports_measurements(uplink_server):
+    _, conn = uplink_server
+
+    def perform(*_args, measurements, **_kwargs):
+        measurements.add("tls_full")
+        measurements.add("engine_wait_s", 0.25)
+        measurements.address = "192.0.2.1"
+        measurements.rtt = 0.05
+        return b"HTTP/1.1 204 No Content\r\n\r\n", b"", 204
+
+    with patch("wb.cloud_agent.uplink.libcurl.perform", side_effect=perform) as mock_perform:
+        conn.request(
+            "GET", "/default/events/", headers={"x-uplink-resolve": "agent.example.com:443:192.0.2.1"}
+        )
+        response = conn.getresponse()
+        response.read()
+
+    # The uplink connects to the address from the agent's DNS cache and writes no provider files
+    assert mock_perform.call_args.kwargs["resolve_entry"] == "agent.example.com:443:192.0.2.1"
+    assert (
+        response.getheader("x-uplink-measurements")
+        == "tls_full=1 engine_wait_s=0.25 address=192.0.2.1 rtt=0.05"
+    )
+
+
+def test_uplink_forwards_content_encoding(uplink_server):
+    _, conn = uplink_server
+    cloud_headers = b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\n\r\n"
+
+    with patch(
+        "wb.cloud_agent.uplink.libcurl.perform", return_value=(cloud_headers, b"{}", 200)
+    ) as mock_perform:
+        conn.request(
+            "POST",
+            "/default/events/",
+            body=b"\x1f\x8b",
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+        response = conn.getresponse()
+
+        # The body has been decoded by libcurl
+        assert response.getheader("Content-Encoding") is None
+        assert response.read() == b"{}"
+
+    assert mock_perform.call_args.args[3] == RawBody(b"\x1f\x8b", "application/json", "gzip")
+
+
+def test_uplink_unknown_provider(uplink_server):
+    _, conn = uplink_server
+
+    with patch("wb.cloud_agent.uplink.libcurl.perform") as mock_perform:
+        conn.request("GET", "/unknown/events/")
+        assert conn.getresponse().status == 404
+
+    mock_perform.assert_not_called()
+
+
+def test_uplink_reports_transfer_error(uplink_server):
+    _, conn = uplink_server
+
+    with patch("wb.cloud_agent.uplink.libcurl.perform", side_effect=LibcurlError(28, "Operation timed out")):
+        conn.request("GET", "/default/events/")
+        response = conn.getresponse()
+
+    assert response.status == 502
+    assert response.getheader("x-uplink-error") == "28"
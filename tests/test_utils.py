@@ -1,13 +1,15 @@
 import json
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
 from wb.cloud_agent.settings import AppSettings
 from wb.cloud_agent.utils import (
     get_controller_url,
+    get_ctrl_serial_number,
     normalize_base_url,
     parse_headers,
+    parse_retry_after,
     read_json_config,
     read_plaintext_config,
     show_providers_table,
@@ -28,6 +30,19 @@ def test_base_url_to_agent_url(settings: AppSettings):
     )
 
 
+def test_get_ctrl_serial_number_cached_in_run(tmp_path):
+    cache_file = tmp_path / "serial"
+    with (
+        patch("wb.cloud_agent.utils.CTRL_SERIAL_CACHE_FILE", str(cache_file)),
+        patch("subprocess.check_output", return_value=b"ART6DDNT\n") as mock_check_output,
+    ):
+        assert get_ctrl_serial_number.__wrapped__() == "ART6DDNT"
+        assert get_ctrl_serial_number.__wrapped__() == "ART6DDNT"
+
+    mock_check_output.assert_called_once_with(["wb-gen-serial", "-s"])
+    assert cache_file.read_text() == "ART6DDNT"
+
+
 def test_get_controller_url(mock_serial_number, settings: AppSettings):
     assert (
         get_controller_url(settings.cloud_base_url)
@@ -194,3 +209,18 @@ def test_show_providers_table_with_providers(mock_print):
     assert "provider2" in output
     assert "https://example.com" in output
     assert "https://example2.com" in output
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("120", 120),
+        (" 5 ", 5),
+        ("Wed, 21 Oct 2015 07:28:30 GMT", 30),
+        ("Wed, 21 Oct 2015 07:27:00 GMT", 0),
+        ("soon", None),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    with patch("time.time", return_value=1445412480):  # Wed, 21 Oct 2015 07:28:00 GMT
+        assert parse_retry_after(value) == expected
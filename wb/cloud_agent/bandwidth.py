@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from wb.cloud_agent.constants import (
+    OUTBOUND_BULK_BURST,
+    OUTBOUND_BULK_RATE,
+    OUTBOUND_MAX_QUEUE_WAIT_S,
+)
+from wb.cloud_agent.stats import get_counters
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+INTERACTIVE = "interactive"
+REPORT = "report"
+BULK = "bulk"
+# By priority, highest first
+REQUEST_CLASSES = (INTERACTIVE, REPORT, BULK)
+
+# By endpoint prefix, requests to other endpoints are interactive
+ENDPOINT_CLASSES = {
+    "upload-diagnostic/": BULK,
+    "metrics-collector-log/": REPORT,
+    "diagnostic-status/": REPORT,
+    "update_device_data/": REPORT,
+}
+
+
+def request_class(endpoint: str) -> str:
+    return next((cls for prefix, cls in ENDPOINT_CLASSES.items() if endpoint.startswith(prefix)), INTERACTIVE)
+
+
+class TokenBucket:
+    """
+    Bytes allowance of bulk transfers: refills at rate up to burst.
+
+    A transfer that fits into the tokens goes at full speed, a larger one
+    empties the bucket and is paced at the rate by the transport.
+    """
+
+    def __init__(self, rate: int, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def take(self, size: int) -> Optional[int]:
+        """Take tokens for a transfer, returns the rate to pace it at or None for full speed."""
+        self._refill()
+        if size <= self._tokens:
+            self._tokens -= size
+            return None
+        self._tokens = 0
+        return self.rate
+
+    def paced_transfer_done(self) -> None:
+        # Tokens refilled during a paced transfer have been spent on it
+        self._tokens = 0
+        self._updated_at = time.monotonic()
+
+
+class OutboundScheduler:  # pylint: disable=too-few-public-methods
+    """
+    Shares the uplink between requests of the agent by priority.
+
+    Interactive requests (events polls and confirmations) start at once. Reports wait
+    until no interactive request is running or waiting, bulk uploads wait for reports too,
+    but not longer than OUTBOUND_MAX_QUEUE_WAIT_S. Long-poll requests don't hold others
+    back: they mostly wait for events. Bulk transfers are paced by a token bucket
+    (see TokenBucket), so a running upload leaves room for polls and the tunnel.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._active = dict.fromkeys(REQUEST_CLASSES, 0)
+        self._waiting = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.bucket = TokenBucket(OUTBOUND_BULK_RATE, OUTBOUND_BULK_BURST)
+
+    def _is_free(self, cls: str) -> bool:
+        higher = REQUEST_CLASSES[: REQUEST_CLASSES.index(cls)]
+        return not any(self._active[h] or self._waiting[h] for h in higher)
+
+    @contextmanager
+    def admit(self, cls: str, *, size: int = 0, idle: bool = False) -> Iterator[tuple[Optional[int], float]]:
+        """
+        Wait for the turn of a request of the class.
+
+        Yields the rate to pace the transfer at (None for full speed) and the time waited.
+        An idle request (long-poll) doesn't hold back requests of lower classes.
+        """
+        started = time.monotonic()
+        with self._condition:
+            self._waiting[cls] += 1
+            deadline = started + OUTBOUND_MAX_QUEUE_WAIT_S
+            while not self._is_free(cls) and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            if not self._is_free(cls):
+                logging.debug(
+                    "No turn for a %s request in %s s, going anyway", cls, OUTBOUND_MAX_QUEUE_WAIT_S
+                )
+            self._waiting[cls] -= 1
+            if not idle:
+                self._active[cls] += 1
+            rate = self.bucket.take(size) if cls == BULK else None
+            self._condition.notify_all()
+
+        try:
+            yield rate, time.monotonic() - started
+        finally:
+            with self._condition:
+                if not idle:
+                    self._active[cls] -= 1
+                if rate is not None:
+                    self.bucket.paced_transfer_done()
+                self._condition.notify_all()
+
+
+outbound = OutboundScheduler()
+
+
+@contextmanager
+def outbound_slot(
+    settings: "AppSettings", endpoint: str, size: int, bulk_rate: Optional[int]
+) -> Iterator[Optional[int]]:
+    """Wait for the turn of a request to the endpoint, yields the rate to pace it at (bytes/s) or None."""
+    cls = request_class(endpoint)
+    if cls == BULK and bulk_rate is not None:
+        outbound.bucket.rate = bulk_rate
+    idle = "wait" in parse_qs(urlsplit(endpoint).query)
+
+    with outbound.admit(cls, size=size, idle=idle) as (rate, waited):
+        counters = get_counters(settings)
+        counters.add(f"queue_requests_{cls}")
+        counters.add(f"queue_wait_s_{cls}", waited)
+        yield rate
@@ -1,43 +1,66 @@
 import logging
-import subprocess
 import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from concurrent.futures import wait as wait_futures
 from contextlib import ExitStack
 from typing import Optional
 from urllib.parse import urlparse
 
 from wb.cloud_agent import __version__ as agent_package_version
-from wb.cloud_agent.handlers.curl import CloudNetworkError
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.constants import (
+    CLIENT_CERT_ERROR_MSG,
+    ENGINE_CHECK_ATTEMPTS,
+    ENGINE_CHECK_RETRY_S,
+    LINK_OFFLINE_MAX_WAIT_S,
+    PACKAGES_SETTLE_S,
+    PUSH_RETRY_INTERVAL_S,
+    TRAFFIC_PUBLISH_INTERVAL_S,
+    UPLINK_SOCKET,
+)
+from wb.cloud_agent.dpkg import Stamp, package_index
+from wb.cloud_agent.engine import EngineError, check_engine, measure_signing
+from wb.cloud_agent.handlers.curl import CloudBusyError, CloudNetworkError
 from wb.cloud_agent.handlers.events import event_delete_controller, make_event_request
-from wb.cloud_agent.handlers.ping import CloudUnreachableError, wait_for_cloud_reachable
+from wb.cloud_agent.handlers.ping import (
+    CloudUnreachableError,
+    ProbeResult,
+    wait_for_cloud_reachable,
+)
+from wb.cloud_agent.handlers.push import PushChannelError, run_push_channel
 from wb.cloud_agent.handlers.startup import (
-    make_start_up_request,
+    apply_start_up_response,
+    fetch_start_up_response,
     on_message,
     send_packages_version,
 )
 from wb.cloud_agent.mqtt import MQTTCloudAgent
-from wb.cloud_agent.services.activation import read_activation_link
+from wb.cloud_agent.netlink import link_watcher
+from wb.cloud_agent.scheduler import PollScheduler
+from wb.cloud_agent.services.activation import (
+    is_activation_pending,
+    read_activation_link,
+)
 from wb.cloud_agent.services.lifecycle import stop_services_and_del_configs
 from wb.cloud_agent.settings import (
+    AppSettings,
     configure_app,
     generate_provider_config,
     get_provider_names,
     load_providers_data,
 )
+from wb.cloud_agent.snapshot import get_snapshot
+from wb.cloud_agent.taskgraph import TaskGraph, process_uptime
+from wb.cloud_agent.traffic import data_saver_active, get_traffic_meter
+from wb.cloud_agent.uplink import run_uplink_server
 from wb.cloud_agent.utils import (
     handle_connection_state,
     normalize_base_url,
-    show_providers_table,
     start_and_enable_service,
 )
 
 
-def show_providers(_options) -> int:
-    provider_names = get_provider_names()
-    providers = load_providers_data(provider_names)
-    show_providers_table(providers)
-    return 0
-
-
 def add_provider(options) -> int:
     base_url = normalize_base_url(options.base_url)
     provider_name = options.name or urlparse(base_url).netloc
@@ -118,69 +141,342 @@ def del_controller_from_cloud(options) -> int:
     return event_delete_controller(settings)
 
 
-def run_daemon(options) -> Optional[int]:
-    settings = configure_app(provider_name=options.provider_name)
-    settings.broker_url = options.broker or settings.broker_url
-    logging.info(
-        "====== Cloud Agent started (version: %s, provider: %s) ======",
-        agent_package_version,
-        settings.cloud_base_url,
-    )
-
+def _poll_events(
+    settings: AppSettings, mqtt: MQTTCloudAgent, scheduler: PollScheduler
+) -> tuple[bool, str, Optional[Exception]]:
+    host = _agent_host(settings)
     try:
-        wait_for_cloud_reachable(settings.cloud_base_url, settings.ping_period_seconds)
-    except CloudUnreachableError as exc:
-        logging.error(str(exc))
-        logging.debug("Cloud reachability failure details", exc_info=exc)
-        return 1
+        scheduler.on_events(make_event_request(settings, mqtt))
+        device_connectivity.record_host(host, True, settings.request_period_seconds)
+        return True, "Cloud Agent is successfully connected to the cloud!", None
 
-    mqtt = MQTTCloudAgent(settings, on_message)
+    except CloudNetworkError as exc:
+        scheduler.on_failure()
+        device_connectivity.record_host(host, False, settings.request_period_seconds)
+        return False, "Network or Cloud is unreachable! Retrying...", exc
+
+    except CloudBusyError as exc:
+        scheduler.on_failure(exc.retry_after)
+        device_connectivity.record_host(host, True, settings.request_period_seconds)
+        return False, "Cloud is busy! Retrying later...", exc
+
+    except Exception:  # pylint:disable=broad-exception-caught
+        logging.exception("Cloud connection exception")
+        return False, "Error making request to cloud! Retrying...", None
+
+
+def _agent_host(settings: AppSettings) -> str:
+    return urlparse(settings.cloud_agent_url).hostname or settings.cloud_agent_url
+
+
+def _wait_for_turn(settings: AppSettings) -> bool:
+    """While the cloud host is down, let the agent whose turn it is try it, True if waited."""
+    wait = device_connectivity.wait_for_turn(_agent_host(settings))
+    if wait <= 0:
+        return False
+    logging.debug("Cloud host is unreachable, waiting %.1f s for a try by another agent", wait)
+    link_watcher.sleep(wait)
+    return True
+
+
+def _run_push_channel(
+    settings: AppSettings, mqtt: MQTTCloudAgent, upkeep: "_Upkeep", was_connected: bool
+) -> bool:
+    connected = was_connected
+
+    def on_connected() -> None:
+        nonlocal connected
+        connected = handle_connection_state(
+            connected, True, "Cloud Agent is successfully connected to the cloud push channel!", mqtt
+        )
+
+    try:
+        run_push_channel(settings, mqtt, on_connected, lambda: upkeep.run(cloud_reached=True))
+    except PushChannelError as exc:
+        logging.info("Push channel is not available, polling for events: %s", exc)
+    return connected
+
+
+def _check_engine(settings: AppSettings) -> bool:
+    """
+    False if the key on the crypto chip does not match the client certificate.
+    The service is not restarted after that, so a mismatch counts only if rereading the chip confirms it.
+    """
+    for attempt in range(1, ENGINE_CHECK_ATTEMPTS + 1):
+        try:
+            check_engine(settings)
+        except ValueError as exc:
+            if attempt < ENGINE_CHECK_ATTEMPTS:
+                logging.warning("%s, checking again in %d s", exc, ENGINE_CHECK_RETRY_S)
+                time.sleep(ENGINE_CHECK_RETRY_S)
+                continue
+            message = CLIENT_CERT_ERROR_MSG.format(
+                cert_file=settings.client_cert_file, cert_engine_key=settings.client_cert_engine_key
+            )
+            logging.error("%s: %s", message, exc)
+            return False
+        except EngineError as exc:
+            # Requests will tell if the chip is really unusable
+            logging.warning("Crypto chip check failed: %s", exc)
+        return True
+    return False
+
+
+def _start_mqtt(mqtt: MQTTCloudAgent) -> None:
     try:
         mqtt.start(update_status=True)
     except Exception as exc:  # pylint:disable=broad-exception-caught
         logging.error("Error starting MQTT client: %s", exc)
 
-    try:
-        make_start_up_request(settings, mqtt)
-        send_packages_version(settings)
-    except CloudNetworkError as exc:
-        logging.error("Startup request failed: %s", exc)
-        return 1
 
+def _publish_vdev(settings: AppSettings, mqtt: MQTTCloudAgent) -> None:
     mqtt.update_providers_list()
     mqtt.publish_vdev()
-    mqtt.publish_ctrl("activation_link", read_activation_link(settings))
     mqtt.publish_ctrl("cloud_base_url", settings.cloud_base_url)
     mqtt.publish_ctrl("status", "connecting")
 
+
+def _send_packages_version(settings: AppSettings) -> Optional[Stamp]:
+    """Initial report of package versions, returns the stamp reported or None if it has failed."""
+    stamp = package_index.stamp()
+    try:
+        send_packages_version(settings)
+    except CloudNetworkError as exc:
+        logging.warning("Cannot report package versions, will retry: %s", exc)
+        return None
+    return stamp
+
+
+def _fetch_start_up_response(
+    settings: AppSettings, mqtt: MQTTCloudAgent, vdev_published: Callable[[], object]
+) -> dict:
+    """
+    The start-up request doubles as the reachability probe: the staged probe
+    runs only if the request fails on the network, to tell why and wait for the cloud.
+    """
+    try:
+        return fetch_start_up_response(settings)
+    except CloudNetworkError as exc:
+        logging.info("Start up request failed, probing the cloud: %s", exc)
+
+    def on_failure(result: ProbeResult) -> None:
+        vdev_published()  # or "connecting" would overwrite the failure
+        mqtt.publish_ctrl("status", f"Cloud is unreachable, {result.describe()}! Retrying...")
+
+    wait_for_cloud_reachable(settings.cloud_base_url, settings.ping_period_seconds, on_failure=on_failure)
+    return fetch_start_up_response(settings)
+
+
+def _start(settings: AppSettings, mqtt: MQTTCloudAgent, snapshot: Optional[dict] = None) -> TaskGraph:
+    """
+    Startup steps up to the first poll: local ones (MQTT, the virtual device) go along
+    with the start-up request, the version report goes on after the first poll.
+    With a fresh start-up response from the agent snapshot, the start-up request is not made.
+    """
+    startup = TaskGraph()
+    startup.add("mqtt", lambda: _start_mqtt(mqtt))
+    startup.add("vdev", lambda: _publish_vdev(settings, mqtt), after=["mqtt"])
+    if snapshot is None:
+        # The request needs no MQTT, only publishing its results waits for the virtual device
+        startup.add(
+            "start_up_response",
+            lambda: _fetch_start_up_response(settings, mqtt, lambda: startup.wait("vdev")),
+        )
+        startup.add(
+            "start_up",
+            lambda: apply_start_up_response(settings, startup.wait("start_up_response")[0], mqtt),
+            after=["start_up_response", "vdev"],
+        )
+    else:
+        startup.add("start_up", lambda: apply_start_up_response(settings, snapshot, mqtt), after=["vdev"])
+    startup.add(
+        "activation_link",
+        lambda: mqtt.publish_ctrl("activation_link", read_activation_link(settings)),
+        after=["start_up"],
+    )
+    startup.add("package_versions", lambda: _send_packages_version(settings), after=["start_up"])
+    return startup
+
+
+def _abort_start(startup: TaskGraph, mqtt: MQTTCloudAgent) -> None:
+    """Remove the virtual device of a failed start, it must not stay "connecting"."""
+    wait_futures([startup.future("vdev")])  # not to be published after the removal
+    mqtt.remove_vdev()
+    mqtt.stop()
+
+
+def _wait_for_start(startup: TaskGraph, mqtt: MQTTCloudAgent) -> bool:
+    """Wait for the startup steps up to the first poll, False if the agent cannot start."""
+    try:
+        startup.wait("activation_link")
+    except CloudUnreachableError as exc:
+        logging.error(str(exc))
+        logging.debug("Cloud reachability failure details", exc_info=exc)
+        _abort_start(startup, mqtt)
+        return False
+    except CloudNetworkError as exc:
+        logging.error("Startup request failed: %s", exc)
+        _abort_start(startup, mqtt)
+        return False
+    except Exception:
+        _abort_start(startup, mqtt)
+        raise
+    finally:
+        startup.shutdown()
+    return True
+
+
+def _initial_versions_stamp(versions_report: Future) -> Optional[Stamp]:
+    """Stamp of the initial report of package versions, None if it is to be retried."""
+    try:
+        return versions_report.result()
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        logging.warning("Cannot report package versions, will retry: %s", exc)
+        return None
+
+
+def _report_first_poll(mqtt: MQTTCloudAgent) -> None:
+    """Time from the process start to the first successful poll, what reboots and upgrades cost."""
+    elapsed = process_uptime()
+    logging.info("First successful poll in %.1f s since the agent has started", elapsed)
+    mqtt.publish_ctrl("startup_time", f"{elapsed:.1f}")
+
+
+class _Upkeep:  # pylint: disable=too-few-public-methods
+    """
+    Periodic work of the main loop: snapshot confirmation, traffic counters, package version reports.
+
+    It runs after every poll, and on messages of the push channel while the channel blocks the loop.
+    """
+
+    def __init__(self, settings: AppSettings, mqtt: MQTTCloudAgent, versions_report: Future) -> None:
+        self.settings = settings
+        self.mqtt = mqtt
+        self.versions_report: Optional[Future] = versions_report
+        self.packages_stamp: Optional[Stamp] = None
+        self.traffic_published_at = float("-inf")
+        self.first_poll_reported = False
+
+    def run(self, cloud_reached: bool) -> None:
+        if cloud_reached:
+            get_snapshot(self.settings).confirm()
+            if not self.first_poll_reported:
+                _report_first_poll(self.mqtt)
+                self.first_poll_reported = True
+
+        self.traffic_published_at = _publish_traffic(self.settings, self.mqtt, self.traffic_published_at)
+        if self.versions_report is not None and self.versions_report.done():
+            self.packages_stamp = _initial_versions_stamp(self.versions_report)
+            self.versions_report = None
+        if self.versions_report is None:
+            # Until a report has succeeded, the stamp is None and the report is retried
+            self.packages_stamp = _report_package_upgrades(self.settings, self.packages_stamp)
+
+
+def run_daemon(options) -> Optional[int]:
+    settings = configure_app(provider_name=options.provider_name)
+    settings.broker_url = options.broker or settings.broker_url
+    logging.info(
+        "====== Cloud Agent started (version: %s, provider: %s) ======",
+        agent_package_version,
+        settings.cloud_base_url,
+    )
+
+    if not _check_engine(settings):
+        return 6  # restarting won't help, see RestartPreventExitStatus of the service
+
+    # The service doesn't wait for network-online.target, the agent follows the network itself
+    link_watcher.start()
+    mqtt = MQTTCloudAgent(settings, on_message)
+    startup = _start(settings, mqtt, get_snapshot(settings).warm_start(settings))
+    if not _wait_for_start(startup, mqtt):
+        return 1
+
     logging.info("Cloud Agent initialization - OK")
 
     with ExitStack() as stack:
         stack.callback(mqtt.remove_vdev)
         was_connected = False
+        push_retry_at = 0.0
+        scheduler = PollScheduler(settings)
+        upkeep = _Upkeep(settings, mqtt, startup.future("package_versions"))
 
         while True:
-            start = time.perf_counter()
-            logging.debug("Sending event request")
+            if settings.push_enabled and time.monotonic() >= push_retry_at:
+                # Blocks while the push channel is alive, then events are polled until the next attempt
+                was_connected = _run_push_channel(settings, mqtt, upkeep, was_connected)
+                push_retry_at = time.monotonic() + PUSH_RETRY_INTERVAL_S
 
-            try:
-                make_event_request(settings, mqtt)
-                conn_state, msg, exc_info = True, "Cloud Agent is successfully connected to the cloud!", None
+            if _wait_for_turn(settings):
+                continue
 
-            except subprocess.TimeoutExpired as exc:
-                conn_state, msg, exc_info = False, "Request timeout. Retrying...", exc
-
-            except CloudNetworkError as exc:
-                conn_state, msg, exc_info = False, "Network or Cloud is unreachable! Retrying...", exc
-
-            except Exception:  # pylint:disable=broad-exception-caught
-                logging.exception("Cloud connection exception")
-                conn_state, msg, exc_info = False, "Error making request to cloud! Retrying...", None
+            start = time.perf_counter()
+            logging.debug("Sending event request")
 
+            conn_state, msg, exc_info = _poll_events(settings, mqtt, scheduler)
             was_connected = handle_connection_state(was_connected, conn_state, msg, mqtt)
 
             if exc_info is not None:
                 logging.debug(msg, exc_info=exc_info)
 
             logging.debug("Event request completed in %s ms", int((time.perf_counter() - start) * 1000))
-            time.sleep(settings.request_period_seconds)
+
+            upkeep.run(cloud_reached=conn_state)
+
+            # No default route means offline only if the cloud is unreachable too, it may be on the LAN
+            offline = isinstance(exc_info, CloudNetworkError)
+            link_watcher.sleep(
+                scheduler.next_delay(is_activation_pending(settings)),
+                offline_delay=LINK_OFFLINE_MAX_WAIT_S if offline else None,
+            )
+
+
+def _publish_traffic(settings: AppSettings, mqtt: MQTTCloudAgent, published_at: float) -> float:
+    """Publish traffic counters if they are due, returns the time of the last publication."""
+    if time.monotonic() - published_at < TRAFFIC_PUBLISH_INTERVAL_S:
+        return published_at
+    mqtt.publish_traffic(get_traffic_meter(settings), data_saver_active(settings))
+    return time.monotonic()
+
+
+def _report_package_upgrades(settings: AppSettings, stamp: Optional[Stamp]) -> Optional[Stamp]:
+    """Report package versions after dpkg has changed its status file, returns the stamp reported."""
+    current = package_index.stamp()
+    if current is None or current == stamp:
+        return stamp
+    if time.time() - current[0] / 1e9 < PACKAGES_SETTLE_S:
+        return stamp  # dpkg may be still at work
+    try:
+        send_packages_version(settings)  # sent only if the versions have changed
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        logging.debug("Cannot report package versions: %s", exc)
+        return stamp
+    return current
+
+
+def run_uplink(_options) -> Optional[int]:
+    configure_app(provider_name="", skip_conf_file=True)
+    logging.info("====== Cloud Agent uplink started (version: %s) ======", agent_package_version)
+
+    try:
+        run_uplink_server(UPLINK_SOCKET)
+    except RuntimeError as exc:
+        logging.error(str(exc))
+        return 1
+    return None
+
+
+def bench_signing(options) -> int:
+    provider_name = options.provider_name or ""
+    settings = configure_app(provider_name=provider_name, skip_conf_file=not provider_name)
+
+    key = "software key" if options.software_key else settings.client_cert_engine_key
+    print(f"Signing with {key} {options.count} times...")
+    try:
+        result = measure_signing(settings, options.count, software_key=options.software_key)
+    except EngineError as exc:
+        print(f"Signing failed: {exc}")
+        return 1
+
+    print(result.summary())
+    return 0
@@ -0,0 +1,132 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from wb.cloud_agent.constants import (
+    CONNECTIVITY_BACKOFF_AFTER,
+    CONNECTIVITY_FRESH_S,
+    CONNECTIVITY_PROBE_CLAIM_S,
+    CONNECTIVITY_PROBE_MAX_INTERVAL_S,
+    CONNECTIVITY_STATE_FILE,
+)
+
+
+class ConnectivityState:
+    """
+    Connectivity of the device shared by agent instances of all providers, in a file under /run.
+
+    It holds the link state (a default route is up), DNS health and reachability of cloud
+    hosts, each with the time it was last seen. Instances update it on their probes and
+    requests, and consult it before their own: a host another instance has reached recently
+    is not probed again, and while a host is unreachable only one instance at a time tries it
+    ("probe turn"), the others wait for its result. Failed tries back off collectively:
+    after CONNECTIVITY_BACKOFF_AFTER failures in a row the interval doubles with each one,
+    up to CONNECTIVITY_PROBE_MAX_INTERVAL_S. A new default route resets the backoff.
+
+    Times are CLOCK_MONOTONIC, which is shared by processes and, like /run, starts over on boot.
+    Updates are serialized by flock of the file; if it cannot be opened, the state is not shared.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict]:
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as exc:
+            logging.debug("Cannot open %s: %s", self.path, exc)
+            yield {}
+            return
+
+        with os.fdopen(fd, "r+", encoding="utf-8") as file:
+            fcntl.flock(fd, fcntl.LOCK_EX)  # dropped on close
+            try:
+                state = json.loads(file.read() or "{}")
+            except ValueError:
+                state = {}
+            if not isinstance(state, dict):
+                state = {}
+            before = json.dumps(state, sort_keys=True)
+            yield state
+            if json.dumps(state, sort_keys=True) != before:
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(state, indent=4, sort_keys=True))
+
+    def _read(self) -> dict:
+        with self._locked() as state:
+            return state
+
+    def record_link(self, up: bool) -> None:
+        with self._locked() as state:
+            link = state.get("link", {})
+            if link.get("up") is up:
+                return
+            state["link"] = {"up": up, "changed_at": time.monotonic()}
+            if up:
+                # The network has changed, results of probes over the old one don't hold
+                for host in state.get("hosts", {}).values():
+                    host.update(failures=0, next_try_at=0)
+
+    def record_dns(self, ok: bool) -> None:
+        with self._locked() as state:
+            state["dns"] = {"ok": ok, "checked_at": time.monotonic()}
+
+    def dns_failing(self) -> bool:
+        """Another instance has seen the resolver failing recently."""
+        dns = self._read().get("dns", {})
+        return dns.get("ok") is False and time.monotonic() - dns.get("checked_at", 0) < CONNECTIVITY_FRESH_S
+
+    def is_reachable(self, host: str) -> bool:
+        """The host has been reached recently, by any instance."""
+        entry = self._read().get("hosts", {}).get(host, {})
+        return (
+            entry.get("reachable") is True
+            and time.monotonic() - entry.get("seen_at", 0) < CONNECTIVITY_FRESH_S
+        )
+
+    def wait_for_turn(self, host: str) -> float:
+        """
+        Time to wait before this instance may try an unreachable host, 0 if the host is
+        not known to be down or it is this instance's turn (then others wait for its result).
+        """
+        with self._locked() as state:
+            entry = state.get("hosts", {}).get(host)
+            if entry is None or entry.get("reachable") is not False:
+                return 0
+            now = time.monotonic()
+            if entry.get("prober") != os.getpid() and now < entry.get("next_try_at", 0):
+                return entry["next_try_at"] - now
+            entry.update(prober=os.getpid(), next_try_at=now + CONNECTIVITY_PROBE_CLAIM_S)
+            return 0
+
+    def record_host(self, host: str, reachable: bool, interval: float) -> float:
+        """Record a try of the host, returns the interval before the next one."""
+        with self._locked() as state:
+            entry = state.setdefault("hosts", {}).setdefault(host, {})
+            now = time.monotonic()
+            if reachable:
+                if (
+                    entry.get("reachable") is True
+                    and now - entry.get("seen_at", 0) < CONNECTIVITY_FRESH_S / 2
+                ):
+                    return interval  # fresh enough, spare the write
+                if entry.get("reachable") is False:
+                    logging.info("%s is reachable again", host)
+                entry.update(reachable=True, seen_at=now, failures=0, next_try_at=0, prober=None)
+                return interval
+            failures = entry.get("failures", 0) + 1
+            backoff = 2 ** max(0, failures - CONNECTIVITY_BACKOFF_AFTER)
+            delay = max(interval, min(interval * backoff, CONNECTIVITY_PROBE_MAX_INTERVAL_S))
+            entry.update(
+                reachable=False, seen_at=now, failures=failures, next_try_at=now + delay, prober=os.getpid()
+            )
+            return delay
+
+
+device_connectivity = ConnectivityState(CONNECTIVITY_STATE_FILE)
@@ -9,6 +9,20 @@ APP_DATA_PROVIDERS_DIR = f"{APP_DATA_DIR}/providers"
 
 CLOUD_AGENT_URL_POSTFIX = "/api-agent/v1/"
 
+# wb_common.mqtt_client.DEFAULT_BROKER_URL, not imported from there to keep CLI commands off paho
+DEFAULT_BROKER_URL = "unix:///var/run/mosquitto/mosquitto.sock"
+
+# Output of wb-gen-serial, /run is cleared on boot, so a card moved to another controller is fine
+CTRL_SERIAL_CACHE_FILE = "/run/wb-cloud-agent-serial"
+
+# Installed package versions parsed from the dpkg status file, shared by agent instances
+PACKAGE_VERSIONS_CACHE_FILE = "/run/wb-cloud-agent-packages.json"
+PACKAGES_SETTLE_S = 30  # upgrades are reported once dpkg has not touched its status file for this long
+
+# A restarted daemon skips the start-up calls if a poll has succeeded this recently (see snapshot.py)
+SNAPSHOT_FRESH_S = 15 * 60
+SNAPSHOT_CONFIRM_INTERVAL_S = 5 * 60  # successful polls refresh the snapshot at most this often
+
 CLIENT_CERT_ERROR_MSG = (
     "Cert {cert_file} and key {cert_engine_key} "
     "seem to be inconsistent (possibly because of CPU board missmatch)!"
@@ -16,6 +30,100 @@ CLIENT_CERT_ERROR_MSG = (
 
 UNBIND_CTRL_REQUEST_TIMEOUT = 7
 
+# Long-poll of events/: the cloud holds the request open for up to the timeout it sets
+# in x-long-poll-timeout header; the margin covers network delays on top of it.
+LONG_POLL_MAX_TIMEOUT_S = 300
+LONG_POLL_TIMEOUT_MARGIN_S = 15
+
+# Optional WebSocket channel for events pushed by the cloud, polling is used while it is down
+PUSH_ENDPOINT = "events/ws/"
+PUSH_CONNECT_TIMEOUT_S = 30
+PUSH_PING_INTERVAL_S = 60  # ping the cloud after this many seconds without messages
+PUSH_RETRY_INTERVAL_S = 300  # poll for at least this long before reconnecting the channel
+
+# Adaptive polling of events/ around the x-poll-interval baseline set by the cloud
+POLL_BACKOFF_MAX_S = 600  # upper bound of the randomized delay after failed requests
+POLL_MIN_INTERVAL_S = 2
+POLL_ACTIVITY_WINDOW_S = 300  # poll faster for this long after the last received event
+POLL_ACTIVITY_SPEEDUP = 2
+POLL_ACTIVATION_PENDING_SLOWDOWN = 3  # nothing but activation is expected from the cloud
+RETRY_MAX_DELAY_S = 30  # backoff cap between attempts of a single request
+SUBPROCESS_TIMEOUT_MARGIN_S = 10  # curl process is killed if it hangs this long after its --max-time
+RETRY_AFTER_MAX_S = 3600  # ignore longer Retry-After to stay responsive after cloud misconfiguration
+
+# Optional local uplink: a single process owning TLS connections to the cloud for all providers,
+# agents talk to it in plain HTTP over a unix socket
+UPLINK_SOCKET = "/run/wb-cloud-agent/uplink.sock"
+UPLINK_OPTIONS_HEADER = "x-uplink-options"  # curl transfer options of the attempt
+UPLINK_ERROR_HEADER = "x-uplink-error"  # curl exit code of a failed transfer to the cloud
+UPLINK_AGENT_URL_HEADER = "x-uplink-agent-url"  # agent API endpoint selected by the agent
+UPLINK_TRAFFIC_HEADER = "x-uplink-traffic"  # bytes the request took on the uplink's connection
+UPLINK_MEASUREMENTS_HEADER = "x-uplink-measurements"  # stats counters and connection of the request
+UPLINK_RESOLVE_HEADER = "x-uplink-resolve"  # curl --resolve entry from the agent's DNS cache
+
+# Health-based selection among agent API endpoints of a provider
+ENDPOINT_EWMA_ALPHA = 0.2
+ENDPOINT_ERROR_PENALTY = 10  # an endpoint failing every request counts as 11 times slower
+ENDPOINT_COOLDOWN_S = 300  # a failed endpoint is skipped while others are available
+ENDPOINT_SWITCH_RATIO = 0.7  # move to another endpoint only if it is at least 30% better
+ENDPOINT_FAILOVER_HTTP_CODES = (502, 504)  # the endpoint's gateway cannot reach the cloud
+
+# Cache of resolved cloud host addresses, TTLs are known with python3-dnspython only
+DNS_CACHE_DEFAULT_TTL_S = 300
+DNS_CACHE_MIN_TTL_S = 30
+DNS_CACHE_MAX_TTL_S = 86400
+DNS_CACHE_STALE_MAX_S = 7 * 86400  # serve cached addresses this long while the resolver fails
+DNS_LOOKUP_TIMEOUT_S = 10
+
+# ATECC crypto chip with the client key, shared by all agent threads and processes
+ENGINE_NAME = "ateccx08"
+ENGINE_LOCK_FILE = "/run/lock/wb-cloud-agent-ateccx08.lock"
+ENGINE_HANDSHAKE_HOLD_S = 5  # a curl run holds the chip for its connect and TLS handshake at most
+ENGINE_WAIT_WARNING_S = 10
+ENGINE_CHECK_TIMEOUT_S = 30
+ENGINE_CHECK_ATTEMPTS = 3  # a key mismatch stops the service, a misread of the chip must not
+ENGINE_CHECK_RETRY_S = 10
+
+# Request bodies are gzipped once the cloud has announced support (Accept-Encoding
+# of a response, RFC 7694), small ones are not worth it
+REQUEST_COMPRESSION_MIN_BYTES = 512
+REQUEST_COMPRESSION_LEVEL = 6
+
+STATS_FLUSH_INTERVAL_S = 600  # save agent counters to disk at most every 10 minutes
+
+# Outbound requests share the uplink by priority: interactive ones (events) go first,
+# reports wait for them, bulk uploads wait for both and are paced by a token bucket
+OUTBOUND_MAX_QUEUE_WAIT_S = 10
+OUTBOUND_BULK_RATE = 32 * 1024  # bytes/s, the cloud can tune it (bulk_rate)
+OUTBOUND_BULK_BURST = 256 * 1024  # smaller uploads go at full speed
+
+# Bandwidth accounting and data saver for metered (cellular) uplinks
+TRAFFIC_HISTORY_DAYS = 62  # daily per-endpoint byte counters are kept for two months
+TRAFFIC_PUBLISH_INTERVAL_S = 60
+METERED_INTERFACE_PREFIXES = ("ppp", "wwan")  # modems, used when NetworkManager cannot tell
+METERED_CHECK_INTERVAL_S = 60
+DATA_SAVER_POLL_SLOWDOWN = 6
+DATA_SAVER_LONG_POLL_TIMEOUT_S = 240  # below the usual 5 minutes idle timeout of carrier NATs
+DIAGNOSTICS_DEFER_MAX_S = 24 * 3600  # upload over a metered link after all if it is the only one
+
+# While there is no default route, waits for the network are put off until one appears
+# (rtnetlink notification), this long at most
+LINK_OFFLINE_MAX_WAIT_S = 300
+
+PROBE_TIMEOUT_S = 15  # per stage of the cloud reachability probe
+
+# Connectivity state shared by agent instances of all providers
+CONNECTIVITY_STATE_FILE = "/run/wb-cloud-agent-connectivity.json"
+CONNECTIVITY_FRESH_S = 60  # a host reached (or DNS failing) this recently needs no probe of its own
+CONNECTIVITY_PROBE_CLAIM_S = 30  # others wait this long for the result of an instance's try
+CONNECTIVITY_BACKOFF_AFTER = 3  # failed tries in a row before the interval starts doubling
+CONNECTIVITY_PROBE_MAX_INTERVAL_S = 300
+
+# Per request class interface binding (INTERFACES config) with health probes of the interfaces
+PATH_PROBE_INTERVAL_S = 60
+PATH_PROBE_TIMEOUT_S = 5
+PATH_EWMA_ALPHA = 0.2
+
 # Health monitoring for metrics collector service after update delivery.
 # After the script is deployed and the service is restarted, a background daemon
 # thread monitors the service for METRICS_HEALTH_CHECK_INTERVAL_S * METRICS_HEALTH_CHECK_COUNT
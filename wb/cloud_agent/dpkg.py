@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from wb.cloud_agent.constants import PACKAGE_VERSIONS_CACHE_FILE
+
+DPKG_STATUS_FILE = "/var/lib/dpkg/status"
+
+# mtime (ns) and size of the dpkg status file, the index is rebuilt when they change
+Stamp = tuple[int, int]
+
+
+def parse_dpkg_status(text: str) -> dict[str, str]:
+    """Versions of installed packages from the contents of the dpkg status file."""
+    versions: dict[str, str] = {}
+    for stanza in text.split("\n\n"):
+        fields = {}
+        for line in stanza.splitlines():
+            # Continuation lines of multiline fields start with a space
+            if line[:1] in (" ", "\t") or ":" not in line:
+                continue
+            name, value = line.split(":", 1)
+            if name in ("Package", "Status", "Version"):
+                fields[name] = value.strip()
+        # "install ok installed" or "hold ok installed", not removed ones with config files left
+        if fields.get("Status", "").endswith(" installed") and "Package" in fields and "Version" in fields:
+            versions.setdefault(fields["Package"], fields["Version"])
+    return versions
+
+
+class PackageIndex:
+    """
+    Installed package versions, read from the dpkg status file instead of a dpkg-query run per package.
+
+    The index is rebuilt only when the status file changes (see Stamp). It is shared
+    with agent instances of other providers through a cache file in /run, so after
+    an upgrade restarts them all, the status file is parsed once.
+    """
+
+    def __init__(self, status_file: str, cache_file: str) -> None:
+        self.status_file = status_file
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._stamp: Optional[Stamp] = None
+        self._versions: dict[str, str] = {}
+
+    def stamp(self) -> Optional[Stamp]:
+        try:
+            stat = os.stat(self.status_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def versions(self) -> dict[str, str]:
+        stamp = self.stamp()
+        if stamp is None:
+            return {}
+        with self._lock:
+            if stamp == self._stamp:
+                return self._versions
+
+        versions = self._load_cache(stamp)
+        if versions is None:
+            try:
+                versions = parse_dpkg_status(
+                    Path(self.status_file).read_text(encoding="utf-8", errors="replace")
+                )
+            except OSError as exc:
+                logging.debug("Cannot read %s: %s", self.status_file, exc)
+                return {}
+            self._save_cache(stamp, versions)
+
+        with self._lock:
+            self._stamp, self._versions = stamp, versions
+        return versions
+
+    def _load_cache(self, stamp: Stamp) -> Optional[dict[str, str]]:
+        try:
+            data = json.loads(Path(self.cache_file).read_text(encoding="utf-8"))
+            if tuple(data["stamp"]) == stamp and isinstance(data["versions"], dict):
+                return data["versions"]
+        except (OSError, ValueError, TypeError, KeyError):
+            pass
+        return None
+
+    def _save_cache(self, stamp: Stamp, versions: dict[str, str]) -> None:
+        # Other instances may be reading it, the new contents are swapped in at once
+        tmp_file = f"{self.cache_file}.{os.getpid()}"
+        try:
+            Path(tmp_file).write_text(json.dumps({"stamp": stamp, "versions": versions}), encoding="utf-8")
+            os.replace(tmp_file, self.cache_file)
+        except OSError as exc:
+            logging.debug("Cannot save package versions to %s: %s", self.cache_file, exc)
+
+
+package_index = PackageIndex(DPKG_STATUS_FILE, PACKAGE_VERSIONS_CACHE_FILE)
+
+
+def get_package_version(package_name: str) -> str:
+    return package_index.versions().get(package_name, "unknown")
@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+from urllib.parse import urlparse
+
+from wb.cloud_agent.constants import (
+    ENDPOINT_COOLDOWN_S,
+    ENDPOINT_ERROR_PENALTY,
+    ENDPOINT_EWMA_ALPHA,
+    ENDPOINT_SWITCH_RATIO,
+)
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+
+@dataclass
+class Endpoint:
+    url: str
+    weight: float = 1.0
+    rtt: Optional[float] = None  # moving average of TCP connect time
+    errors: float = 0.0  # moving average of failed requests share
+    down_until: float = 0.0
+
+    def score(self) -> float:
+        """Lower is better, endpoints without measurements go after measured ones."""
+        if self.rtt is None:
+            return float("inf")
+        return self.rtt * (1 + ENDPOINT_ERROR_PENALTY * self.errors) / self.weight
+
+
+class EndpointSelector:
+    """
+    Agent API endpoints of a provider with their health.
+
+    The list comes from AGENT_URLS of the provider config or from the cloud
+    in agentEndpoints of the start-up response (saved, so it is known at the next
+    start even if the primary endpoint is down), the agent URL derived from
+    the provider base URL is used without them. Entries are URLs or objects with
+    "url" and optional "weight", earlier entries are preferred until measured.
+
+    Requests go to the endpoint with the lowest connect time weighted by its error
+    rate. A failed endpoint is skipped for ENDPOINT_COOLDOWN_S, so a retry within
+    the same request goes to the next one.
+    """
+
+    def __init__(self, path: Path, default_url: str, configured: Optional[list] = None) -> None:
+        self.path = path
+        self.default_url = default_url
+        self._lock = threading.Lock()
+        self._configured = bool(configured)
+        self._endpoints = parse_endpoints(configured or self._load()) or [Endpoint(default_url)]
+        self._current: Optional[Endpoint] = None
+
+    def _load(self) -> list:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return []
+        return data if isinstance(data, list) else []
+
+    def update(self, entries: Any) -> None:
+        """Apply the list delivered by the cloud, measurements of known endpoints are kept."""
+        if self._configured:
+            return
+        endpoints = parse_endpoints(entries) if isinstance(entries, list) else []
+
+        with self._lock:
+            if [(e.url, e.weight) for e in endpoints] == [(e.url, e.weight) for e in self._endpoints]:
+                return
+            known = {endpoint.url: endpoint for endpoint in self._endpoints}
+            for endpoint in endpoints:
+                if endpoint.url in known:
+                    endpoint.rtt, endpoint.errors = known[endpoint.url].rtt, known[endpoint.url].errors
+            self._endpoints = endpoints or [Endpoint(self.default_url)]
+            self._current = None
+
+        logging.info("Agent endpoints have been set by the cloud: %s", [e.url for e in endpoints])
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            contents = [{"url": e.url, "weight": e.weight} for e in endpoints]
+            self.path.write_text(json.dumps(contents, indent=4), encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save agent endpoints to %s: %s", self.path, exc)
+
+    def select(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            available = [e for e in self._endpoints if e.down_until <= now] or self._endpoints
+            best = min(available, key=lambda e: (e.score(), self._endpoints.index(e)))
+            current = self._current
+            # Don't move for a small gain: a new endpoint costs a new connection and TLS handshake
+            if current in available and best.score() > current.score() * ENDPOINT_SWITCH_RATIO:
+                best = current
+            if best is not current:
+                if current is not None:
+                    logging.info("Switching agent endpoint from %s to %s", current.url, best.url)
+                self._current = best
+            return best.url
+
+    def _find(self, url: str) -> Optional[Endpoint]:
+        return next((e for e in self._endpoints if url.startswith(e.url)), None)
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            endpoint = self._find(url)
+            if endpoint is not None:
+                endpoint.errors *= 1 - ENDPOINT_EWMA_ALPHA
+
+    def record_rtt(self, url: str, rtt: float) -> None:
+        with self._lock:
+            endpoint = self._find(url)
+            if endpoint is not None:
+                endpoint.rtt = rtt if endpoint.rtt is None else _ewma(endpoint.rtt, rtt)
+
+    def record_failure(self, url: str) -> bool:
+        """Put the endpoint on cooldown, returns True if another one is available right now."""
+        with self._lock:
+            endpoint = self._find(url)
+            if endpoint is None:
+                return False
+            now = time.monotonic()
+            endpoint.errors = _ewma(endpoint.errors, 1.0)
+            endpoint.down_until = now + ENDPOINT_COOLDOWN_S
+            return any(e.down_until <= now for e in self._endpoints)
+
+
+def _ewma(average: float, value: float) -> float:
+    return average + ENDPOINT_EWMA_ALPHA * (value - average)
+
+
+def parse_endpoints(entries: list) -> list[Endpoint]:
+    """Validate endpoints: URLs or objects with url and weight, invalid entries are dropped."""
+    endpoints = []
+    for entry in entries:
+        url, weight = (entry, 1.0) if isinstance(entry, str) else (None, None)
+        if isinstance(entry, dict):
+            url, weight = entry.get("url"), entry.get("weight", 1.0)
+        if (
+            not isinstance(url, str)
+            or urlparse(url).scheme not in ("http", "https")
+            or isinstance(weight, bool)
+            or not isinstance(weight, (int, float))
+            or weight <= 0
+        ):
+            logging.warning("Invalid agent endpoint: %s", entry)
+            continue
+        endpoints.append(Endpoint(url if url.endswith("/") else url + "/", float(weight)))
+    return endpoints
+
+
+_selectors: dict[str, EndpointSelector] = {}
+_selectors_lock = threading.Lock()
+
+
+def get_endpoints(settings: "AppSettings") -> EndpointSelector:
+    with _selectors_lock:
+        selector = _selectors.get(settings.provider_name)
+        if selector is None or selector.default_url != settings.cloud_agent_url:
+            selector = EndpointSelector(
+                settings.endpoints_file, settings.cloud_agent_url, settings.agent_urls
+            )
+            _selectors[settings.provider_name] = selector
+        return selector
+
+
+def record_rtt(settings: "AppSettings", url: str, rtt: float) -> None:
+    get_endpoints(settings).record_rtt(url, rtt)
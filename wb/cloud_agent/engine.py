@@ -0,0 +1,205 @@
+import fcntl
+import logging
+import os
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from wb.cloud_agent.constants import (
+    ENGINE_CHECK_TIMEOUT_S,
+    ENGINE_LOCK_FILE,
+    ENGINE_NAME,
+    ENGINE_WAIT_WARNING_S,
+)
+from wb.cloud_agent.stats import get_counters
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+
+class EngineError(Exception):
+    """The crypto chip cannot be used with the configured key and certificate."""
+
+
+class EngineArbiter:
+    """
+    Serializes use of the ATECC crypto chip, which sits on a shared I2C bus.
+
+    Threads of a process queue on a lock, processes (other provider instances,
+    the uplink, bench-signing) on flock of a file in /run/lock. If the lock file
+    cannot be opened, only threads of this process are serialized.
+    """
+
+    def __init__(self, lock_file: str) -> None:
+        self.lock_file = lock_file
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._acquired_at = 0.0
+
+    def acquire(self) -> float:
+        """Wait for the chip, returns the time spent waiting."""
+        started = time.monotonic()
+        self._lock.acquire()  # pylint: disable=consider-using-with
+        try:
+            self._fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except OSError as exc:
+            logging.debug("Cannot lock %s: %s", self.lock_file, exc)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        self._acquired_at = time.monotonic()
+        return self._acquired_at - started
+
+    def release(self) -> float:
+        """Let the next waiter use the chip, returns the time it was held."""
+        held = time.monotonic() - self._acquired_at
+        if self._fd is not None:
+            os.close(self._fd)  # drops the flock
+            self._fd = None
+        self._lock.release()
+        return held
+
+
+arbiter = EngineArbiter(ENGINE_LOCK_FILE)
+
+
+def engine_use_counters(wait: float, held: float) -> dict[str, float]:
+    """Stats counters of a use of the chip, a long wait for it is logged."""
+    if wait > ENGINE_WAIT_WARNING_S:
+        logging.warning("Crypto chip was busy, waited %.1f s", wait)
+    return {"engine_uses": 1, "engine_wait_s": wait, "engine_busy_s": held}
+
+
+def record_engine_use(settings: "AppSettings", wait: float, held: float) -> None:
+    counters = get_counters(settings)
+    for name, value in engine_use_counters(wait, held).items():
+        counters.add(name, value)
+
+
+@contextmanager
+def engine_access(settings: "AppSettings", max_hold: Optional[float] = None) -> Iterator[None]:
+    """
+    Hold the crypto chip for the duration of the block, but no longer than max_hold.
+
+    max_hold is for blocks that cannot tell when they are done with the chip,
+    e.g. a curl run, which signs during its TLS handshake and then transfers data.
+    """
+    wait = arbiter.acquire()
+    released = False
+    release_lock = threading.Lock()
+
+    def release() -> None:
+        nonlocal released
+        with release_lock:
+            if not released:
+                released = True
+                record_engine_use(settings, wait, arbiter.release())
+
+    timer = None
+    if max_hold is not None:
+        timer = threading.Timer(max_hold, release)
+        timer.daemon = True
+        timer.start()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.cancel()
+        release()
+
+
+def _run_openssl(args: list[str]) -> bytes:
+    try:
+        result = subprocess.run(
+            ["openssl", *args], capture_output=True, check=True, timeout=ENGINE_CHECK_TIMEOUT_S
+        )
+    except subprocess.CalledProcessError as exc:
+        raise EngineError(exc.stderr.decode("utf-8", errors="replace").strip()) from exc
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        raise EngineError(str(exc)) from exc
+    return result.stdout
+
+
+def check_engine(settings: "AppSettings") -> None:
+    """
+    Check once that the crypto chip answers and holds the key of the client certificate.
+
+    Raises EngineError if the chip does not answer, ValueError if the key does not
+    match the certificate (e.g. after a CPU board replacement).
+    """
+    cert_key = _run_openssl(["x509", "-in", settings.client_cert_file, "-noout", "-pubkey"])
+    with engine_access(settings):
+        engine_key = _run_openssl(
+            [
+                "pkey",
+                "-engine",
+                ENGINE_NAME,
+                "-inform",
+                "ENG",
+                "-in",
+                settings.client_cert_engine_key,
+                "-pubout",
+            ]
+        )
+    if cert_key.strip() != engine_key.strip():
+        raise ValueError(
+            f"Key {settings.client_cert_engine_key} does not match cert {settings.client_cert_file}"
+        )
+    settings.engine_checked = True
+
+
+@dataclass
+class SigningBenchmark:
+    latencies: list[float]
+    waits: list[float]
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.latencies)} signatures in {self.elapsed:.2f} s: {self.rate:.2f} ops/s, "
+            f"latency median {statistics.median(self.latencies) * 1000:.0f} ms, "
+            f"max {max(self.latencies) * 1000:.0f} ms, "
+            f"waited for the chip {sum(self.waits):.2f} s"
+        )
+
+
+def measure_signing(settings: "AppSettings", count: int, software_key: bool = False) -> SigningBenchmark:
+    """
+    Sign a digest count times with the client key on the chip, queueing with the agents.
+
+    With software_key a throwaway P-256 key is used instead, as a stand-in on
+    controllers without the chip and as a baseline of the openssl run overhead.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        digest = Path(tmp_dir) / "digest"
+        digest.write_bytes(os.urandom(32))
+        if software_key:
+            key = Path(tmp_dir) / "key.pem"
+            _run_openssl(["ecparam", "-name", "prime256v1", "-genkey", "-noout", "-out", str(key)])
+            sign_args = ["pkeyutl", "-sign", "-inkey", str(key), "-in", str(digest)]
+        else:
+            sign_args = ["pkeyutl", "-sign", "-engine", ENGINE_NAME, "-keyform", "ENG"]
+            sign_args += ["-inkey", settings.client_cert_engine_key, "-in", str(digest)]
+
+        latencies, waits = [], []
+        started = time.monotonic()
+        for _ in range(count):
+            wait = arbiter.acquire()
+            try:
+                _run_openssl(sign_args)
+            finally:
+                latencies.append(arbiter.release())
+            waits.append(wait)
+        return SigningBenchmark(latencies, waits, time.monotonic() - started)
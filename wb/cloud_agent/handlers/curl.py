@@ -1,52 +1,510 @@
 import json
 import logging
+import math
+import os
+import random
+import shlex
 import subprocess
+import time
 from collections.abc import Iterable
-from typing import Optional
+from dataclasses import dataclass, fields, replace
+from functools import cache
+from typing import Any, NoReturn, Optional
 
-from wb.cloud_agent.constants import CLIENT_CERT_ERROR_MSG
+from wb.cloud_agent.bandwidth import outbound_slot
+from wb.cloud_agent.constants import (
+    CLIENT_CERT_ERROR_MSG,
+    ENDPOINT_FAILOVER_HTTP_CODES,
+    ENGINE_HANDSHAKE_HOLD_S,
+    LONG_POLL_MAX_TIMEOUT_S,
+    RETRY_AFTER_MAX_S,
+    RETRY_MAX_DELAY_S,
+    SUBPROCESS_TIMEOUT_MARGIN_S,
+    UPLINK_AGENT_URL_HEADER,
+    UPLINK_ERROR_HEADER,
+    UPLINK_MEASUREMENTS_HEADER,
+    UPLINK_OPTIONS_HEADER,
+    UPLINK_RESOLVE_HEADER,
+    UPLINK_SOCKET,
+    UPLINK_TRAFFIC_HEADER,
+)
+from wb.cloud_agent.endpoints import get_endpoints, record_rtt
+from wb.cloud_agent.engine import engine_access
+from wb.cloud_agent.handlers import libcurl
+from wb.cloud_agent.netlink import link_watcher
+from wb.cloud_agent.paths import record_interface_failure, select_interface
+from wb.cloud_agent.payload import (
+    accept_header,
+    decode_body,
+    encode_json_body,
+    record_payload,
+    update_request_encoding,
+)
+from wb.cloud_agent.resolver import (
+    get_resolve_entry,
+    record_connect_failed,
+    record_connected,
+)
 from wb.cloud_agent.settings import AppSettings
-from wb.cloud_agent.utils import parse_headers
+from wb.cloud_agent.snapshot import get_snapshot
+from wb.cloud_agent.stats import record_tls_handshake
+from wb.cloud_agent.traffic import Traffic, record_traffic
+from wb.cloud_agent.tuning import get_tuning
+from wb.cloud_agent.utils import get_header, parse_headers, parse_retry_after
 
 DATA_DELIMITER = "|||"
 
+METHODS = ("get", "post", "put", "delete", "multipart-post")
+
+# Curl exit codes of network-level errors: DNS, connect and timeout
+NETWORK_ERROR_CODES = (6, 7, 28)
+CONNECT_ERROR_CODE = 7
+# Curl exit code of a client certificate error, not fixed by a retry
+CLIENT_CERT_ERROR_CODE = 58
+# HTTP statuses of an overloaded cloud, see CloudBusyError
+CLOUD_BUSY_HTTP_CODES = (429, 503)
+
 
 class CloudNetworkError(OSError):
     """Network-level error while communicating with the cloud."""
 
 
-def do_curl(
+class CloudBusyError(Exception):
+    """The cloud is overloaded (429 or 503) and asks to retry later."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class _Response:
+    """Response to a single attempt, the Retry-After delay is kept with it."""
+
+    data: dict
+    http_status: int
+    retry_after: Optional[float] = None
+
+
+class _TransferError(Exception):
+    """A single request attempt failed, carries curl exit code."""
+
+    def __init__(self, returncode: int) -> None:
+        super().__init__(returncode)
+        self.returncode = returncode
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Retries of a request made by the agent.
+
+    Every attempt is made with curl retries disabled and limited by the time
+    left, so all attempts with backoff delays fit into the overall deadline.
+    """
+
+    deadline: float
+    connect_timeout: float = 45
+    retries: int = 8
+    retry_all_errors: bool = True
+    max_delay: float = RETRY_MAX_DELAY_S
+    compressed: bool = True
+    bulk_rate: Optional[int] = None  # bytes/s, see bandwidth.OutboundScheduler
+
+    def should_retry(self, returncode: int, attempt: int) -> bool:
+        if attempt > self.retries or returncode == CLIENT_CERT_ERROR_CODE:
+            return False
+        return self.retry_all_errors or returncode in NETWORK_ERROR_CODES
+
+    def delay(self, attempt: int) -> float:
+        delay = min(2 ** (attempt - 1), self.max_delay)
+        return random.uniform(delay / 2, delay)
+
+    @classmethod
+    def from_retry_opts(cls, retry_opts: Iterable[str]) -> "RetryPolicy":
+        """Map curl command line retry options to a policy."""
+        opts = libcurl.parse_retry_opts(retry_opts)
+        return cls(
+            deadline=opts.max_time or opts.retry_max_time or DEFAULT_RETRY_POLICY.deadline,
+            connect_timeout=opts.connect_timeout or DEFAULT_RETRY_POLICY.connect_timeout,
+            retries=opts.retries,
+            retry_all_errors=opts.retry_all_errors,
+        )
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy(deadline=120)
+
+# By endpoint prefix: polls must not block the main loop (the poll scheduler retries them later),
+# diagnostics are large and uploaded over slow links, health reports are best effort
+RETRY_POLICIES = {
+    "events/": RetryPolicy(deadline=60, connect_timeout=15, retries=3),
+    "upload-diagnostic/": RetryPolicy(deadline=900),
+    "metrics-collector-log/": RetryPolicy(deadline=60, connect_timeout=15, retries=2),
+}
+
+
+def get_retry_policy(settings: AppSettings, endpoint: str) -> RetryPolicy:
+    """Policy of the endpoint with parameters tuned by the cloud."""
+    policy = next(
+        (policy for prefix, policy in RETRY_POLICIES.items() if endpoint.startswith(prefix)),
+        DEFAULT_RETRY_POLICY,
+    )
+    tuned = get_tuning(settings).for_endpoint(endpoint)
+    return replace(
+        policy, **{field.name: tuned[field.name] for field in fields(policy) if field.name in tuned}
+    )
+
+
+def do_curl(  # pylint: disable=too-many-arguments
     settings: AppSettings,
     method: str = "get",
     endpoint: str = "",
     params: Optional[dict] = None,
     retry_opts: Optional[Iterable[str]] = None,
+    *,
+    retry_policy: Optional[RetryPolicy] = None,
+    busy_error: bool = False,
 ) -> tuple[dict, int]:
-    output_format = DATA_DELIMITER + '{"code":"%{response_code}"}'
+    """
+    Make a request to the agent API, returns the response data and HTTP status.
+
+    With busy_error, a busy status left after the retries raises CloudBusyError
+    with the Retry-After delay of that response.
+    """
+    if method not in METHODS:
+        raise ValueError("Invalid method: " + method)
+
+    if retry_policy is None:
+        retry_policy = (
+            RetryPolicy.from_retry_opts(retry_opts) if retry_opts else get_retry_policy(settings, endpoint)
+        )
+
+    params = _encode_params(settings, method, params)
+    endpoints = get_endpoints(settings)
+    deadline = time.monotonic() + retry_policy.deadline
+    attempt = 0
+
+    while True:
+        attempt += 1
+        agent_url = endpoints.select()
+        try:
+            response = _do_request(
+                settings,
+                method,
+                endpoint,
+                params,
+                retry_policy,
+                timeout=deadline - time.monotonic(),
+                agent_url=agent_url,
+            )
+        except _TransferError as e:
+            failover = e.returncode in NETWORK_ERROR_CODES and endpoints.record_failure(agent_url)
+            if e.returncode == CONNECT_ERROR_CODE:
+                record_connect_failed(settings, agent_url)
+            if not retry_policy.should_retry(e.returncode, attempt):
+                _raise_transport_error(settings, endpoint, e.returncode, e.__cause__)
+            # Another endpoint is tried at once, the same one after a backoff
+            delay = 0 if failover else retry_policy.delay(attempt)
+            if delay >= deadline - time.monotonic():
+                logging.debug("%s: no time left for a retry", endpoint)
+                _raise_transport_error(settings, endpoint, e.returncode, e.__cause__)
+            logging.debug("%s: curl error %s, attempt %s", endpoint, e.returncode, attempt)
+        else:
+            failover = _record_endpoint_status(settings, agent_url, response.http_status)
+            if response.http_status not in libcurl.TRANSIENT_HTTP_CODES or attempt > retry_policy.retries:
+                return _result(response, busy_error)
+            delay = response.retry_after if response.retry_after is not None else retry_policy.delay(attempt)
+            if failover:
+                delay = 0
+            if delay >= deadline - time.monotonic():
+                return _result(response, busy_error)
+            logging.debug("%s: transient HTTP status %s, attempt %s", endpoint, response.http_status, attempt)
+
+        logging.debug(
+            "%s: retrying in %.1f s, %.1f s of %s s budget left",
+            endpoint,
+            delay,
+            deadline - time.monotonic(),
+            retry_policy.deadline,
+        )
+        # A retry without a default route would fail the same way, it waits for one
+        link_watcher.sleep(delay, offline_delay=deadline - time.monotonic())
+
+
+def _result(response: _Response, busy_error: bool) -> tuple[dict, int]:
+    if busy_error and response.http_status in CLOUD_BUSY_HTTP_CODES:
+        raise CloudBusyError(f"Cloud is busy, status {response.http_status}", response.retry_after)
+    return response.data, response.http_status
+
+
+def _encode_params(settings: AppSettings, method: str, params):
+    """Compress a JSON body once for all attempts, if the cloud accepts compressed bodies."""
+    if method not in ("post", "put", "delete") or not params:
+        return params
+    data, encoding = encode_json_body(settings, params)
+    return libcurl.RawBody(data, "application/json", encoding) if encoding is not None else params
+
+
+def _record_endpoint_status(settings: AppSettings, agent_url: str, http_status: int) -> bool:
+    """Returns True if the endpoint has failed and another one is available."""
+    endpoints = get_endpoints(settings)
+    if http_status in ENDPOINT_FAILOVER_HTTP_CODES:
+        return endpoints.record_failure(agent_url)
+    endpoints.record_success(agent_url)
+    return False
+
+
+def _do_request(  # pylint: disable=too-many-arguments
+    settings: AppSettings,
+    method: str,
+    endpoint: str,
+    params,
+    retry_policy: RetryPolicy,
+    *,
+    timeout: float,
+    agent_url: str,
+) -> _Response:
+    started = time.monotonic()
+    with outbound_slot(settings, endpoint, _body_size(params), retry_policy.bulk_rate) as limit_rate:
+        timeout -= time.monotonic() - started
+        if timeout <= 0:
+            raise _TransferError(28) from TimeoutError(
+                f"{endpoint} Request budget has been spent in the queue"
+            )
+        interface = select_interface(settings, endpoint)
+        try:
+            return _do_transport_request(
+                settings,
+                method,
+                endpoint,
+                params,
+                retry_policy,
+                timeout=timeout,
+                agent_url=agent_url,
+                limit_rate=limit_rate,
+                interface=interface,
+            )
+        except _TransferError as e:
+            # The retry goes over the next interface, the failed one waits for a successful probe
+            if interface is not None and e.returncode in NETWORK_ERROR_CODES:
+                record_interface_failure(settings, interface)
+            raise
+
+
+def _body_size(params) -> int:
+    if isinstance(params, libcurl.RawBody):
+        return len(params.data)
+    if isinstance(params, (str, os.PathLike)):
+        try:
+            return os.path.getsize(params)
+        except OSError:
+            return 0
+    return len(json.dumps(params)) if params else 0
+
+
+def _do_transport_request(  # pylint: disable=too-many-arguments
+    settings: AppSettings,
+    method: str,
+    endpoint: str,
+    params,
+    retry_policy: RetryPolicy,
+    *,
+    timeout: float,
+    agent_url: str,
+    limit_rate: Optional[int],
+    interface: Optional[str],
+) -> _Response:
+    # Retries are made by the agent, a single attempt gets the time left of the request budget
+    attempt_opts = (
+        "--connect-timeout",
+        f"{min(retry_policy.connect_timeout, timeout):g}",
+        "--retry",
+        "0",
+        "--max-time",
+        f"{timeout:g}",
+    )
+    if retry_policy.compressed:
+        attempt_opts += ("--compressed",)
+    if limit_rate is not None:
+        attempt_opts += ("--limit-rate", str(limit_rate))
+    if interface is not None:
+        attempt_opts += ("--interface", interface)
+
+    if settings.transport == "libcurl":
+        if libcurl.is_available():
+            return _do_libcurl(settings, method, endpoint, params, attempt_opts, agent_url=agent_url)
+        _log_transport_fallback(settings.transport, "python3-pycurl is not installed")
+    elif settings.transport == "uplink":
+        if os.path.exists(UPLINK_SOCKET):
+            return _do_uplink(
+                settings, method, endpoint, params, attempt_opts, timeout=timeout, agent_url=agent_url
+            )
+        _log_transport_fallback(settings.transport, "wb-cloud-agent-uplink is not running")
+
+    return _do_curl_subprocess(
+        settings, method, endpoint, params, attempt_opts, timeout=timeout, agent_url=agent_url
+    )
+
+
+@cache
+def curl_supports_ssl_sessions() -> bool:
+    """Check if curl can save TLS session tickets to a file (--ssl-sessions, curl >= 8.12)."""
+    try:
+        result = subprocess.run(["curl", "-V"], capture_output=True, check=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return b"SSLS-EXPORT" in result.stdout
+
+
+@cache
+def _log_transport_fallback(transport: str, reason: str) -> None:
+    logging.warning("Transport '%s' is not available (%s), using curl", transport, reason)
+
 
+def _do_libcurl(  # pylint: disable=too-many-arguments
+    settings: AppSettings, method: str, endpoint: str, params, retry_opts: Iterable[str], *, agent_url: str
+) -> _Response:
+    try:
+        headers, body, http_code = libcurl.perform(
+            settings, method, endpoint, params, retry_opts, agent_url=agent_url
+        )
+    except libcurl.LibcurlError as e:
+        raise _TransferError(e.returncode) from e
+
+    # libcurl.perform() has recorded traffic of the endpoint itself
+    stdout = headers + body + (DATA_DELIMITER + json.dumps({"code": str(http_code)})).encode("utf-8")
+    return _read_curl_output(settings, stdout)
+
+
+def _curl_command(method: str, params) -> list[str]:
+    accept = accept_header()
+    command = ["curl"] + (["-H", accept] if accept is not None else [])
+    if isinstance(params, libcurl.RawBody):
+        # Binary body is passed on stdin, see _curl_input()
+        command += ["-X", method.upper(), "-H", f"Content-Type: {params.content_type}"]
+        if params.content_encoding is not None:
+            command += ["-H", f"Content-Encoding: {params.content_encoding}"]
+        return command + ["--data-binary", "@-"]
     if method == "get":
-        command = ["curl"]
-    elif method in ("post", "put", "delete"):
-        command = ["curl", "-X", method.upper()]
+        return command
+    if method in ("post", "put", "delete"):
+        command += ["-X", method.upper()]
         if params:
             command += ["-H", "Content-Type: application/json", "-d", json.dumps(params)]
-    elif method == "multipart-post":
-        command = ["curl", "-X", "POST", "-F", f"file=@{params}"]
-    else:
-        raise ValueError("Invalid method: " + method)
+        return command
+    return command + ["-X", "POST", "-F", f"file=@{params}"]
+
+
+def _curl_input(params) -> Optional[bytes]:
+    return params.data if isinstance(params, libcurl.RawBody) else None
 
-    if not retry_opts:
-        retry_opts = [
-            "--connect-timeout",
-            "45",
-            "--retry",
-            "8",
-            "--retry-delay",
-            "1",
-            "--retry-all-errors",
-        ]
-
-    command += [
+
+def _run_curl(
+    command: list[str], timeout: float, data: Optional[bytes] = None
+) -> subprocess.CompletedProcess:
+    try:
+        # curl stops itself at --max-time, the margin is for a hung process only
+        result = subprocess.run(
+            command,
+            input=data,
+            timeout=timeout + SUBPROCESS_TIMEOUT_MARGIN_S,
+            check=True,
+            capture_output=True,
+        )
+    except subprocess.CalledProcessError as e:
+        raise _TransferError(e.returncode) from e
+    except subprocess.TimeoutExpired as e:
+        raise _TransferError(28) from e
+    return result
+
+
+def _do_uplink(  # pylint: disable=too-many-arguments,too-many-locals
+    settings: AppSettings,
+    method: str,
+    endpoint: str,
+    params,
+    retry_opts: Iterable[str],
+    *,
+    timeout: float,
+    agent_url: str,
+) -> _Response:
+    # TLS, the client certificate and the connection pool are owned by the uplink,
+    # the request to it is plain HTTP over the unix socket
+    command = _curl_command(method, params) + [
+        "--unix-socket",
+        UPLINK_SOCKET,
+        "-H",
+        f"{UPLINK_OPTIONS_HEADER}: {shlex.join(retry_opts)}",
+        "-H",
+        f"{UPLINK_AGENT_URL_HEADER}: {agent_url}",
+        "--max-time",
+        f"{timeout + SUBPROCESS_TIMEOUT_MARGIN_S:g}",
+        "-D",
+        "-",
+        "-w",
+        DATA_DELIMITER + '{"code":"%{response_code}"}',
+        f"http://uplink/{settings.provider_name}/{endpoint}",
+    ]
+    # The DNS cache is written by the agent only, the uplink connects to the address it gets
+    resolve_entry = get_resolve_entry(settings, agent_url + endpoint)
+    if resolve_entry is not None:
+        command[-1:-1] = ["-H", f"{UPLINK_RESOLVE_HEADER}: {resolve_entry}"]
+    stdout = _run_curl(command, timeout + SUBPROCESS_TIMEOUT_MARGIN_S, _curl_input(params)).stdout
+
+    header_section = stdout.split(b"\r\n\r\n", 1)[0].decode("utf-8", errors="replace")
+    response_headers = parse_headers(header_section)
+    # Bytes of the request to the uplink are local, the uplink reports the ones sent to the cloud
+    uplink_traffic = get_header(response_headers, UPLINK_TRAFFIC_HEADER)
+    if uplink_traffic is not None:
+        record_traffic(settings, endpoint, Traffic(*(int(value) for value in uplink_traffic.split())))
+    measurements = get_header(response_headers, UPLINK_MEASUREMENTS_HEADER)
+    if measurements is not None:
+        libcurl.record_measurements(settings, agent_url + endpoint, _parse_measurements(measurements))
+    uplink_error = get_header(response_headers, UPLINK_ERROR_HEADER)
+    if uplink_error is not None:
+        returncode = int(uplink_error)
+        raise _TransferError(returncode) from RuntimeError(
+            f"Uplink transfer has failed: curl error {returncode}"
+        )
+    return _read_curl_output(settings, stdout)
+
+
+def _parse_measurements(value: str) -> libcurl.Measurements:
+    """Measurements the uplink reports in name=value pairs, see uplink._measurements_header."""
+    measurements = libcurl.Measurements()
+    for pair in value.split():
+        name, _, number = pair.partition("=")
+        if name == "address":
+            measurements.address = number
+            continue
+        try:
+            if name == "rtt":
+                measurements.rtt = float(number)
+            else:
+                measurements.add(name, float(number))
+        except ValueError:
+            logging.debug("Invalid uplink measurement %r", pair)
+    return measurements
+
+
+def _do_curl_subprocess(  # pylint: disable=too-many-arguments
+    settings: AppSettings,
+    method: str,
+    endpoint: str,
+    params,
+    retry_opts: Iterable[str],
+    *,
+    timeout: float,
+    agent_url: str,
+) -> _Response:
+    output_format = DATA_DELIMITER + (
+        '{"code":"%{response_code}","url":"%{url_effective}","ip":"%{remote_ip}",'
+        '"dns_time":"%{time_namelookup}","connect_time":"%{time_connect}",'
+        '"size_request":"%{size_request}","size_upload":"%{size_upload}",'
+        '"size_header":"%{size_header}","size_download":"%{size_download}"}'
+    )
+
+    command = _curl_command(method, params) + [
         *retry_opts,
         "--cert",
         settings.client_cert_file,
@@ -60,57 +518,172 @@ def do_curl(
         "-",
         "-w",
         output_format,
-        settings.cloud_agent_url + endpoint,
+        agent_url + endpoint,
     ]
 
-    try:
-        result = subprocess.run(command, timeout=360, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        if e.returncode == 58:
-            raise RuntimeError(
-                CLIENT_CERT_ERROR_MSG.format(
-                    cert_file=settings.client_cert_file, cert_engine_key=settings.client_cert_engine_key
-                )
-            ) from e
-        if e.returncode in (6, 7, 28):
-            logging.debug(e)
-            raise CloudNetworkError(
-                f"{endpoint} Network error while accessing {settings.cloud_base_url}"
-            ) from e
-        raise e
+    resolve_entry = get_resolve_entry(settings, agent_url)
+    if resolve_entry is not None:
+        command[-1:-1] = ["--resolve", resolve_entry]
 
-    return handle_curl_output(settings, result.stdout)
+    # Each curl run is a new process: TLS session can be resumed only from a session file,
+    # verbose messages of the handshake tell if it has been
+    use_session_file = settings.tls_session_cache and curl_supports_ssl_sessions()
+    if use_session_file:
+        command[-1:-1] = ["--ssl-sessions", str(settings.tls_sessions_file), "-v"]
 
+    # A session may be expired or rejected, resumption is not known before the run: queue
+    # for the chip with other requests, but a curl process cannot tell when its handshake
+    # is done, so the chip is held for a bounded time only
+    with engine_access(settings, max_hold=ENGINE_HANDSHAKE_HOLD_S):
+        result = _run_curl(command, timeout, _curl_input(params))
 
-def handle_curl_output(settings: AppSettings, stdout: bytes) -> tuple[dict, int]:
-    decoded_output = stdout.decode("utf-8")
+    record_tls_handshake(settings, libcurl.tls_handshake_kind(result.stderr) if use_session_file else "full")
+    stdout = result.stdout
 
-    header_section, decoded_result = decoded_output.split("\r\n\r\n", 1)
+    return _read_curl_output(settings, stdout, endpoint=endpoint)
+
+
+def _raise_transport_error(
+    settings: AppSettings, endpoint: str, returncode: int, exc: Optional[BaseException]
+) -> NoReturn:
+    if returncode == CLIENT_CERT_ERROR_CODE and settings.engine_checked:
+        # Key and cert have been checked at startup, the chip failed a signature this time
+        raise CloudNetworkError(f"{endpoint} Client key operation failed on the crypto chip") from exc
+    if returncode == CLIENT_CERT_ERROR_CODE:
+        raise RuntimeError(
+            CLIENT_CERT_ERROR_MSG.format(
+                cert_file=settings.client_cert_file, cert_engine_key=settings.client_cert_engine_key
+            )
+        ) from exc
+    if returncode in NETWORK_ERROR_CODES:
+        logging.debug(exc)
+        raise CloudNetworkError(
+            f"{endpoint} Network error while accessing {settings.cloud_base_url}"
+        ) from exc
+    if exc is None:
+        raise RuntimeError(f"{endpoint} curl error {returncode} while accessing {settings.cloud_base_url}")
+    raise exc
 
-    response_headers = parse_headers(header_section)
-    poll_interval = int(response_headers.get("x-poll-interval", settings.request_period_seconds))
 
-    if poll_interval != settings.request_period_seconds:
+def apply_response_headers(settings: AppSettings, response_headers: dict[str, str]) -> None:
+    """Apply agent settings the cloud sends in response headers."""
+    poll_interval = _number_header(response_headers, "x-poll-interval", int)
+    tuned = (settings.request_period_seconds, settings.metrics_log_enabled)
+
+    if poll_interval is not None and poll_interval != settings.request_period_seconds:
         settings.request_period_seconds = poll_interval
         logging.debug("A new poll interval has been set: %s", settings.request_period_seconds)
 
-    metrics_log_enabled_str = response_headers.get("x-metrics-log-enabled")
+    metrics_log_enabled_str = get_header(response_headers, "x-metrics-log-enabled")
     if metrics_log_enabled_str is not None:
         settings.metrics_log_enabled = metrics_log_enabled_str.strip() == "1"
         logging.debug("Metrics log reporting enabled: %s", settings.metrics_log_enabled)
 
-    split_result = decoded_result.split(DATA_DELIMITER)
-    if len(split_result) != 2:
-        raise ValueError(f"Invalid data in response: {split_result}")
+    if (settings.request_period_seconds, settings.metrics_log_enabled) != tuned:
+        # Restored on a warm restart
+        get_snapshot(settings).save_tuned(settings)
+
+    long_poll_timeout = _number_header(response_headers, "x-long-poll-timeout", int)
+    if long_poll_timeout is not None and settings.long_poll_enabled:
+        long_poll_timeout = max(0, min(long_poll_timeout, LONG_POLL_MAX_TIMEOUT_S))
+        if long_poll_timeout != settings.long_poll_timeout:
+            settings.long_poll_timeout = long_poll_timeout
+            logging.debug("A new long-poll timeout has been set: %s", settings.long_poll_timeout)
+
+    events_pending = _number_header(response_headers, "x-events-pending", int)
+    if events_pending is not None:
+        settings.events_pending = max(0, events_pending)
 
+    poll_phase = _number_header(response_headers, "x-poll-phase", float)
+    if poll_phase is not None and poll_phase != settings.poll_phase:
+        settings.poll_phase = poll_phase
+        logging.debug("A new poll phase has been set: %s", settings.poll_phase)
+
+    accept_encoding_str = get_header(response_headers, "accept-encoding")
+    if accept_encoding_str is not None:
+        update_request_encoding(settings, accept_encoding_str)
+
+    tuning_str = get_header(response_headers, "x-agent-tuning")
+    if tuning_str is not None:
+        tuning = get_tuning(settings)
+        tuning.update(tuning_str)
+        long_poll_timeout = tuning.for_endpoint("events/").get("long_poll_timeout")
+        if long_poll_timeout is not None and settings.long_poll_enabled:
+            settings.long_poll_timeout = long_poll_timeout
+
+
+def _number_header(response_headers: dict[str, str], name: str, value_type: type) -> Optional[Any]:
+    """Value of a numeric header, None if it is missing or malformed (then it is logged and ignored)."""
+    value_str = get_header(response_headers, name)
+    if value_str is None:
+        return None
     try:
-        data = json.loads(split_result[0])
-    except json.JSONDecodeError:
-        data = {}
+        value = value_type(value_str)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value):
+        logging.warning("Ignoring invalid %s header: %r", name, value_str)
+        return None
+    return value
+
+
+def handle_curl_output(
+    settings: AppSettings, stdout: bytes, endpoint: Optional[str] = None
+) -> tuple[dict, int]:
+    """
+    Response body and HTTP status of curl output: headers (-D -), body and meta (-w).
+
+    The body is decoded by its content type, JSON or msgpack. Meta has the status code
+    and, from a curl run, the connection details and the transfer sizes, recorded
+    as the traffic of the endpoint if it is given.
+    """
+    response = _read_curl_output(settings, stdout, endpoint)
+    return response.data, response.http_status
+
+
+def _read_curl_output(settings: AppSettings, stdout: bytes, endpoint: Optional[str] = None) -> _Response:
+    header_bytes, separator, result = stdout.partition(b"\r\n\r\n")
+    if not separator:
+        raise ValueError(f"Invalid data in response: {stdout!r}")
+
+    response_headers = parse_headers(header_bytes.decode("utf-8", errors="replace"))
+    apply_response_headers(settings, response_headers)
+
+    body, separator, meta_bytes = result.rpartition(DATA_DELIMITER.encode("utf-8"))
+    if not separator:
+        raise ValueError(f"Invalid data in response: {result!r}")
 
     try:
-        status_code = int(json.loads(split_result[1])["code"])
-    except (KeyError, TypeError, ValueError, json.JSONDecodeError) as e:
-        raise ValueError(f"Invalid data in response: {split_result}") from e
+        meta = json.loads(meta_bytes)
+        status_code = int(meta["code"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid data in response: {result!r}") from e
+
+    data = decode_body(body, get_header(response_headers, "content-type"))
+    record_payload(settings, received=len(body), received_wire=int(float(meta.get("size_download", 0))))
+    _record_transfer_meta(settings, meta, endpoint)
+
+    return _Response(data, status_code, _get_retry_after(response_headers))
+
+
+def _get_retry_after(response_headers: dict[str, str]) -> Optional[float]:
+    retry_after_str = get_header(response_headers, "retry-after")
+    retry_after = parse_retry_after(retry_after_str) if retry_after_str is not None else None
+    return min(retry_after, RETRY_AFTER_MAX_S) if retry_after is not None else None
+
+
+def _record_transfer_meta(settings: AppSettings, meta: dict, endpoint: Optional[str]) -> None:
+    if meta.get("ip") and meta.get("url"):
+        record_connected(settings, meta["url"], meta["ip"])
+        connect_time = float(meta.get("connect_time", 0)) - float(meta.get("dns_time", 0))
+        if connect_time > 0:
+            record_rtt(settings, meta["url"], connect_time)
 
-    return data, status_code
+    if endpoint is not None and "size_request" in meta:
+        # TLS bytes are not reported by the curl tool
+        traffic = Traffic(
+            sent=int(float(meta["size_request"]) + float(meta.get("size_upload", 0))),
+            received=int(float(meta.get("size_header", 0)) + float(meta.get("size_download", 0))),
+            requests=1,
+        )
+        record_traffic(settings, endpoint, traffic)
@@ -1,8 +1,35 @@
 import logging
+import time
 from http import HTTPStatus as status
 
+from wb.cloud_agent.constants import DIAGNOSTICS_DEFER_MAX_S, METERED_CHECK_INTERVAL_S
 from wb.cloud_agent.handlers.curl import do_curl
+from wb.cloud_agent.paths import unmetered_bulk_path
 from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.traffic import data_saver_active, metered_link
+
+
+def _upload_metered(settings: AppSettings) -> bool:
+    return data_saver_active(settings) and metered_link.is_metered() and not unmetered_bulk_path(settings)
+
+
+def wait_for_unmetered_link(settings: AppSettings) -> None:
+    """
+    In data saver mode wait until uploads go over a non-metered link
+    (the default route or the interface of bulk requests), for a day at most.
+    """
+    deadline = time.monotonic() + DIAGNOSTICS_DEFER_MAX_S
+    if not _upload_metered(settings):
+        return
+
+    logging.info("Data saver: diagnostics upload is deferred until a non-metered link is up")
+    while _upload_metered(settings):
+        if time.monotonic() >= deadline:
+            logging.warning(
+                "No non-metered link for %d s, uploading diagnostics anyway", DIAGNOSTICS_DEFER_MAX_S
+            )
+            return
+        time.sleep(METERED_CHECK_INTERVAL_S)
 
 
 def upload_diagnostic(settings: AppSettings) -> None:
@@ -19,6 +46,7 @@ def upload_diagnostic(settings: AppSettings) -> None:
 
     last_diagnostic = files[-1]
     logging.info("Diagnostics collected: %s", last_diagnostic)
+    wait_for_unmetered_link(settings)
 
     _status_data, http_status = do_curl(
         settings=settings, method="multipart-post", endpoint="upload-diagnostic/", params=last_diagnostic
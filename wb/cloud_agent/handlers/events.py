@@ -1,8 +1,15 @@
 import logging
+import time
+from collections.abc import Callable
 from http import HTTPStatus as status
-
-from wb.cloud_agent.constants import UNBIND_CTRL_REQUEST_TIMEOUT
-from wb.cloud_agent.handlers.curl import do_curl
+from typing import Optional
+
+from wb.cloud_agent.constants import (
+    DATA_SAVER_LONG_POLL_TIMEOUT_S,
+    LONG_POLL_TIMEOUT_MARGIN_S,
+    UNBIND_CTRL_REQUEST_TIMEOUT,
+)
+from wb.cloud_agent.handlers.curl import RetryPolicy, do_curl
 from wb.cloud_agent.handlers.provider import delete_provider
 from wb.cloud_agent.mqtt import MQTTCloudAgent
 from wb.cloud_agent.services.activation import update_activation_link
@@ -10,6 +17,7 @@ from wb.cloud_agent.services.diagnostics import fetch_diagnostics
 from wb.cloud_agent.services.metrics import update_metrics_config
 from wb.cloud_agent.services.tunnel import update_tunnel_config
 from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.traffic import data_saver_active
 
 HANDLERS = {
     "update_activation_link": update_activation_link,
@@ -24,16 +32,134 @@ POST_HANDLERS = {
 }
 
 
-def make_event_request(settings: AppSettings, mqtt: MQTTCloudAgent):
-    event_data, http_status = do_curl(settings=settings, method="get", endpoint="events/")
-    logging.debug("Checked for new events. Status %s. Data: %s", http_status, event_data)
+def long_poll_active(settings: AppSettings) -> bool:
+    """Long-poll is used when enabled locally and the cloud has set its timeout."""
+    return bool(settings.long_poll_enabled and settings.long_poll_timeout > 0)
+
+
+class EventBacklog:
+    """
+    Tracks draining of events queued in the cloud.
+
+    While the cloud returns events they are requested back-to-back,
+    the normal poll period is used again once there is nothing left (204).
+    """
+
+    def __init__(self) -> None:
+        self.draining_since: Optional[float] = None
+        self.drained = 0
+
+    @property
+    def draining(self) -> bool:
+        return self.draining_since is not None
+
+    def update(self, settings: AppSettings, handled: int) -> None:
+        if handled:
+            if not self.draining:
+                self.draining_since = time.monotonic()
+                self.drained = 0
+                if settings.events_pending:
+                    logging.info("Cloud has %s more pending events, fetching them", settings.events_pending)
+            self.drained += handled
+            # Cloud reports an empty queue, no need to make a request just to get 204
+            if settings.events_pending != 0:
+                return
+
+        if self.draining:
+            logging.log(
+                logging.INFO if self.drained > 1 else logging.DEBUG,
+                "Event queue drained: %d events in %.1f s",
+                self.drained,
+                time.monotonic() - self.draining_since,
+            )
+            self.draining_since = None
+
+
+def make_event_request(settings: AppSettings, mqtt: MQTTCloudAgent) -> int:
+    """Fetch and handle queued events, returns the number of handled events."""
+    # A cloud without batch support ignores limit and returns a single event
+    endpoint = f"events/?limit={settings.events_batch_size}"
+    if long_poll_active(settings):
+        # The cloud holds the request until an event arrives or the timeout expires (204)
+        wait = settings.long_poll_timeout
+        if data_saver_active(settings):
+            # Fewer requests per hour, each one costs headers and often a TLS handshake
+            wait = max(wait, DATA_SAVER_LONG_POLL_TIMEOUT_S)
+        endpoint += f"&wait={wait}"
+        retry_policy = RetryPolicy(deadline=wait + LONG_POLL_TIMEOUT_MARGIN_S, retries=0)
+    else:
+        retry_policy = None
+
+    settings.events_pending = None
+    # The delay a busy cloud asks for comes with its response, other requests don't clobber it
+    event_data, http_status = do_curl(
+        settings=settings, method="get", endpoint=endpoint, retry_policy=retry_policy, busy_error=True
+    )
+    logging.debug(
+        "Checked for new events. Status %s, pending %s. Data: %s",
+        http_status,
+        settings.events_pending,
+        event_data,
+    )
 
     if http_status == status.NO_CONTENT:
-        return
+        return 0
 
     if http_status != status.OK:
         raise ValueError(f"Not a {status.OK} status while retrieving event: {http_status}")
 
+    if "events" in event_data:
+        handle_events(settings, event_data["events"], mqtt)
+        return len(event_data["events"])
+
+    handle_event(settings, event_data, mqtt, lambda event_id: event_confirm(settings, event_id))
+    return 1
+
+
+def handle_events(settings: AppSettings, events: list[dict], mqtt: MQTTCloudAgent) -> None:
+    """
+    Run handlers of a batch of events in order, confirm all handled events at once,
+    then run their post-handlers.
+
+    If an event fails, the events handled before it are still confirmed and post-handled,
+    then its error is raised; the rest of the batch is left for the next request.
+    """
+    handled = []
+    error = None
+    try:
+        for event_data in events:
+            run_event_handler(settings, event_data, mqtt)
+            handled.append(event_data)
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        error = exc
+
+    if handled:
+        try:
+            events_confirm(settings, [event_data["id"] for event_data in handled])
+        except Exception as exc:
+            if error is None:
+                raise
+            # Not confirmed events come again, the error of the failed one matters more
+            logging.warning("Cannot confirm events handled before a failed one: %s", exc)
+            raise error from exc
+
+        for event_data in handled:
+            run_event_post_handler(settings, event_data, mqtt)
+
+    if error is not None:
+        raise error
+
+
+def handle_event(
+    settings: AppSettings, event_data: dict, mqtt: MQTTCloudAgent, confirm: Callable[[str], None]
+) -> None:
+    """Run the event handler, confirm the event, then run its post-handler."""
+    confirm(run_event_handler(settings, event_data, mqtt))
+    run_event_post_handler(settings, event_data, mqtt)
+
+
+def run_event_handler(settings: AppSettings, event_data: dict, mqtt: MQTTCloudAgent) -> str:
+    """Validate the event and run its handler, returns the event id to confirm."""
     code = event_data.get("code", "")
     handler = HANDLERS.get(code)
 
@@ -51,12 +177,14 @@ def make_event_request(settings: AppSettings, mqtt: MQTTCloudAgent):
         logging.warning("Got an unknown event '%s'. Try to update wb-cloud-agent package.", code)
 
     logging.debug("Event '%s' handled successfully, event id %s", code, event_id)
+    return event_id
 
-    event_confirm(settings, event_id)
 
-    post_handler = POST_HANDLERS.get(code)
+def run_event_post_handler(settings: AppSettings, event_data: dict, mqtt: MQTTCloudAgent) -> None:
+    """Run the actions which must happen only after the event is confirmed."""
+    post_handler = POST_HANDLERS.get(event_data.get("code", ""))
     if post_handler:
-        post_handler(settings, payload, mqtt)
+        post_handler(settings, event_data["payload"], mqtt)
 
 
 def event_confirm(settings: AppSettings, event_id: str) -> None:
@@ -67,18 +195,21 @@ def event_confirm(settings: AppSettings, event_id: str) -> None:
         raise ValueError(f"Not a {status.NO_CONTENT} status on event confirmation: {http_status}")
 
 
+def events_confirm(settings: AppSettings, event_ids: list[str]) -> None:
+    _event_data, http_status = do_curl(
+        settings=settings, method="post", endpoint="events/confirm/", params={"ids": event_ids}
+    )
+    if http_status != status.NO_CONTENT:
+        raise ValueError(f"Not a {status.NO_CONTENT} status on events confirmation: {http_status}")
+
+
 def event_delete_controller(settings: AppSettings) -> int:
-    retry_opts = (
-        "--connect-timeout",
-        str(UNBIND_CTRL_REQUEST_TIMEOUT - 1),
-        "--retry",
-        "0",
-        "--max-time",
-        str(UNBIND_CTRL_REQUEST_TIMEOUT),
+    retry_policy = RetryPolicy(
+        deadline=UNBIND_CTRL_REQUEST_TIMEOUT, connect_timeout=UNBIND_CTRL_REQUEST_TIMEOUT - 1, retries=0
     )
     try:
         _event_data, http_status = do_curl(
-            settings=settings, method="delete", endpoint="delete-controller/", retry_opts=retry_opts
+            settings=settings, method="delete", endpoint="delete-controller/", retry_policy=retry_policy
         )
     except Exception as exc:  # pylint: disable=W0718
         logging.warning(
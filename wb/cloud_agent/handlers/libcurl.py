@@ -0,0 +1,588 @@
+import json
+import logging
+import re
+import select
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cache
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+try:
+    import pycurl
+except ImportError:  # python3-pycurl is optional, curl backend is used instead
+    pycurl = None
+
+from wb.cloud_agent.endpoints import get_endpoints, record_rtt
+from wb.cloud_agent.engine import arbiter, engine_access, engine_use_counters
+from wb.cloud_agent.payload import accept_header
+from wb.cloud_agent.resolver import get_resolve_entry, record_connected
+from wb.cloud_agent.stats import get_counters
+from wb.cloud_agent.traffic import Traffic, record_traffic, tcp_bytes
+from wb.cloud_agent.utils import get_header, parse_headers, parse_retry_after
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+REQUEST_TIMEOUT_S = 360
+MAX_RETRY_DELAY_S = 600
+WS_RECV_BUFFER_SIZE = 64 * 1024
+WS_SEND_TIMEOUT_S = 30
+
+# Errors treated as transient by curl's --retry (without --retry-all-errors)
+TRANSIENT_CURL_CODES = (28,)
+TRANSIENT_HTTP_CODES = (408, 429, 500, 502, 503, 504)
+
+# libcurl (and curl -v) verbose messages printed when a cached TLS session is offered
+# to the server, when a TLS handshake starts and when it is done. Certificates are
+# exchanged in a full handshake only, so a session offered but rejected is told by them.
+TLS_SESSION_REUSE_MARKER = re.compile(rb"SSL re-?using session")
+TLS_CERTIFICATE_MARKER = re.compile(rb"TLS handshake, Certificate \(11\)")
+TLS_HANDSHAKE_START_MARKER = re.compile(rb"TLS handshake, Client hello")
+TLS_HANDSHAKE_DONE_MARKER = re.compile(rb"SSL connection using")
+
+
+class LibcurlError(Exception):
+    """libcurl transfer error, carries the same exit code the curl tool would return."""
+
+    def __init__(self, returncode: int, message: str) -> None:
+        super().__init__(message)
+        self.returncode = returncode
+
+
+def tls_handshake_kind(verbose_output: bytes) -> str:
+    """ "resumed" or "full" by verbose messages of a TLS handshake."""
+    if TLS_SESSION_REUSE_MARKER.search(verbose_output) and not TLS_CERTIFICATE_MARKER.search(verbose_output):
+        return "resumed"
+    return "full"
+
+
+@dataclass
+class Measurements:
+    """
+    Stats counters (see stats.Counters) and connection details measured by requests.
+
+    The uplink reports them to the agents: only the agent of a provider writes its data files.
+    """
+
+    counters: dict[str, float] = field(default_factory=dict)
+    address: Optional[str] = None  # connected to by the last new connection
+    rtt: Optional[float] = None  # of the last new connection, seconds
+
+    def add(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+def record_measurements(settings: "AppSettings", url: str, measurements: Measurements) -> None:
+    counters = get_counters(settings)
+    for name, value in measurements.counters.items():
+        counters.add(name, value)
+    if measurements.address:
+        record_connected(settings, url, measurements.address)
+    if measurements.rtt is not None:
+        record_rtt(settings, url, measurements.rtt)
+
+
+def _to_libcurl_error(e: Exception) -> LibcurlError:
+    return LibcurlError(e.args[0], f"libcurl error {e.args[0]}: {e.args[-1]}")
+
+
+@dataclass
+class RetryOptions:  # pylint: disable=too-many-instance-attributes
+    """Subset of curl command line transfer options understood by the libcurl backend."""
+
+    connect_timeout: Optional[float] = None
+    retries: int = 0
+    retry_delay: Optional[float] = None
+    retry_all_errors: bool = False
+    retry_max_time: Optional[float] = None
+    max_time: Optional[float] = None
+    compressed: bool = False
+    limit_rate: Optional[int] = None
+    interface: Optional[str] = None
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if self.retry_delay is not None:
+            return self.retry_delay
+        if retry_after is not None:
+            return retry_after
+        return min(2 ** (attempt - 1), MAX_RETRY_DELAY_S)
+
+
+def parse_retry_opts(retry_opts: Iterable[str]) -> RetryOptions:
+    opts = RetryOptions()
+    args = iter(retry_opts)
+    for arg in args:
+        if arg == "--connect-timeout":
+            opts.connect_timeout = float(next(args))
+        elif arg == "--retry":
+            opts.retries = int(next(args))
+        elif arg == "--retry-delay":
+            opts.retry_delay = float(next(args))
+        elif arg == "--retry-all-errors":
+            opts.retry_all_errors = True
+        elif arg == "--retry-max-time":
+            opts.retry_max_time = float(next(args))
+        elif arg in ("-m", "--max-time"):
+            opts.max_time = float(next(args))
+        elif arg == "--compressed":
+            opts.compressed = True
+        elif arg == "--limit-rate":
+            opts.limit_rate = int(float(next(args)))
+        elif arg == "--interface":
+            opts.interface = next(args)
+        else:
+            logging.debug("Curl option %s is not supported by libcurl transport, ignored", arg)
+    return opts
+
+
+# Pool of idle libcurl handles: keep-alive connections, DNS cache and TLS sessions
+# survive between requests instead of being rebuilt by a new curl process every time.
+# A pool instead of a handle per thread, so short-lived threads (e.g. the uplink's
+# per-connection ones) reuse connections too.
+_idle_handles: list["pycurl.Curl"] = []
+_idle_handles_lock = threading.Lock()
+
+# Last TCP byte counters of pooled connections by socket, to measure the next request on them
+_tcp_readings: dict[int, tuple[int, int]] = {}
+_tcp_readings_lock = threading.Lock()
+
+# Origin (scheme://host:port) of the last request of pooled handles, by id of the handle
+_handle_origins: dict[int, str] = {}
+
+
+@dataclass
+class RawBody:
+    """Request body passed to the cloud as is."""
+
+    data: bytes
+    content_type: str
+    content_encoding: Optional[str] = None
+
+
+def is_available() -> bool:
+    return pycurl is not None
+
+
+@cache
+def _get_share() -> "pycurl.CurlShare":
+    # Handles of all threads share TLS sessions and DNS cache, so a new connection
+    # (after keep-alive expiry or from another thread) resumes the TLS session
+    # instead of doing a full handshake with a signature on the crypto chip
+    share = pycurl.CurlShare()
+    share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+    share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+    return share
+
+
+@contextmanager
+def _acquire_handle() -> Iterator["pycurl.Curl"]:
+    with _idle_handles_lock:
+        handle = _idle_handles.pop() if _idle_handles else None
+    if handle is None:
+        handle = pycurl.Curl()
+        # Share stays attached to the handle across reset()
+        handle.setopt(pycurl.SHARE, _get_share())
+    try:
+        yield handle
+    finally:
+        with _idle_handles_lock:
+            _idle_handles.append(handle)
+
+
+def perform(  # pylint: disable=too-many-arguments
+    settings: "AppSettings",
+    method: str,
+    endpoint: str,
+    params,
+    retry_opts: Iterable[str],
+    *,
+    agent_url: Optional[str] = None,
+    traffic: Optional[Traffic] = None,
+    measurements: Optional[Measurements] = None,
+    resolve_entry: Optional[str] = None,
+) -> tuple[bytes, bytes, int]:
+    """Make a request, retrying it like curl would do with the same retry options.
+
+    The request goes to agent_url (the provider's agent URL by default).
+    Bytes of all attempts are added to traffic if it is given, recorded for the endpoint otherwise.
+    Other measurements are added to measurements if it is given, recorded for the provider
+    otherwise. A caller that takes them owns the DNS cache too, it passes resolve_entry
+    (see resolver.get_resolve_entry) or the system resolver is used.
+    Returns raw response headers of the last response, its body and HTTP status code.
+    """
+    url = (agent_url or settings.cloud_agent_url) + endpoint
+    measured_traffic = Traffic() if traffic is None else traffic
+    measured = Measurements() if measurements is None else measurements
+    if measurements is None:
+        resolve_entry = get_resolve_entry(settings, url)
+    try:
+        return _perform_retrying(
+            settings,
+            method,
+            endpoint,
+            params,
+            parse_retry_opts(retry_opts),
+            url=url,
+            resolve_entry=resolve_entry,
+            traffic=measured_traffic,
+            measured=measured,
+        )
+    finally:
+        if traffic is None and measured_traffic.requests:
+            record_traffic(settings, endpoint, measured_traffic)
+        if measurements is None:
+            record_measurements(settings, url, measured)
+
+
+def _perform_retrying(  # pylint: disable=too-many-arguments,too-many-locals
+    settings: "AppSettings",
+    method: str,
+    endpoint: str,
+    params,
+    opts: RetryOptions,
+    *,
+    url: str,
+    resolve_entry: Optional[str],
+    traffic: Traffic,
+    measured: Measurements,
+) -> tuple[bytes, bytes, int]:
+    started = time.monotonic()
+    attempt = 0
+
+    while True:
+        attempt += 1
+        try:
+            response = _perform_once(
+                settings,
+                method,
+                url,
+                params,
+                opts,
+                resolve_entry=resolve_entry,
+                traffic=traffic,
+                measured=measured,
+            )
+            error = None
+            if response[2] not in TRANSIENT_HTTP_CODES or attempt > opts.retries:
+                return response
+            logging.debug("%s: transient HTTP status %s, attempt %s", endpoint, response[2], attempt)
+        except pycurl.error as e:
+            error = e
+            if not (opts.retry_all_errors or e.args[0] in TRANSIENT_CURL_CODES) or attempt > opts.retries:
+                raise _to_libcurl_error(e) from e
+            logging.debug("%s: libcurl error %s (%s), attempt %s", endpoint, e.args[0], e.args[-1], attempt)
+
+        delay = opts.delay(attempt, _get_retry_after(response[0]) if error is None else None)
+        elapsed = time.monotonic() - started + delay
+        if opts.retry_max_time is not None and elapsed > opts.retry_max_time:
+            # Like curl, stop retrying and report the last result
+            if error is not None:
+                raise _to_libcurl_error(error) from error
+            return response
+        if elapsed > REQUEST_TIMEOUT_S:
+            raise LibcurlError(28, f"{endpoint} request retries exceeded {REQUEST_TIMEOUT_S}s")
+        time.sleep(delay)
+
+
+def _get_retry_after(headers: bytes) -> Optional[float]:
+    value = get_header(parse_headers(headers.decode("iso-8859-1")), "retry-after")
+    return parse_retry_after(value) if value is not None else None
+
+
+def _setup_client_cert(handle: "pycurl.Curl", settings: "AppSettings") -> None:
+    handle.setopt(pycurl.SSLENGINE, "ateccx08")
+    handle.setopt(pycurl.SSLENGINE_DEFAULT, 1)
+    handle.setopt(pycurl.SSLCERT, settings.client_cert_file)
+    handle.setopt(pycurl.SSLKEYTYPE, "ENG")
+    handle.setopt(pycurl.SSLKEY, settings.client_cert_engine_key)
+    if not settings.tls_session_cache:
+        handle.setopt(pycurl.SSL_SESSIONID_CACHE, 0)
+
+
+def _perform_once(  # pylint: disable=too-many-arguments
+    settings: "AppSettings",
+    method: str,
+    url: str,
+    params,
+    opts: RetryOptions,
+    *,
+    resolve_entry: Optional[str],
+    traffic: Traffic,
+    measured: Measurements,
+) -> tuple[bytes, bytes, int]:
+    with _acquire_handle() as handle:
+        return _perform_with_handle(
+            settings,
+            method,
+            url,
+            params,
+            opts,
+            handle=handle,
+            resolve_entry=resolve_entry,
+            traffic=traffic,
+            measured=measured,
+        )
+
+
+def _connection_alive(handle: "pycurl.Curl", url: str) -> bool:
+    """The handle keeps a live connection to the origin of the URL, a request will reuse it."""
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    alive = _handle_origins.get(id(handle)) == origin and handle.getinfo(pycurl.ACTIVESOCKET) != -1
+    _handle_origins[id(handle)] = origin  # handles are used by one thread at a time
+    return alive
+
+
+def _perform_with_handle(  # pylint: disable=too-many-arguments,too-many-locals
+    settings: "AppSettings",
+    method: str,
+    url: str,
+    params,
+    opts: RetryOptions,
+    *,
+    handle: "pycurl.Curl",
+    resolve_entry: Optional[str],
+    traffic: Traffic,
+    measured: Measurements,
+) -> tuple[bytes, bytes, int]:
+    # Verbose messages tell when a handshake is done and whether it has resumed the session,
+    # they are turned on only when a handshake is expected: they cost CPU on every request
+    expect_handshake = not _connection_alive(handle, url)
+    # Resets options only, live connections and session caches are kept
+    handle.reset()
+
+    header_lines: list[bytes] = []
+    body = bytearray()
+    handshake_messages: list[bytes] = []
+    # The client key signs during the TLS handshake only, the chip is held just for it
+    engine_wait: Optional[float] = None
+
+    def on_header(line: bytes) -> None:
+        # Keep only the final response (skip "100 Continue" and redirects)
+        if line.startswith(b"HTTP/"):
+            header_lines.clear()
+        header_lines.append(line)
+        # Without verbose messages the handshake is known to be done by the response
+        if not expect_handshake:
+            release_engine()
+
+    def release_engine() -> None:
+        nonlocal engine_wait
+        if engine_wait is not None:
+            for name, value in engine_use_counters(engine_wait, arbiter.release()).items():
+                measured.add(name, value)
+            engine_wait = None
+
+    def on_debug(infotype: int, message: bytes) -> None:
+        nonlocal engine_wait
+        if infotype != pycurl.INFOTYPE_TEXT:
+            return
+        handshake_messages.append(message)
+        if TLS_HANDSHAKE_START_MARKER.search(message) and engine_wait is None:
+            engine_wait = arbiter.acquire()
+        elif TLS_HANDSHAKE_DONE_MARKER.search(message):
+            release_engine()
+
+    def on_new_socket(_fd: int, _purpose: int) -> int:
+        nonlocal engine_wait
+        # The kept connection has been closed after all, a handshake follows the new one
+        if engine_wait is None:
+            engine_wait = arbiter.acquire()
+        return 0  # CURL_SOCKOPT_OK
+
+    handle.setopt(pycurl.URL, url)
+    handle.setopt(pycurl.NOSIGNAL, 1)
+    handle.setopt(pycurl.TCP_KEEPALIVE, 1)
+    if resolve_entry is not None:
+        handle.setopt(pycurl.RESOLVE, [resolve_entry])
+    handle.setopt(pycurl.HEADERFUNCTION, on_header)
+    handle.setopt(pycurl.WRITEFUNCTION, body.extend)
+    if expect_handshake:
+        handle.setopt(pycurl.VERBOSE, 1)
+        handle.setopt(pycurl.DEBUGFUNCTION, on_debug)
+    else:
+        handle.setopt(pycurl.SOCKOPTFUNCTION, on_new_socket)
+
+    _setup_client_cert(handle, settings)
+    _setup_transfer_options(handle, opts)
+
+    _setup_request_body(handle, method, params)
+
+    try:
+        handle.perform()
+    finally:
+        release_engine()
+
+    # Body is decoded by libcurl, its size before decoding is counted here (see payload.record_payload)
+    received_wire = int(handle.getinfo(pycurl.SIZE_DOWNLOAD))
+    if received_wire:
+        measured.add("body_bytes_received_wire", received_wire)
+    traffic.add(_measure_traffic(handle))
+
+    _measure_connection(handle, b"".join(handshake_messages), measured)
+    return b"".join(header_lines), bytes(body), handle.getinfo(pycurl.RESPONSE_CODE)
+
+
+def _measure_connection(handle: "pycurl.Curl", verbose: bytes, measured: Measurements) -> None:
+    # Counted by the way the TLS connection was set up, see stats.record_tls_handshake
+    if handle.getinfo(pycurl.NUM_CONNECTS) == 0:
+        measured.add("tls_reused")
+        return
+    measured.address = handle.getinfo(pycurl.PRIMARY_IP)
+    measured.rtt = handle.getinfo(pycurl.CONNECT_TIME) - handle.getinfo(pycurl.NAMELOOKUP_TIME)
+    # Resumption is not confirmed without verbose messages, the handshake counts as a full one
+    measured.add(f"tls_{tls_handshake_kind(verbose)}")
+
+
+def _setup_transfer_options(handle: "pycurl.Curl", opts: RetryOptions) -> None:
+    if opts.connect_timeout is not None:
+        handle.setopt(pycurl.CONNECTTIMEOUT_MS, int(opts.connect_timeout * 1000))
+    handle.setopt(pycurl.TIMEOUT_MS, int((opts.max_time or REQUEST_TIMEOUT_S) * 1000))
+    if opts.compressed:
+        handle.setopt(pycurl.ENCODING, "")  # all encodings libcurl supports
+    if opts.limit_rate is not None:
+        handle.setopt(pycurl.MAX_SEND_SPEED_LARGE, opts.limit_rate)
+        handle.setopt(pycurl.MAX_RECV_SPEED_LARGE, opts.limit_rate)
+    if opts.interface is not None:
+        handle.setopt(pycurl.INTERFACE, opts.interface)
+
+
+def _measure_traffic(handle: "pycurl.Curl") -> Traffic:
+    """HTTP bytes of the transfer, with TLS overhead from the TCP counters of its connection."""
+    traffic = Traffic(
+        sent=int(handle.getinfo(pycurl.REQUEST_SIZE) + handle.getinfo(pycurl.SIZE_UPLOAD)),
+        received=int(handle.getinfo(pycurl.HEADER_SIZE) + handle.getinfo(pycurl.SIZE_DOWNLOAD)),
+        requests=1,
+    )
+    fd = handle.getinfo(pycurl.ACTIVESOCKET)
+    reading = tcp_bytes(fd)
+    if reading is None:
+        return traffic
+
+    with _tcp_readings_lock:
+        # A new connection starts from zero, a reused one from where its previous request ended
+        baseline = (0, 0) if handle.getinfo(pycurl.NUM_CONNECTS) else _tcp_readings.get(fd)
+        _tcp_readings[fd] = reading
+    if baseline is not None:
+        tcp_total = reading[0] - baseline[0] + reading[1] - baseline[1]
+        traffic.tls = max(0, tcp_total - traffic.sent - traffic.received)
+    return traffic
+
+
+def _setup_request_body(handle: "pycurl.Curl", method: str, params) -> None:
+    accept = accept_header()
+    headers = [accept] if accept is not None else []
+    if isinstance(params, RawBody):
+        handle.setopt(pycurl.CUSTOMREQUEST, method.upper())
+        headers.append(f"Content-Type: {params.content_type}")
+        if params.content_encoding is not None:
+            headers.append(f"Content-Encoding: {params.content_encoding}")
+        handle.setopt(pycurl.POSTFIELDS, params.data)
+    elif method == "get":
+        handle.setopt(pycurl.HTTPGET, 1)
+    elif method in ("post", "put", "delete"):
+        handle.setopt(pycurl.CUSTOMREQUEST, method.upper())
+        if params:
+            headers.append("Content-Type: application/json")
+            handle.setopt(pycurl.POSTFIELDS, json.dumps(params))
+    elif method == "multipart-post":
+        handle.setopt(pycurl.HTTPPOST, [("file", (pycurl.FORM_FILE, str(params)))])
+    if headers:
+        handle.setopt(pycurl.HTTPHEADER, headers)
+
+
+def is_websocket_available() -> bool:
+    """WebSocket API is available in pycurl >= 7.46 built with libcurl >= 7.86."""
+    return pycurl is not None and hasattr(pycurl.Curl, "ws_recv") and "wss" in pycurl.version_info()[8]
+
+
+def open_websocket(settings: "AppSettings", endpoint: str, connect_timeout: float) -> "pycurl.Curl":
+    """Open a client-cert authenticated WebSocket to the agent API, ready for ws_* calls."""
+    handle = pycurl.Curl()
+    agent_url = get_endpoints(settings).select()
+    handle.setopt(pycurl.URL, agent_url.replace("https://", "wss://", 1) + endpoint)
+    handle.setopt(pycurl.CONNECT_ONLY, 2)  # 2 = do HTTP upgrade, then detach for ws_send/ws_recv
+    handle.setopt(pycurl.NOSIGNAL, 1)
+    handle.setopt(pycurl.TCP_KEEPALIVE, 1)
+    handle.setopt(pycurl.SHARE, _get_share())
+    handle.setopt(pycurl.CONNECTTIMEOUT_MS, int(connect_timeout * 1000))
+    _setup_client_cert(handle, settings)
+
+    try:
+        with engine_access(settings):
+            handle.perform()
+    except pycurl.error as e:
+        handle.close()
+        raise _to_libcurl_error(e) from e
+    return handle
+
+
+def _wait_socket(handle: "pycurl.Curl", timeout: float, write: bool = False) -> None:
+    sock = handle.getinfo(pycurl.ACTIVESOCKET)
+    if write:
+        select.select([], [sock], [], timeout)
+    else:
+        select.select([sock], [], [], timeout)
+
+
+def ws_recv_message(handle: "pycurl.Curl", timeout: float) -> Optional[tuple[bytes, str]]:
+    """Receive a complete WebSocket message.
+
+    Returns its payload and kind ("text", "binary", "ping", "pong" or "close"),
+    or None if nothing has been received within the timeout.
+    """
+    chunks: list[bytes] = []
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            data, meta = handle.ws_recv(WS_RECV_BUFFER_SIZE)
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if not chunks:
+                    return None
+                raise LibcurlError(28, "WebSocket message was not received completely") from None
+            _wait_socket(handle, remaining)
+            continue
+        except pycurl.error as e:
+            raise _to_libcurl_error(e) from e
+
+        chunks.append(data)
+        if meta.bytesleft == 0 and not meta.flags & pycurl.WS_CONT:
+            return b"".join(chunks), _ws_frame_kind(meta.flags)
+
+
+def _ws_frame_kind(flags: int) -> str:
+    for flag, kind in (
+        (pycurl.WS_CLOSE, "close"),
+        (pycurl.WS_PING, "ping"),
+        (pycurl.WS_PONG, "pong"),
+        (pycurl.WS_BINARY, "binary"),
+    ):
+        if flags & flag:
+            return kind
+    return "text"
+
+
+def ws_send(
+    handle: "pycurl.Curl", data: bytes, kind: str = "text", timeout: float = WS_SEND_TIMEOUT_S
+) -> None:
+    flags = {"text": pycurl.WS_TEXT, "binary": pycurl.WS_BINARY, "ping": pycurl.WS_PING}[kind]
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            handle.ws_send(data, flags)
+            return
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LibcurlError(28, "WebSocket message was not sent in time") from None
+            _wait_socket(handle, remaining, write=True)
+        except pycurl.error as e:
+            raise _to_libcurl_error(e) from e
@@ -1,52 +1,181 @@
 import logging
 import socket
+import ssl
 import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlparse
 
-import requests
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.constants import LINK_OFFLINE_MAX_WAIT_S, PROBE_TIMEOUT_S
+from wb.cloud_agent.netlink import link_watcher
+from wb.cloud_agent.resolver import getaddrinfo
 
-NETWORK_ERRORS = (
-    requests.RequestException,
-    ConnectionError,
-    socket.timeout,
-    socket.gaierror,
-    OSError,
-)
+# Probe stages, in order
+DNS = "dns"
+TCP = "tcp"
+TLS = "tls"
+HTTP = "http"
+
+STAGE_FAILURES = {
+    DNS: "DNS lookup has failed",
+    TCP: "TCP connection has failed",
+    TLS: "TLS handshake has failed",
+    HTTP: "HTTP request has failed",
+}
 
 
 class CloudUnreachableError(Exception):
     """Cloud is unreachable after multiple attempts."""
 
 
-def wait_for_cloud_reachable(url: str, interval: int = 5, max_retries: int = 100) -> None:
-    logging.info("Start checking cloud reachability (interval: %ss, max_attempts: %s)", interval, max_retries)
+@dataclass
+class ProbeResult:
+    failed_stage: Optional[str] = None
+    error: str = ""
+    timings: dict[str, float] = field(default_factory=dict)  # seconds per stage passed or failed
 
-    for attempt in range(1, max_retries + 1):
+    @property
+    def ok(self) -> bool:
+        return self.failed_stage is None
+
+    def describe(self) -> str:
+        if self.failed_stage is None:
+            return "reachable"
+        return f"{STAGE_FAILURES[self.failed_stage]}: {self.error}"
+
+    def describe_timings(self) -> str:
+        return ", ".join(f"{stage} {int(elapsed * 1000)} ms" for stage, elapsed in self.timings.items())
+
+
+@contextmanager
+def _stage(result: ProbeResult, stage: str) -> Iterator[None]:
+    result.failed_stage = stage  # until the stage completes
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        result.timings[stage] = time.monotonic() - started
+    result.failed_stage = None
+
+
+def _resolve(host: str, port: int, timeout: float) -> list[tuple]:
+    return [(family, address) for family, _, _, _, address in getaddrinfo(host, port, timeout)]
+
+
+def _connect(addresses: list[tuple], timeout: float) -> socket.socket:
+    error: OSError = OSError("No addresses to connect to")
+    for family, address in addresses:
+        sock = socket.socket(family, socket.SOCK_STREAM)
         try:
-            response = requests.head(url, timeout=15, allow_redirects=True)
-            if 200 <= response.status_code < 400:
-                logging.info("Cloud reachability - OK")
-                return
+            sock.settimeout(timeout)
+            sock.connect(address)
+            return sock
+        except OSError as exc:
+            sock.close()
+            error = exc
+    raise error
 
+
+def _head(sock: socket.socket, host: str, path: str) -> int:
+    """Status code of a HEAD request over the connected socket."""
+    request = (
+        f"HEAD {path} HTTP/1.1\r\nHost: {host}\r\n" "User-Agent: wb-cloud-agent\r\nConnection: close\r\n\r\n"
+    )
+    sock.sendall(request.encode("ascii"))
+    with sock.makefile("rb") as response:
+        status_line = response.readline(1024).decode("latin-1")
+    # HTTP/1.1 200 OK
+    parts = status_line.split()
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise ValueError(f"Invalid status line {status_line.strip()!r}")
+    return int(parts[1])
+
+
+def probe_cloud(url: str, timeout: float = PROBE_TIMEOUT_S) -> ProbeResult:
+    """
+    Check the cloud stage by stage: resolve its host, connect, make a TLS handshake
+    (for https) and send a HEAD request. Tells which stage has failed and how long each took.
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname or url
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    result = ProbeResult()
+
+    try:
+        with _stage(result, DNS):
+            addresses = _resolve(host, port, timeout)
+        with _stage(result, TCP):
+            sock = _connect(addresses, timeout)
+        with sock:
+            if parsed.scheme == "https":
+                with _stage(result, TLS):
+                    sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            with sock, _stage(result, HTTP):
+                status = _head(sock, host, parsed.path or "/")
+                # Redirects are answers of the cloud as well
+                if not 200 <= status < 400:
+                    raise ValueError(f"status {status}")
+    except (OSError, ValueError) as exc:  # socket timeouts and SSL errors are OSErrors
+        result.error = str(exc) or type(exc).__name__
+    return result
+
+
+def wait_for_cloud_reachable(
+    url: str,
+    interval: int = 5,
+    max_retries: int = 100,
+    on_failure: Optional[Callable[[ProbeResult], None]] = None,
+) -> None:
+    """
+    Probe the cloud until it answers. Failed probes are reported to on_failure, their
+    retries back off (see ConnectivityState.record_host) and wait for the network.
+    """
+    logging.info("Start checking cloud reachability (interval: %ss, max_attempts: %s)", interval, max_retries)
+    host = urlparse(url).hostname or url
+    failed_stage = None
+
+    for attempt in range(1, max_retries + 1):
+        if device_connectivity.is_reachable(host):
+            logging.info("Cloud reachability - OK (checked by another agent)")
+            return
+        # Another agent is probing the host or backing off, its result will do
+        wait = device_connectivity.wait_for_turn(host)
+        if wait > 0:
             logging.debug(
-                "Attempt %s/%s: cloud '%s' unreachable (status %s)",
-                attempt,
-                max_retries,
-                url,
-                response.status_code,
-            )
-        except NETWORK_ERRORS as exc:
-            logging.debug(
-                "Attempt %s/%s: cloud '%s' unreachable due to network issue: %s",
-                attempt,
-                max_retries,
-                url,
-                exc,
+                "Attempt %s/%s: waiting %.1f s for a probe by another agent", attempt, max_retries, wait
             )
+            link_watcher.sleep(wait)
+            continue
+
+        try:
+            result = probe_cloud(url)
         except Exception as exc:  # pylint:disable=broad-exception-caught
             raise CloudUnreachableError("Unexpected error during cloud reachability check") from exc
+        logging.debug("Cloud reachability probe: %s", result.describe_timings())
+        if result.ok:
+            device_connectivity.record_host(host, True, interval)
+            logging.info("Cloud reachability - OK")
+            return
+
+        # Every attempt is logged at debug level, a change of the failure at info
+        logging.log(
+            logging.INFO if result.failed_stage != failed_stage else logging.DEBUG,
+            "Attempt %s/%s: cloud '%s' is unreachable, %s",
+            attempt,
+            max_retries,
+            url,
+            result.describe(),
+        )
+        failed_stage = result.failed_stage
+        if on_failure is not None:
+            on_failure(result)
+        delay = device_connectivity.record_host(host, False, interval)
 
         if attempt < max_retries:
-            logging.debug("Retrying in %s seconds...", interval)
-            time.sleep(interval)
+            logging.debug("Retrying in %s seconds...", delay)
+            link_watcher.sleep(delay, offline_delay=LINK_OFFLINE_MAX_WAIT_S)
 
     raise CloudUnreachableError(f"Cloud '{url}' is unreachable after {max_retries} attempts")
@@ -0,0 +1,98 @@
+import json
+import logging
+from collections.abc import Callable
+
+from wb.cloud_agent.constants import (
+    PUSH_CONNECT_TIMEOUT_S,
+    PUSH_ENDPOINT,
+    PUSH_PING_INTERVAL_S,
+)
+from wb.cloud_agent.handlers import libcurl
+from wb.cloud_agent.handlers.events import handle_event
+from wb.cloud_agent.mqtt import MQTTCloudAgent
+from wb.cloud_agent.settings import AppSettings
+
+
+class PushChannelError(OSError):
+    """Push channel cannot be established or has been lost."""
+
+
+def run_push_channel(
+    settings: AppSettings,
+    mqtt: MQTTCloudAgent,
+    on_connected: Callable[[], None],
+    on_alive: Callable[[], None],
+) -> None:
+    """
+    Receive events pushed by the cloud over a WebSocket and dispatch them
+    through the same handlers as polled events.
+
+    Blocks while the channel is alive, raises PushChannelError when it cannot be
+    established or is lost, so the caller can fall back to polling.
+    on_alive is called on every message from the cloud, pongs included, so at least
+    once in PUSH_PING_INTERVAL_S: the caller's periodic work goes on while it is blocked.
+    """
+    if not libcurl.is_websocket_available():
+        raise PushChannelError("WebSocket is not supported by installed python3-pycurl/libcurl")
+
+    try:
+        handle = libcurl.open_websocket(settings, PUSH_ENDPOINT, PUSH_CONNECT_TIMEOUT_S)
+    except libcurl.LibcurlError as exc:
+        raise PushChannelError(f"Cannot open push channel to {settings.cloud_base_url}: {exc}") from exc
+
+    logging.info("Push channel to %s is connected", settings.cloud_base_url)
+    try:
+        on_connected()
+        _receive_events(settings, mqtt, handle, on_alive)
+    finally:
+        handle.close()
+
+
+def _receive_events(
+    settings: AppSettings, mqtt: MQTTCloudAgent, handle, on_alive: Callable[[], None]
+) -> None:
+    ping_sent = False
+
+    while True:
+        try:
+            message = libcurl.ws_recv_message(handle, PUSH_PING_INTERVAL_S)
+            if message is None:
+                if ping_sent:
+                    raise PushChannelError("Push channel does not respond to ping")
+                libcurl.ws_send(handle, b"", kind="ping")
+                ping_sent = True
+                continue
+        except libcurl.LibcurlError as exc:
+            raise PushChannelError(f"Push channel is lost: {exc}") from exc
+
+        ping_sent = False
+        data, kind = message
+        if kind == "close":
+            raise PushChannelError("Push channel is closed by the cloud")
+        on_alive()
+        if kind == "text":
+            _dispatch_event(settings, mqtt, handle, data)
+
+
+def _dispatch_event(settings: AppSettings, mqtt: MQTTCloudAgent, handle, data: bytes) -> None:
+    try:
+        event_data = json.loads(data)
+    except ValueError:
+        logging.warning("Invalid push channel message: %s", data)
+        return
+
+    logging.debug("Got event from push channel: %s", event_data)
+
+    def confirm(event_id: str) -> None:
+        try:
+            libcurl.ws_send(handle, json.dumps({"type": "confirm", "id": event_id}).encode("utf-8"))
+        except libcurl.LibcurlError as exc:
+            raise PushChannelError(f"Cannot confirm event {event_id}: {exc}") from exc
+
+    try:
+        handle_event(settings, event_data, mqtt, confirm)
+    except PushChannelError:
+        raise
+    except Exception:  # pylint:disable=broad-exception-caught
+        # Not confirmed event is delivered again, keep the channel open for other events
+        logging.exception("Error while handling pushed event")
@@ -1,16 +1,19 @@
+import hashlib
+import json
 import logging
 import platform
 from http import HTTPStatus as status
 from typing import Callable
 
 from wb.cloud_agent import __version__ as agent_package_version
-from wb.cloud_agent import frpc_package_version
 from wb.cloud_agent.constants import UNKNOWN_LINK
+from wb.cloud_agent.dpkg import get_package_version
+from wb.cloud_agent.endpoints import get_endpoints
 from wb.cloud_agent.handlers.curl import do_curl
 from wb.cloud_agent.mqtt import MQTTCloudAgent
 from wb.cloud_agent.services.activation import write_activation_link
 from wb.cloud_agent.settings import AppSettings
-from wb.cloud_agent.utils import get_apt_package_version
+from wb.cloud_agent.snapshot import get_snapshot
 
 VersionFieldGetter = Callable[[AppSettings], str]
 
@@ -19,10 +22,6 @@ def get_agent_package_version(_settings: AppSettings) -> str:
     return agent_package_version
 
 
-def get_frpc_package_version(_settings: AppSettings) -> str:
-    return frpc_package_version
-
-
 def get_python_version(_settings: AppSettings) -> str:
     return platform.python_version()
 
@@ -33,14 +32,14 @@ def get_crypto_engine_key(settings: AppSettings) -> str:
 
 def apt_package_version(package_name: str) -> VersionFieldGetter:
     def getter(_settings: AppSettings) -> str:
-        return get_apt_package_version(package_name)
+        return get_package_version(package_name)
 
     return getter
 
 
 PACKAGE_VERSION_FIELDS: dict[str, VersionFieldGetter] = {
     "agent_version": get_agent_package_version,
-    "frpc_version": get_frpc_package_version,
+    "frpc_version": apt_package_version("frpc"),
     "python_version": get_python_version,
     "mqttrpc_version": apt_package_version("python3-mqttrpc"),
     "paho_mqtt_version": apt_package_version("python3-paho-mqtt"),
@@ -49,7 +48,8 @@ PACKAGE_VERSION_FIELDS: dict[str, VersionFieldGetter] = {
 }
 
 
-def make_start_up_request(settings: AppSettings, mqtt: MQTTCloudAgent):
+def fetch_start_up_response(settings: AppSettings) -> dict:
+    """Make the start-up request, the response is saved to the agent snapshot but not applied."""
     status_data, http_status = do_curl(settings=settings, method="get", endpoint="agent-start-up/")
     if http_status != status.OK:
         logging.debug("http_status=%s status_data=%s", http_status, status_data)
@@ -58,6 +58,21 @@ def make_start_up_request(settings: AppSettings, mqtt: MQTTCloudAgent):
     if "activated" not in status_data or "activationLink" not in status_data:
         raise ValueError(f"Invalid response data while making start up request: {status_data}")
 
+    get_snapshot(settings).save_start_up(status_data)
+    return status_data
+
+
+def make_start_up_request(settings: AppSettings, mqtt: MQTTCloudAgent):
+    status_data = fetch_start_up_response(settings)
+    apply_start_up_response(settings, status_data, mqtt)
+    return status_data
+
+
+def apply_start_up_response(settings: AppSettings, status_data: dict, mqtt: MQTTCloudAgent) -> None:
+    """Apply the start-up response, just received or the one saved in the agent snapshot."""
+    if "agentEndpoints" in status_data:
+        get_endpoints(settings).update(status_data["agentEndpoints"])
+
     activated = status_data["activated"]
     activation_link = status_data["activationLink"]
 
@@ -66,11 +81,21 @@ def make_start_up_request(settings: AppSettings, mqtt: MQTTCloudAgent):
     else:
         write_activation_link(settings, activation_link, mqtt)
 
-    return status_data
+
+def versions_digest(package_versions: dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(package_versions, sort_keys=True).encode("utf-8")).hexdigest()
 
 
 def send_packages_version(settings: AppSettings):
+    """
+    Report package versions to the cloud unless they are the same as in the last successful report.
+    Raises ValueError if the cloud has not accepted the report.
+    """
     package_versions = collect_package_versions(settings)
+    digest = versions_digest(package_versions)
+    if digest == get_snapshot(settings).versions_digest():
+        logging.debug("Package versions have not changed since the last report")
+        return
 
     logging.info(
         "Sending package versions: %s",
@@ -84,10 +109,13 @@ def send_packages_version(settings: AppSettings):
         params=package_versions,
     )
     if http_status != status.OK:
-        logging.error(
-            "Not a %s status while making send_packages_version request: %s", status.OK, http_status
+        # The caller keeps the old stamp and retries the report
+        raise ValueError(
+            f"Not a {status.OK} status while making send_packages_version request: {http_status}"
         )
 
+    get_snapshot(settings).save_versions_digest(digest)
+
 
 def collect_package_versions(settings: AppSettings) -> dict[str, str]:
     """Collect versions useful for cloud-side feature branching."""
@@ -1,17 +1,52 @@
 #!/usr/bin/env python3
+import logging
 import re
+import time
 from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from importlib import import_module
+from typing import Callable
 from urllib.parse import urlparse
 
-from wb.cloud_agent.commands import (
-    add_on_premise_provider,
-    add_provider,
-    del_all_providers,
-    del_controller_from_cloud,
-    del_provider,
-    run_daemon,
-    show_providers,
-)
+# Time to load the modules of a subcommand on the controller: a slower load is warned about,
+# tests/test_main.py checks it on the development machine
+STARTUP_BUDGETS_S = {
+    "show_providers": 0.3,
+    "run_daemon": 1.5,
+    "run_uplink": 1.5,
+}
+DEFAULT_STARTUP_BUDGET_S = 1.0
+
+
+def _lazy_command(module: str, name: str) -> Callable[[Namespace], int]:
+    """
+    Subcommand loaded when it runs: requests, MQTT and the handlers are imported
+    by the commands that need them, the status command takes just its few modules.
+    """
+
+    def command(options: Namespace) -> int:
+        started = time.perf_counter()
+        func = getattr(import_module(module), name)
+        elapsed = time.perf_counter() - started
+        budget = STARTUP_BUDGETS_S.get(name, DEFAULT_STARTUP_BUDGET_S)
+        if elapsed > budget:
+            logging.warning("%s loaded in %.3f s, over its budget of %.1f s", name, elapsed, budget)
+        else:
+            logging.debug("%s loaded in %.3f s (budget %.1f s)", name, elapsed, budget)
+        return func(options)
+
+    command.__name__ = name
+    return command
+
+
+show_providers = _lazy_command("wb.cloud_agent.status", "show_providers")
+add_provider = _lazy_command("wb.cloud_agent.commands", "add_provider")
+add_on_premise_provider = _lazy_command("wb.cloud_agent.commands", "add_on_premise_provider")
+del_provider = _lazy_command("wb.cloud_agent.commands", "del_provider")
+del_all_providers = _lazy_command("wb.cloud_agent.commands", "del_all_providers")
+del_controller_from_cloud = _lazy_command("wb.cloud_agent.commands", "del_controller_from_cloud")
+run_daemon = _lazy_command("wb.cloud_agent.commands", "run_daemon")
+run_uplink = _lazy_command("wb.cloud_agent.commands", "run_uplink")
+bench_signing = _lazy_command("wb.cloud_agent.commands", "bench_signing")
 
 
 def parse_args() -> Namespace:
@@ -79,6 +114,29 @@ def parse_args() -> Namespace:
     run_daemon_parser.add_argument("--broker", help="MQTT broker url", required=False)
     run_daemon_parser.set_defaults(func=run_daemon)
 
+    run_uplink_parser = subparsers.add_parser(
+        "run-uplink", help="Run shared uplink to the clouds for all providers (TRANSPORT=uplink)"
+    )
+    run_uplink_parser.set_defaults(func=run_uplink)
+
+    bench_signing_parser = subparsers.add_parser(
+        "bench-signing", help="Measure signing rate of the client key on the crypto chip"
+    )
+    bench_signing_parser.add_argument(
+        "provider_name",
+        nargs="?",
+        help="Cloud Provider name to take the key from (default key if omitted)",
+    )
+    bench_signing_parser.add_argument(
+        "-n", "--count", type=int, default=20, help="Number of signatures, default 20"
+    )
+    bench_signing_parser.add_argument(
+        "--software-key",
+        action="store_true",
+        help="Sign with a software key instead, e.g. on controllers without the chip",
+    )
+    bench_signing_parser.set_defaults(func=bench_signing)
+
     return main_parser.parse_args()
 
 
@@ -1,8 +1,10 @@
+import json
 import logging
 
 from wb_common.mqtt_client import MQTTClient
 
 from wb.cloud_agent.settings import AppSettings, get_provider_names
+from wb.cloud_agent.traffic import TrafficMeter
 
 
 class MQTTCloudAgent:
@@ -31,6 +33,9 @@ class MQTTCloudAgent:
         if update_status:
             self.publish_ctrl("status", "starting")
 
+    def stop(self):
+        self.client.stop()
+
     def _on_connect(self, _client, _userdata, _flags, reason_code, *_):
         # 0: Connection successful
         if reason_code != 0:
@@ -80,6 +85,31 @@ class MQTTCloudAgent:
             retain=True,
             qos=2,
         )
+        self.client.publish(
+            f"{self.mqtt_prefix}/controls/traffic_today/meta",
+            '{"type": "value", "units": "B", "readonly": true, "order": 4, "title": {"en": "Traffic today"}}',
+            retain=True,
+            qos=2,
+        )
+        self.client.publish(
+            f"{self.mqtt_prefix}/controls/traffic_month/meta",
+            '{"type": "value", "units": "B", "readonly": true, "order": 5, '
+            '"title": {"en": "Traffic this month"}}',
+            retain=True,
+            qos=2,
+        )
+        self.client.publish(
+            f"{self.mqtt_prefix}/controls/data_saver/meta",
+            '{"type": "switch", "readonly": true, "order": 6, "title": {"en": "Data saver"}}',
+            retain=True,
+            qos=2,
+        )
+        self.client.publish(
+            f"{self.mqtt_prefix}/controls/startup_time/meta",
+            '{"type": "value", "units": "s", "readonly": true, "order": 7, "title": {"en": "Startup"}}',
+            retain=True,
+            qos=2,
+        )
 
     def remove_vdev(self):
         self.client.publish(f"{self.mqtt_prefix}/meta/name", "", retain=True, qos=2)
@@ -90,11 +120,28 @@ class MQTTCloudAgent:
         self.client.publish(f"{self.mqtt_prefix}/controls/status", "", retain=True, qos=2)
         self.client.publish(f"{self.mqtt_prefix}/controls/activation_link", "", retain=True, qos=2)
         self.client.publish(f"{self.mqtt_prefix}/controls/cloud_base_url", "", retain=True, qos=2)
+        for control in ("traffic_today", "traffic_month", "data_saver", "startup_time"):
+            self.client.publish(f"{self.mqtt_prefix}/controls/{control}/meta", "", retain=True, qos=2)
+            self.client.publish(f"{self.mqtt_prefix}/controls/{control}", "", retain=True, qos=2)
+        self.client.publish(f"/wb-cloud-agent/{self.provider_name}/traffic", "", retain=True, qos=2)
 
     def publish_ctrl(self, ctrl, value):
         self.client.publish(f"{self.mqtt_prefix}/controls/{ctrl}", value, retain=True, qos=2)
         self.controls.update({ctrl: value})
 
+    def publish_traffic(self, meter: TrafficMeter, data_saver: bool) -> None:
+        """Totals go to the device controls, today's bytes per endpoint as JSON to a topic of the provider."""
+        today = meter.day()
+        self.publish_ctrl("traffic_today", str(sum(traffic.total for traffic in today.values())))
+        self.publish_ctrl("traffic_month", str(meter.month_total()))
+        self.publish_ctrl("data_saver", "1" if data_saver else "0")
+        self.client.publish(
+            f"/wb-cloud-agent/{self.provider_name}/traffic",
+            json.dumps({endpoint: vars(traffic) for endpoint, traffic in today.items()}, sort_keys=True),
+            retain=True,
+            qos=2,
+        )
+
     def publish_providers(self, providers):
         self.providers = providers
         self.client.publish("/wb-cloud-agent/providers", providers, retain=True, qos=2)
@@ -0,0 +1,115 @@
+import logging
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.traffic import default_route_interfaces
+
+IPV6_ROUTES_FILE = "/proc/net/ipv6_route"
+
+# rtnetlink multicast groups (linux/rtnetlink.h): links, addresses and routes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+RTNETLINK_GROUPS = (
+    RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE
+)
+
+
+def default_routes() -> frozenset[str]:
+    """Interfaces with an IPv4 or IPv6 default route."""
+    interfaces = set(default_route_interfaces())
+    try:
+        lines = Path(IPV6_ROUTES_FILE).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        lines = []
+    for line in lines:
+        fields = line.split()
+        # Destination PrefixLength Source SourcePrefixLength NextHop Metric RefCnt Use Flags Iface,
+        # unreachable default routes live on lo
+        if len(fields) >= 10 and fields[0] == "0" * 32 and fields[1] == "00" and fields[9] != "lo":
+            interfaces.add(fields[9])
+    return frozenset(interfaces)
+
+
+class LinkWatcher:
+    """
+    Follows default routes by rtnetlink notifications of link, address and route changes.
+
+    Loops waiting for the network sleep with LinkWatcher.sleep(): a sleep ends
+    as soon as a default route appears (or moves to another interface), and while
+    there is no default route a retry is pointless, so it is put off until one
+    appears. Before start() or without rtnetlink the sleeps are plain time.sleep().
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._routes: frozenset[str] = frozenset()
+        self._generation = 0
+        self._running = False
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                sock.bind((0, RTNETLINK_GROUPS))
+            except (OSError, AttributeError) as exc:
+                logging.debug("Cannot subscribe to rtnetlink, network changes are not followed: %s", exc)
+                return
+            self._routes = default_routes()
+            self._running = True
+        device_connectivity.record_link(bool(self._routes))
+        threading.Thread(target=self._watch, args=(sock,), name="link-watcher", daemon=True).start()
+
+    def _watch(self, sock: socket.socket) -> None:
+        with sock:
+            while True:
+                try:
+                    sock.recv(65536)  # the contents don't matter, routes are reread
+                except OSError as exc:
+                    logging.warning("rtnetlink socket has failed, network changes are not followed: %s", exc)
+                    with self._condition:
+                        self._running = False
+                        self._condition.notify_all()
+                    return
+                self.update()
+
+    def update(self) -> None:
+        routes = default_routes()
+        with self._condition:
+            if routes == self._routes:
+                return
+            logging.info("Default route: %s", ", ".join(sorted(routes)) or "none")
+            appeared = bool(routes - self._routes)
+            self._routes = routes
+        # Shared backoffs are reset before sleepers wake up to try the new route
+        device_connectivity.record_link(bool(routes))
+        if appeared:
+            with self._condition:
+                self._generation += 1
+                self._condition.notify_all()
+
+    def sleep(self, delay: float, offline_delay: Optional[float] = None) -> bool:
+        """
+        Sleep for the delay, or for offline_delay (if longer) while there is no default route.
+        Returns True if woken up by a new default route.
+        """
+        with self._condition:
+            if self._running:
+                if not self._routes and offline_delay is not None:
+                    delay = max(delay, offline_delay)
+                generation = self._generation
+                self._condition.wait_for(lambda: self._generation != generation or not self._running, delay)
+                return self._generation != generation
+        time.sleep(delay)
+        return False
+
+
+link_watcher = LinkWatcher()
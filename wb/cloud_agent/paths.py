@@ -0,0 +1,238 @@
+import logging
+import socket
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Union
+from urllib.parse import urlparse
+
+from wb.cloud_agent.bandwidth import BULK, INTERACTIVE, REPORT, request_class
+from wb.cloud_agent.constants import (
+    PATH_EWMA_ALPHA,
+    PATH_PROBE_INTERVAL_S,
+    PATH_PROBE_TIMEOUT_S,
+)
+from wb.cloud_agent.resolver import resolve_addresses
+from wb.cloud_agent.traffic import default_route_interfaces, is_metered_interface
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+
+@dataclass
+class PathState:
+    interface: str
+    up: Optional[bool] = None  # None until probed, such an interface is tried
+    rtt: Optional[float] = None  # moving average of TCP connect time to the agent API host
+    reliability: float = 1.0  # moving average of successful probes and requests share
+    metered: bool = False
+
+    def usable(self) -> bool:
+        return self.up is not False
+
+
+def probe_interface(interface: str, addresses: list[str], port: int, timeout: float) -> float:
+    """TCP connect time to the first reachable address over the interface, raises OSError if none."""
+    error: OSError = OSError("No addresses to probe")
+    for address in addresses:
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, interface.encode("utf-8"))
+                sock.settimeout(timeout)
+                started = time.monotonic()
+                sock.connect((address, port))
+                return time.monotonic() - started
+            except OSError as exc:
+                error = exc
+    raise error
+
+
+class PathSelector:
+    """
+    Network interfaces requests to the cloud go over, by request class
+    (see bandwidth.request_class).
+
+    INTERFACES config is "auto" or lists interfaces by preference for a class,
+    e.g. {"interactive": ["eth0", "wwan0"], "bulk": ["eth0", "wlan0"]}; reports go
+    like interactive requests unless listed. In "auto" mode interfaces with a default
+    route are candidates: interactive requests and reports take the most reliable one,
+    bulk uploads the fastest unmetered one. Requests of a class without a usable
+    interface (or with a single candidate) follow the default route.
+
+    Each candidate is probed with a TCP connect to the agent API host every
+    PATH_PROBE_INTERVAL_S. An interface whose probe or request has failed is skipped
+    until a probe succeeds again, so requests fall back to the next one.
+    """
+
+    def __init__(
+        self,
+        config: Union[dict, str, None],
+        agent_url: str,
+        resolve: Callable[[str], list[str]],
+    ) -> None:
+        self.agent_url = agent_url
+        self.config = config
+        self._resolve = resolve
+        self._lock = threading.Lock()
+        self._states: dict[str, PathState] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.config == "auto" or (isinstance(self.config, dict) and bool(self.config))
+
+    def _configured(self, cls: str) -> Optional[list[str]]:
+        if not isinstance(self.config, dict):
+            return None
+        interfaces = self.config.get(cls)
+        if interfaces is None and cls == REPORT:
+            interfaces = self.config.get(INTERACTIVE)
+        return [i for i in interfaces if isinstance(i, str)] if isinstance(interfaces, list) else None
+
+    def candidates(self) -> list[str]:
+        if self.config == "auto":
+            return default_route_interfaces()
+        if not isinstance(self.config, dict):
+            return []
+        lists = (self._configured(cls) or [] for cls in (INTERACTIVE, REPORT, BULK))
+        return list(dict.fromkeys(interface for interfaces in lists for interface in interfaces))
+
+    def _add_states(self, interfaces: list[str]) -> None:
+        """Create states of new interfaces, nmcli is asked outside of the lock not to hold up requests."""
+        with self._lock:
+            new = [interface for interface in interfaces if interface not in self._states]
+        metered = {interface: is_metered_interface(interface) for interface in new}
+        with self._lock:
+            for interface, value in metered.items():
+                self._states.setdefault(interface, PathState(interface, metered=value))
+
+    def select(self, cls: str) -> Optional[str]:
+        """Interface for a request of the class, None to follow the default route."""
+        if self.config == "auto":
+            return self._select_auto(cls)
+        configured = self._configured(cls)
+        if not configured:
+            return None
+        self._add_states(configured)
+        with self._lock:
+            return next((i for i in configured if self._states[i].usable()), None)
+
+    def _select_auto(self, cls: str) -> Optional[str]:
+        interfaces = self.candidates()
+        if len(interfaces) < 2:
+            return None
+        self._add_states(interfaces)
+        with self._lock:
+            states = [self._states[interface] for interface in interfaces]
+            usable = [state for state in states if state.usable()]
+            if cls == BULK:
+                usable = [state for state in usable if not state.metered]
+                best = min(usable, key=lambda s: (s.rtt is None, s.rtt or 0, states.index(s)), default=None)
+            else:
+                best = max(usable, key=lambda s: (s.reliability, -states.index(s)), default=None)
+            return best.interface if best is not None else None
+
+    def is_unmetered(self, interface: Optional[str]) -> bool:
+        with self._lock:
+            state = self._states.get(interface) if interface is not None else None
+            return state is not None and not state.metered
+
+    def _update(self, interface: str, up: bool, rtt: Optional[float] = None) -> None:
+        self._add_states([interface])
+        with self._lock:
+            state = self._states[interface]
+            if state.up is not None and state.up != up:
+                logging.info("Interface %s is %s", interface, "up" if up else "down")
+            state.up = up
+            state.reliability = _ewma(state.reliability, 1.0 if up else 0.0)
+            if rtt is not None:
+                state.rtt = rtt if state.rtt is None else _ewma(state.rtt, rtt)
+
+    def record_failure(self, interface: str) -> None:
+        """A request over the interface has failed at the network level, skip it until a probe succeeds."""
+        self._update(interface, False)
+
+    def probe(self) -> None:
+        url = urlparse(self.agent_url)
+        if not url.hostname:
+            return
+        port = url.port or (443 if url.scheme == "https" else 80)
+        try:
+            addresses = self._resolve(url.hostname)
+        except OSError as exc:
+            logging.debug("Cannot resolve %s to probe interfaces: %s", url.hostname, exc)
+            return
+
+        interfaces = self.candidates()
+        self._add_states(interfaces)
+        for interface in interfaces:
+            metered = is_metered_interface(interface)
+            with self._lock:
+                self._states[interface].metered = metered
+            try:
+                rtt = probe_interface(interface, addresses, port, PATH_PROBE_TIMEOUT_S)
+            except OSError as exc:
+                logging.debug("Probe of %s over %s has failed: %s", url.hostname, interface, exc)
+                self._update(interface, False)
+            else:
+                self._update(interface, True, rtt)
+
+    def start(self) -> None:
+        if self._thread is None and self.enabled:
+            self._thread = threading.Thread(target=self._probe_loop, name="path-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _probe_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.probe()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logging.warning("Interface probe has failed: %s", exc)
+            self._stop.wait(PATH_PROBE_INTERVAL_S)
+
+
+def _ewma(average: float, value: float) -> float:
+    return average + PATH_EWMA_ALPHA * (value - average)
+
+
+_selectors: dict[str, PathSelector] = {}
+_selectors_lock = threading.Lock()
+
+
+def get_paths(settings: "AppSettings") -> PathSelector:
+    with _selectors_lock:
+        selector = _selectors.get(settings.provider_name)
+        if selector is None or (selector.agent_url, selector.config) != (
+            settings.cloud_agent_url,
+            settings.interfaces,
+        ):
+            if selector is not None:
+                selector.stop()
+            selector = PathSelector(
+                settings.interfaces,
+                settings.cloud_agent_url,
+                lambda host: resolve_addresses(settings, host),
+            )
+            selector.start()
+            _selectors[settings.provider_name] = selector
+        return selector
+
+
+def select_interface(settings: "AppSettings", endpoint: str) -> Optional[str]:
+    return get_paths(settings).select(request_class(endpoint))
+
+
+def record_interface_failure(settings: "AppSettings", interface: str) -> None:
+    get_paths(settings).record_failure(interface)
+
+
+def unmetered_bulk_path(settings: "AppSettings") -> bool:
+    """Bulk uploads go over an unmetered interface, whatever the default route is."""
+    paths = get_paths(settings)
+    return paths.is_unmetered(paths.select(BULK))
@@ -0,0 +1,76 @@
+import gzip
+import json
+import logging
+from typing import TYPE_CHECKING, Optional
+
+try:
+    import msgpack
+except ImportError:  # python3-msgpack is optional, responses are requested as JSON only
+    msgpack = None  # pylint: disable=invalid-name
+
+from wb.cloud_agent.constants import (
+    REQUEST_COMPRESSION_LEVEL,
+    REQUEST_COMPRESSION_MIN_BYTES,
+)
+from wb.cloud_agent.stats import get_counters
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def accept_header() -> Optional[str]:
+    """Offer msgpack to the cloud when it can be decoded, JSON stays acceptable."""
+    if msgpack is None:
+        return None
+    return "Accept: application/msgpack, application/json;q=0.9"
+
+
+def update_request_encoding(settings: "AppSettings", accept_encoding: str) -> None:
+    """Apply Accept-Encoding of a response: the encodings the cloud takes in request bodies."""
+    codings = {coding.split(";")[0].strip().lower() for coding in accept_encoding.split(",")}
+    encoding = "gzip" if "gzip" in codings else None
+    if encoding != settings.request_encoding:
+        settings.request_encoding = encoding
+        logging.debug("Request body encoding has been set: %s", encoding)
+
+
+def encode_json_body(settings: "AppSettings", params: dict) -> tuple[bytes, Optional[str]]:
+    """JSON request body and its content encoding, gzip if the cloud accepts it."""
+    data = json.dumps(params).encode("utf-8")
+    wire_data, encoding = data, None
+    if settings.request_encoding == "gzip" and len(data) >= REQUEST_COMPRESSION_MIN_BYTES:
+        compressed = gzip.compress(data, compresslevel=REQUEST_COMPRESSION_LEVEL)
+        if len(compressed) < len(data):
+            wire_data, encoding = compressed, "gzip"
+    record_payload(settings, sent=len(data), sent_wire=len(wire_data))
+    return wire_data, encoding
+
+
+def decode_body(body: bytes, content_type: Optional[str]) -> dict:
+    """Response body by its content type, {} if it is empty or cannot be decoded."""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        if media_type in MSGPACK_CONTENT_TYPES and msgpack is not None:
+            data = msgpack.unpackb(body)
+        else:
+            data = json.loads(body)
+    except ValueError:  # msgpack and json decode errors are ValueError subclasses
+        return {}
+    return data
+
+
+def record_payload(
+    settings: "AppSettings", *, sent: int = 0, sent_wire: int = 0, received: int = 0, received_wire: int = 0
+) -> None:
+    """Count body bytes of requests and responses, before (decoded) and after (wire) compression."""
+    counters = get_counters(settings)
+    for name, value in (
+        ("body_bytes_sent", sent),
+        ("body_bytes_sent_wire", sent_wire),
+        ("body_bytes_received", received),
+        ("body_bytes_received_wire", received_wire),
+    ):
+        if value:
+            counters.add(name, value)
@@ -0,0 +1,235 @@
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlparse
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # python3-dnspython is optional, system resolver is used without TTLs
+    dns = None  # pylint: disable=invalid-name
+
+from wb.cloud_agent.connectivity import device_connectivity
+from wb.cloud_agent.constants import (
+    DNS_CACHE_DEFAULT_TTL_S,
+    DNS_CACHE_MAX_TTL_S,
+    DNS_CACHE_MIN_TTL_S,
+    DNS_CACHE_STALE_MAX_S,
+    DNS_LOOKUP_TIMEOUT_S,
+)
+from wb.cloud_agent.stats import get_counters
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+
+@dataclass
+class HostEntry:
+    addresses: list[str]
+    resolved_at: float
+    expires_at: float
+    family: Optional[int] = None  # 4 or 6: the family connected last time
+
+
+class HostCache:
+    """
+    Resolved addresses of cloud hosts, saved to a file to survive restarts.
+
+    Entries are refreshed after their TTL. When the resolver fails, stale entries
+    are served, so a flaky DNS on a cellular link does not fail requests
+    to a host whose address has not changed. Addresses of the family that
+    connected last time go first, the other family is skipped while it works.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, HostEntry] = self._load()
+
+    def _load(self) -> dict[str, HostEntry]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return {host: HostEntry(**entry) for host, entry in data.items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def _save(self) -> None:
+        with self._lock:
+            contents = json.dumps({host: asdict(entry) for host, entry in self._entries.items()}, indent=4)
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            self.path.write_text(contents, encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save DNS cache to %s: %s", self.path, exc)
+
+    def resolve(self, host: str) -> tuple[list[str], bool]:
+        """Addresses of the host, preferred family first, and if they are stale."""
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is not None and time.time() < entry.expires_at:
+            return self._ordered(entry), False
+
+        stale_usable = entry is not None and time.time() - entry.resolved_at <= DNS_CACHE_STALE_MAX_S
+        if stale_usable and device_connectivity.dns_failing():
+            # Another agent has just seen the resolver failing, don't wait for its timeout too
+            return self._ordered(entry), True
+
+        try:
+            addresses, ttl = _lookup(host)
+        except OSError as exc:
+            device_connectivity.record_dns(False)
+            if not stale_usable:
+                raise
+            logging.debug("Cannot resolve %s (%s), using cached %s", host, exc, entry.addresses)
+            with self._lock:
+                # Don't wait for the resolver timeout on every request while it is down
+                entry.expires_at = time.time() + DNS_CACHE_MIN_TTL_S
+            return self._ordered(entry), True
+        device_connectivity.record_dns(True)
+
+        now = time.time()
+        ttl = max(DNS_CACHE_MIN_TTL_S, min(ttl, DNS_CACHE_MAX_TTL_S))
+        with self._lock:
+            family = entry.family if entry is not None else None
+            entry = HostEntry(addresses, now, now + ttl, family)
+            self._entries[host] = entry
+        self._save()
+        return self._ordered(entry), False
+
+    def _ordered(self, entry: HostEntry) -> list[str]:
+        preferred = [address for address in entry.addresses if _family(address) == entry.family]
+        return preferred or entry.addresses
+
+    def connected(self, host: str, address: str) -> None:
+        """Remember the family of the address a connection has been made to."""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry.family == _family(address):
+                return
+            entry.family = _family(address)
+        self._save()
+
+    def connect_failed(self, host: str) -> None:
+        """Try addresses of all families next time."""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry.family is None:
+                return
+            entry.family = None
+        self._save()
+
+
+def _family(address: str) -> int:
+    return 6 if ":" in address else 4
+
+
+def getaddrinfo(host: str, port: Optional[int], timeout: float) -> list[tuple]:
+    """socket.getaddrinfo() with a timeout, the system resolver has none of its own: it runs in a thread."""
+    infos: list[tuple] = []
+    errors: list[Exception] = []
+
+    def lookup() -> None:
+        try:
+            infos.extend(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        except (OSError, ValueError) as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=lookup, name="dns-lookup", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"timed out after {timeout:g} s")
+    if errors:
+        raise errors[0]
+    return infos
+
+
+def _lookup(host: str) -> tuple[list[str], float]:
+    if dns is None:
+        # A hanging resolver must not hold the request past its deadline, stale entries are served instead
+        infos = getaddrinfo(host, None, DNS_LOOKUP_TIMEOUT_S)
+        return list(dict.fromkeys(info[4][0] for info in infos)), DNS_CACHE_DEFAULT_TTL_S
+
+    addresses, ttls = [], []
+    for rdtype in ("AAAA", "A"):
+        try:
+            answer = dns.resolver.resolve(host, rdtype, lifetime=DNS_LOOKUP_TIMEOUT_S)
+        except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN):
+            continue
+        except dns.exception.DNSException as exc:
+            raise OSError(f"DNS lookup of {host} failed: {exc}") from exc
+        addresses += [record.address for record in answer]
+        ttls.append(answer.rrset.ttl)
+    if not addresses:
+        raise OSError(f"{host} has no addresses")
+    return addresses, min(ttls)
+
+
+_host_caches: dict[str, HostCache] = {}
+_host_caches_lock = threading.Lock()
+
+
+def get_host_cache(settings: "AppSettings") -> HostCache:
+    with _host_caches_lock:
+        cache = _host_caches.get(settings.provider_name)
+        if cache is None:
+            cache = HostCache(settings.dns_cache_file)
+            _host_caches[settings.provider_name] = cache
+        return cache
+
+
+def get_resolve_entry(settings: "AppSettings", agent_url: str) -> Optional[str]:
+    """
+    Cached addresses of the agent API host in curl --resolve (CURLOPT_RESOLVE) format,
+    None if the cache is disabled or the host cannot be resolved (curl will report it).
+    """
+    url = urlparse(agent_url)
+    host = url.hostname
+    if not settings.dns_cache or not host or _is_ip_address(host):
+        return None
+
+    try:
+        addresses, stale = get_host_cache(settings).resolve(host)
+    except OSError as exc:
+        logging.debug("Cannot resolve %s: %s", host, exc)
+        return None
+    if stale:
+        get_counters(settings).add("dns_stale")
+
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return f"{host}:{port}:" + ",".join(f"[{a}]" if _family(a) == 6 else a for a in addresses)
+
+
+def resolve_addresses(settings: "AppSettings", host: str) -> list[str]:
+    """Addresses of the host, from the cache if it is enabled, raises OSError."""
+    if _is_ip_address(host):
+        return [host]
+    if settings.dns_cache:
+        return get_host_cache(settings).resolve(host)[0]
+    return _lookup(host)[0]
+
+
+def record_connected(settings: "AppSettings", url: str, address: str) -> None:
+    host = urlparse(url).hostname
+    if settings.dns_cache and host and address:
+        get_host_cache(settings).connected(host, address)
+
+
+def record_connect_failed(settings: "AppSettings", url: str) -> None:
+    host = urlparse(url).hostname
+    if settings.dns_cache and host:
+        get_host_cache(settings).connect_failed(host)
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
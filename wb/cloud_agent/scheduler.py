@@ -0,0 +1,87 @@
+import random
+import time
+from typing import Optional
+
+from wb.cloud_agent.constants import (
+    DATA_SAVER_POLL_SLOWDOWN,
+    POLL_ACTIVATION_PENDING_SLOWDOWN,
+    POLL_ACTIVITY_SPEEDUP,
+    POLL_ACTIVITY_WINDOW_S,
+    POLL_BACKOFF_MAX_S,
+    POLL_MIN_INTERVAL_S,
+)
+from wb.cloud_agent.handlers.events import EventBacklog, long_poll_active
+from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.traffic import data_saver_active
+
+
+class PollScheduler:
+    """
+    Decides when the next event request is due.
+
+    Requests are made on a fixed-rate monotonic schedule, so the cadence does not
+    drift by request duration. The server-set poll interval is the baseline:
+    it is shortened after recent events, stretched while the controller waits for
+    activation and in data saver mode, and replaced with exponential backoff with full
+    jitter after failures, so controllers don't hit a recovering cloud all at once.
+
+    The fleet's polls are spread over the interval: by a random phase after start
+    or by the phase assigned by the cloud (x-poll-phase, seconds of wall clock
+    modulo the interval).
+    """
+
+    def __init__(self, settings: AppSettings) -> None:
+        self.settings = settings
+        self.backlog = EventBacklog()
+        self.failures = 0
+        self.retry_after: Optional[float] = None
+        self.last_event_at = float("-inf")
+        # Random phase, so controllers restarted together don't poll together
+        self.next_tick = time.monotonic() - random.uniform(0, settings.request_period_seconds)
+
+    def on_events(self, handled: int) -> None:
+        self.failures = 0
+        self.backlog.update(self.settings, handled)
+        if handled:
+            self.last_event_at = time.monotonic()
+
+    def on_failure(self, retry_after: Optional[float] = None) -> None:
+        self.failures += 1
+        self.retry_after = retry_after
+
+    def interval(self, activation_pending: bool) -> float:
+        interval = self.settings.request_period_seconds
+        if data_saver_active(self.settings):
+            interval *= DATA_SAVER_POLL_SLOWDOWN
+        if time.monotonic() - self.last_event_at < POLL_ACTIVITY_WINDOW_S:
+            return max(POLL_MIN_INTERVAL_S, interval / POLL_ACTIVITY_SPEEDUP)
+        if activation_pending:
+            return interval * POLL_ACTIVATION_PENDING_SLOWDOWN
+        return interval
+
+    def next_delay(self, activation_pending: bool = False) -> float:
+        """Seconds to sleep before the next request."""
+        now = time.monotonic()
+
+        if self.failures and self.retry_after is not None:
+            # Honor Retry-After, spreading retries of the fleet over the next poll period
+            self.next_tick = now + self.retry_after + random.uniform(0, self.settings.request_period_seconds)
+        elif self.failures:
+            backoff = min(POLL_BACKOFF_MAX_S, self.settings.request_period_seconds * 2**self.failures)
+            self.next_tick = now + random.uniform(0, backoff)
+        elif self.backlog.draining or long_poll_active(self.settings):
+            # Queued events are fetched back-to-back, long-poll request is re-armed immediately:
+            # it has already waited for events
+            self.next_tick = now
+        elif self.settings.poll_phase is not None:
+            self.next_tick = now + self._phase_delay(self.interval(activation_pending))
+        else:
+            # Skip ticks missed by a long request instead of making a burst of requests
+            self.next_tick = max(self.next_tick + self.interval(activation_pending), now)
+
+        return self.next_tick - now
+
+    def _phase_delay(self, interval: float) -> float:
+        delay = (self.settings.poll_phase - time.time()) % interval
+        # The request has just been made at this phase
+        return delay + interval if delay < POLL_MIN_INTERVAL_S else delay
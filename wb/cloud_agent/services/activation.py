@@ -1,8 +1,9 @@
 import logging
 
-from wb.cloud_agent.constants import UNKNOWN_LINK
+from wb.cloud_agent.constants import NOCONNECT_LINK, UNKNOWN_LINK
 from wb.cloud_agent.mqtt import MQTTCloudAgent
 from wb.cloud_agent.settings import AppSettings
+from wb.cloud_agent.snapshot import get_snapshot
 from wb.cloud_agent.utils import write_to_file
 
 
@@ -18,6 +19,11 @@ def read_activation_link(settings: AppSettings) -> str:
     return activation_link
 
 
+def is_activation_pending(settings: AppSettings) -> bool:
+    """The controller has an activation link, so it is not activated yet."""
+    return read_activation_link(settings) not in (UNKNOWN_LINK, NOCONNECT_LINK)
+
+
 def update_activation_link(settings: AppSettings, payload: dict, mqtt: MQTTCloudAgent) -> None:
     write_activation_link(settings, payload["activationLink"], mqtt)
 
@@ -26,3 +32,4 @@ def write_activation_link(settings: AppSettings, link: str, mqtt) -> None:
     logging.debug("Write activation link %s to %s", link, settings.activation_link_config)
     write_to_file(fpath=settings.activation_link_config, contents=link)
     mqtt.publish_ctrl("activation_link", link)
+    get_snapshot(settings).save_activation_link(link)
@@ -94,7 +94,6 @@ def _report_metrics_health(settings: AppSettings, reason: str, log: str) -> None
             method="post",
             endpoint="metrics-collector-log/",
             params={"reason": reason, "log": log},
-            retry_opts=["--connect-timeout", "15", "--retry", "2", "--retry-delay", "5"],
         )
     except (CloudNetworkError, subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as exc:
         logging.warning("Failed to report metrics health: %s", exc)
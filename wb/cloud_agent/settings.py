@@ -7,12 +7,11 @@ from pathlib import Path
 from typing import Any, Optional, Union
 from urllib.parse import urlparse, urlunparse
 
-from wb_common.mqtt_client import DEFAULT_BROKER_URL
-
 from wb.cloud_agent.constants import (
     APP_DATA_DIR,
     APP_DATA_PROVIDERS_DIR,
     CLOUD_AGENT_URL_POSTFIX,
+    DEFAULT_BROKER_URL,
     DEFAULT_PROVIDER_CONF_FILE,
     NOCONNECT_LINK,
     PROVIDERS_CONF_DIR,
@@ -36,6 +35,27 @@ class AppSettings:  # pylint: disable=too-many-instance-attributes disable=too-f
     {
         "CLIENT_CERT_ENGINE_KEY": "ATECCx08:00:04:C0:00",
     }
+
+    TRANSPORT selects how requests to the cloud are made:
+    "curl" (default) runs a curl process per request,
+    "libcurl" keeps persistent in-process connections (needs python3-pycurl),
+    "uplink" sends requests through wb-cloud-agent-uplink service, which keeps
+    connections and TLS sessions for all providers and serializes crypto chip use.
+    PUSH_ENABLED receives events over a WebSocket (needs libcurl transport support),
+    falling back to polling while the channel is down.
+    EVENTS_BATCH_SIZE limits how many queued events are fetched and confirmed
+    in one request.
+    TLS_SESSION_CACHE enables TLS session resumption, so most connections
+    skip the client key signature on the crypto chip.
+    DNS_CACHE keeps resolved addresses of the cloud host and uses them
+    while the resolver is unavailable.
+    AGENT_URLS lists agent API endpoints to fail over between, as URLs
+    or {"url": ..., "weight": ...} objects (see endpoints.EndpointSelector).
+    DATA_SAVER stretches polls and defers diagnostics uploads: true, false
+    or "auto" (default) to turn it on while the default route is metered.
+    INTERFACES binds requests to network interfaces by class: "auto" or
+    {"interactive": [...], "report": [...], "bulk": [...]} interface names
+    by preference (see paths.PathSelector), by default the default route is used.
     """
 
     provider_name: str
@@ -54,6 +74,21 @@ class AppSettings:  # pylint: disable=too-many-instance-attributes disable=too-f
     request_period_seconds: int = 10
     ping_period_seconds: int = 10
     metrics_log_enabled: bool = True
+    long_poll_enabled: bool = True
+    long_poll_timeout: int = 0
+    push_enabled: bool = False
+    events_batch_size: int = 10
+    events_pending: Optional[int] = None
+    poll_phase: Optional[float] = None
+    engine_checked: bool = False
+    request_encoding: Optional[str] = None
+
+    transport: str = "curl"
+    tls_session_cache: bool = True
+    dns_cache: bool = True
+    agent_urls: Optional[list] = None
+    data_saver: Union[bool, str] = "auto"
+    interfaces: Union[dict, str, None] = None
 
     def __init__(self, /, **kwargs: dict[str, Any]) -> None:
         for key, val in kwargs.items():
@@ -70,6 +105,13 @@ class AppSettings:  # pylint: disable=too-many-instance-attributes disable=too-f
         self.activation_link_config: Path = Path(
             f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/activation_link.conf"
         )
+        self.tls_sessions_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/tls_sessions")
+        self.stats_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/stats.json")
+        self.tuning_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/tuning.json")
+        self.endpoints_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/endpoints.json")
+        self.dns_cache_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/dns_cache.json")
+        self.traffic_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/traffic.json")
+        self.snapshot_file: Path = Path(f"{APP_DATA_PROVIDERS_DIR}/{self.provider_name}/snapshot.json")
         self.mqtt_prefix: str = f"/devices/system__wb-cloud-agent__{self.provider_name}"
         self.diag_archive: Path = Path("/tmp")
 
@@ -0,0 +1,139 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from wb.cloud_agent.constants import (
+    SNAPSHOT_CONFIRM_INTERVAL_S,
+    SNAPSHOT_FRESH_S,
+    UNKNOWN_LINK,
+)
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+SNAPSHOT_VERSION = 1
+
+# Settings the cloud tunes with response headers (see curl.apply_response_headers)
+TUNED_SETTINGS = {"request_period_seconds": int, "metrics_log_enabled": bool}
+
+
+class AgentSnapshot:
+    """
+    State of the agent that lets a restarted daemon pick up where it has stopped.
+
+    It holds the last start-up response (activation state, agent endpoints), settings
+    tuned by the cloud and the digest of the last reported package versions. The snapshot
+    is confirmed by successful polls; within SNAPSHOT_FRESH_S of the last confirmation
+    a restarted daemon skips the reachability check and the start-up request and
+    polls right away, so restart loops and mass upgrades don't hit the cloud with them.
+
+    Times are wall clock, a snapshot from the future (the clock has been set back) is stale.
+    A snapshot of another version is ignored.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+        self._confirmed_at = float("-inf")  # monotonic, throttles writes on polls
+
+    def _load(self) -> dict[str, Any]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError, TypeError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            return {}
+        return data
+
+    def _save(self) -> None:
+        contents = json.dumps(self._data, indent=4, sort_keys=True)
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            self.path.write_text(contents, encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save agent snapshot to %s: %s", self.path, exc)
+
+    def _update(self, **values: Any) -> None:
+        with self._lock:
+            if all(self._data.get(key) == value for key, value in values.items()):
+                return
+            self._data.update(values, version=SNAPSHOT_VERSION)
+            self._save()
+
+    def save_start_up(self, response: dict) -> None:
+        self._update(start_up=response, confirmed_at=time.time())
+        self._confirmed_at = time.monotonic()
+
+    def save_activation_link(self, link: str) -> None:
+        """
+        Keep the activation state of the saved start-up response up to date,
+        a warm start must not bring back the link of an activated controller.
+        """
+        with self._lock:
+            response = self._data.get("start_up")
+        if not isinstance(response, dict):
+            return
+        activated = link == UNKNOWN_LINK
+        self._update(
+            start_up={**response, "activated": activated, "activationLink": "" if activated else link}
+        )
+
+    def save_tuned(self, settings: "AppSettings") -> None:
+        self._update(tuned={name: getattr(settings, name) for name in TUNED_SETTINGS})
+
+    def save_versions_digest(self, digest: str) -> None:
+        self._update(versions_digest=digest)
+
+    def versions_digest(self) -> Optional[str]:
+        with self._lock:
+            digest = self._data.get("versions_digest")
+        return digest if isinstance(digest, str) else None
+
+    def confirm(self) -> None:
+        """The cloud has answered a poll, the snapshot is still valid."""
+        if time.monotonic() - self._confirmed_at < SNAPSHOT_CONFIRM_INTERVAL_S:
+            return
+        self._confirmed_at = time.monotonic()
+        if "start_up" in self._data:
+            self._update(confirmed_at=time.time())
+
+    def warm_start(self, settings: "AppSettings") -> Optional[dict]:
+        """
+        The start-up response to start with if the snapshot is fresh, None otherwise.
+        Settings tuned by the cloud are restored either way, they are kept until it changes them.
+        """
+        with self._lock:
+            data = dict(self._data)
+        tuned = data.get("tuned")
+        for name, value_type in TUNED_SETTINGS.items():
+            value = tuned.get(name) if isinstance(tuned, dict) else None
+            # bool is an int too, don't take true for a poll period
+            if isinstance(value, value_type) and isinstance(value, bool) == (value_type is bool):
+                setattr(settings, name, value)
+
+        confirmed_at = data.get("confirmed_at")
+        response = data.get("start_up")
+        if not isinstance(confirmed_at, (int, float)) or not isinstance(response, dict):
+            return None
+        age = time.time() - confirmed_at
+        if not 0 <= age < SNAPSHOT_FRESH_S:
+            return None
+        logging.info("Warm start from the agent snapshot of %d s ago", age)
+        return response
+
+
+_snapshots: dict[str, AgentSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(settings: "AppSettings") -> AgentSnapshot:
+    with _snapshots_lock:
+        snapshot = _snapshots.get(settings.provider_name)
+        if snapshot is None:
+            snapshot = AgentSnapshot(settings.snapshot_file)
+            _snapshots[settings.provider_name] = snapshot
+        return snapshot
@@ -0,0 +1,126 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from wb.cloud_agent.constants import STATS_FLUSH_INTERVAL_S
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+
+class Counters:
+    """
+    Thread-safe agent counters of a provider.
+
+    Values are loaded from and periodically saved to a JSON file,
+    so they survive daemon restarts.
+    """
+
+    def __init__(self, path: Path, flush_interval: float = STATS_FLUSH_INTERVAL_S) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._values: dict[str, float] = self._load()
+        self._flushed_at = time.monotonic()
+
+    def _load(self) -> dict[str, float]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return {key: val for key, val in data.items() if isinstance(val, (int, float))}
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+        self.flush()
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def flush(self, force: bool = False) -> None:
+        with self._lock:
+            if not force and time.monotonic() - self._flushed_at < self.flush_interval:
+                return
+            self._flushed_at = time.monotonic()
+            values = dict(self._values)
+
+        contents = json.dumps(values, indent=4, sort_keys=True)
+
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            self.path.write_text(contents, encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save stats to %s: %s", self.path, exc)
+            return
+
+        log_summary(values)
+
+
+_counters: dict[str, Counters] = {}
+_counters_lock = threading.Lock()
+
+
+def get_counters(settings: "AppSettings") -> Counters:
+    with _counters_lock:
+        counters = _counters.get(settings.provider_name)
+        if counters is None:
+            counters = Counters(settings.stats_file)
+            _counters[settings.provider_name] = counters
+        return counters
+
+
+def record_tls_handshake(settings: "AppSettings", kind: str) -> None:
+    """Count a request by the way its TLS connection was set up: reused, resumed or full."""
+    get_counters(settings).add(f"tls_{kind}")
+
+
+def log_summary(values: dict[str, float]) -> None:
+    engine_uses = values.get("engine_uses", 0)
+    if engine_uses:
+        logging.info(
+            "Crypto chip: %d uses, average wait %d ms, average use %d ms",
+            engine_uses,
+            1000 * values.get("engine_wait_s", 0) / engine_uses,
+            1000 * values.get("engine_busy_s", 0) / engine_uses,
+        )
+
+    queued = [
+        f"{cls} {1000 * values.get(f'queue_wait_s_{cls}', 0) / requests:.0f} ms"
+        for cls in ("interactive", "report", "bulk")
+        if (requests := values.get(f"queue_requests_{cls}", 0))
+    ]
+    if queued:
+        logging.info("Average outbound queue wait: %s", ", ".join(queued))
+
+    received, received_wire = values.get("body_bytes_received", 0), values.get("body_bytes_received_wire", 0)
+    sent, sent_wire = values.get("body_bytes_sent", 0), values.get("body_bytes_sent_wire", 0)
+    if received or sent:
+        logging.info(
+            "Payload: received %d bytes (%d on the wire), sent %d bytes (%d on the wire)",
+            received,
+            received_wire,
+            sent,
+            sent_wire,
+        )
+
+    reused, resumed, full = (values.get(f"tls_{kind}", 0) for kind in ("reused", "resumed", "full"))
+    handshakes = resumed + full
+    if not reused + handshakes:
+        return
+
+    logging.info(
+        "TLS connections: %d reused, %d handshakes resumed, %d full handshakes (resumption rate %d%%)",
+        reused,
+        resumed,
+        full,
+        100 * resumed / handshakes if handshakes else 100,
+    )
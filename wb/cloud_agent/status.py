@@ -0,0 +1,9 @@
+from wb.cloud_agent.settings import get_provider_names, load_providers_data
+from wb.cloud_agent.utils import show_providers_table
+
+
+def show_providers(_options) -> int:
+    provider_names = get_provider_names()
+    providers = load_providers_data(provider_names)
+    show_providers_table(providers)
+    return 0
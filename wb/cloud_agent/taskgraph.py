@@ -0,0 +1,69 @@
+import logging
+import os
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+PROC_STAT_FILE = "/proc/self/stat"
+
+# Fallback start of the process for process_uptime()
+_IMPORTED_AT = time.monotonic()
+
+
+class TaskGraph:
+    """
+    Startup steps run in threads as soon as the steps they depend on are done.
+
+    Tasks are added in dependency order, each starts right away in a thread of its own.
+    A task whose dependency has failed fails with the same exception without being run.
+    wait() returns the result of a task or raises its exception. Tasks off the critical
+    path are checked with future(), their failures are logged at debug level only.
+    """
+
+    def __init__(self, max_tasks: int = 8) -> None:
+        self.max_tasks = max_tasks
+        self._executor = ThreadPoolExecutor(max_workers=max_tasks, thread_name_prefix="startup")
+        self._futures: dict[str, Future] = {}
+
+    def add(self, name: str, func: Callable[[], Any], after: Iterable[str] = ()) -> None:
+        # With a thread per task, tasks waiting for their dependencies cannot starve them
+        if len(self._futures) >= self.max_tasks:
+            raise ValueError(f"Too many startup tasks to add {name}")
+        dependencies = [self._futures[dependency] for dependency in after]
+
+        def run() -> Any:
+            for dependency in dependencies:
+                dependency.result()  # raises if the dependency has failed
+            started = time.monotonic()
+            try:
+                return func()
+            except Exception as exc:
+                logging.debug("Startup task %s has failed: %s", name, exc)
+                raise
+            finally:
+                logging.debug("Startup task %s took %.3f s", name, time.monotonic() - started)
+
+        self._futures[name] = self._executor.submit(run)
+
+    def future(self, name: str) -> Future:
+        return self._futures[name]
+
+    def wait(self, *names: str) -> list[Any]:
+        return [self._futures[name].result() for name in names]
+
+    def shutdown(self) -> None:
+        """Let the tasks still running finish in the background."""
+        self._executor.shutdown(wait=False)
+
+
+def process_uptime() -> float:
+    """Seconds since the process has started, counted by the kernel (so from before imports)."""
+    try:
+        stat = Path(PROC_STAT_FILE).read_text(encoding="utf-8")
+        # The command name in parentheses may contain spaces, starttime is field 22
+        started = int(stat.rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        return max(0.0, time.clock_gettime(time.CLOCK_BOOTTIME) - started)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - _IMPORTED_AT
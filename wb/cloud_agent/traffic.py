@@ -0,0 +1,222 @@
+import datetime
+import json
+import logging
+import socket
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from wb.cloud_agent.constants import (
+    METERED_CHECK_INTERVAL_S,
+    METERED_INTERFACE_PREFIXES,
+    STATS_FLUSH_INTERVAL_S,
+    TRAFFIC_HISTORY_DAYS,
+)
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+ROUTES_FILE = "/proc/net/route"
+
+# Offset of tcpi_bytes_acked and tcpi_bytes_received in struct tcp_info (Linux >= 4.1)
+TCP_INFO_BYTES_OFFSET = 120
+TCP_INFO_MIN_SIZE = TCP_INFO_BYTES_OFFSET + 16
+
+
+@dataclass
+class Traffic:
+    """Bytes of a request: HTTP request and response (headers and body on the wire) and TLS on top."""
+
+    sent: int = 0
+    received: int = 0
+    tls: int = 0  # 0 where it cannot be measured (curl transport)
+    requests: int = 0
+
+    def add(self, other: "Traffic") -> None:
+        self.sent += other.sent
+        self.received += other.received
+        self.tls += other.tls
+        self.requests += other.requests
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.received + self.tls
+
+
+class TrafficMeter:
+    """
+    Bytes exchanged with the cloud per agent API endpoint and day.
+
+    Days are local dates, so the counters match the billing of the SIM card.
+    Counters are saved to a file periodically and when the day changes,
+    days older than TRAFFIC_HISTORY_DAYS are dropped.
+    """
+
+    def __init__(self, path: Path, flush_interval: float = STATS_FLUSH_INTERVAL_S) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._days: dict[str, dict[str, Traffic]] = self._load()
+        self._flushed_at = time.monotonic()
+
+    def _load(self) -> dict[str, dict[str, Traffic]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return {
+                day: {endpoint: Traffic(**values) for endpoint, values in endpoints.items()}
+                for day, endpoints in data.items()
+            }
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def add(self, endpoint: str, traffic: Traffic) -> None:
+        # Query parameters (e.g. wait= of long-poll) don't make another endpoint
+        endpoint = endpoint.split("?", 1)[0]
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            new_day = today not in self._days
+            self._days.setdefault(today, {}).setdefault(endpoint, Traffic()).add(traffic)
+        self.flush(force=new_day)
+
+    def day(self, date: Optional[datetime.date] = None) -> dict[str, Traffic]:
+        key = (date or datetime.date.today()).isoformat()
+        with self._lock:
+            return {
+                endpoint: Traffic(**vars(traffic)) for endpoint, traffic in self._days.get(key, {}).items()
+            }
+
+    def month_total(self) -> int:
+        month = datetime.date.today().isoformat()[:7]
+        with self._lock:
+            return sum(
+                traffic.total
+                for day, endpoints in self._days.items()
+                if day.startswith(month)
+                for traffic in endpoints.values()
+            )
+
+    def flush(self, force: bool = False) -> None:
+        oldest = (datetime.date.today() - datetime.timedelta(days=TRAFFIC_HISTORY_DAYS)).isoformat()
+        with self._lock:
+            if not force and time.monotonic() - self._flushed_at < self.flush_interval:
+                return
+            self._flushed_at = time.monotonic()
+            self._days = {day: endpoints for day, endpoints in self._days.items() if day > oldest}
+            contents = json.dumps(
+                {day: {e: vars(t) for e, t in endpoints.items()} for day, endpoints in self._days.items()},
+                indent=4,
+                sort_keys=True,
+            )
+
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            self.path.write_text(contents, encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save traffic counters to %s: %s", self.path, exc)
+
+
+_meters: dict[str, TrafficMeter] = {}
+_meters_lock = threading.Lock()
+
+
+def get_traffic_meter(settings: "AppSettings") -> TrafficMeter:
+    with _meters_lock:
+        meter = _meters.get(settings.provider_name)
+        if meter is None:
+            meter = TrafficMeter(settings.traffic_file)
+            _meters[settings.provider_name] = meter
+        return meter
+
+
+def record_traffic(settings: "AppSettings", endpoint: str, traffic: Traffic) -> None:
+    get_traffic_meter(settings).add(endpoint, traffic)
+
+
+def tcp_bytes(fd: int) -> Optional[tuple[int, int]]:
+    """TCP payload bytes sent (acknowledged) and received over a connected socket, None if unknown."""
+    tcp_info = getattr(socket, "TCP_INFO", None)
+    if tcp_info is None or fd is None or fd < 0:
+        return None
+    try:
+        with socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM) as sock:
+            info = sock.getsockopt(socket.IPPROTO_TCP, tcp_info, 256)
+    except OSError:
+        return None
+    if len(info) < TCP_INFO_MIN_SIZE:
+        return None
+    return struct.unpack_from("QQ", info, TCP_INFO_BYTES_OFFSET)
+
+
+def default_route_interfaces() -> list[str]:
+    """Interfaces with an IPv4 default route, the lowest metric first."""
+    try:
+        lines = Path(ROUTES_FILE).read_text(encoding="utf-8").splitlines()[1:]
+    except OSError:
+        return []
+    routes = []
+    for line in lines:
+        fields = line.split()
+        # Iface Destination Gateway Flags RefCnt Use Metric Mask ...
+        if len(fields) >= 8 and fields[1] == "00000000" and fields[7] == "00000000":
+            routes.append((int(fields[6]), fields[0]))
+    return list(dict.fromkeys(interface for _, interface in sorted(routes)))
+
+
+def default_route_interface() -> Optional[str]:
+    """Interface of the IPv4 default route with the lowest metric."""
+    interfaces = default_route_interfaces()
+    return interfaces[0] if interfaces else None
+
+
+def is_metered_interface(interface: str) -> bool:
+    """Ask NetworkManager (GENERAL.METERED, also guessed by it for modems), fall back to the name."""
+    try:
+        result = subprocess.run(
+            ["nmcli", "-g", "GENERAL.METERED", "device", "show", interface],
+            capture_output=True,
+            check=True,
+            timeout=5,
+        )
+        metered = result.stdout.decode("utf-8", errors="replace").strip()
+    except (OSError, subprocess.SubprocessError):
+        metered = "unknown"
+    if metered.startswith("yes"):
+        return True
+    if metered.startswith("no"):
+        return False
+    return interface.startswith(METERED_INTERFACE_PREFIXES)
+
+
+class MeteredLinkMonitor:  # pylint: disable=too-few-public-methods
+    """Tells if the default route goes over a metered link, rechecked at most every minute."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._metered = False
+
+    def is_metered(self) -> bool:
+        with self._lock:
+            if time.monotonic() - self._checked_at < METERED_CHECK_INTERVAL_S:
+                return self._metered
+            self._checked_at = time.monotonic()
+            interface = default_route_interface()
+            metered = interface is not None and is_metered_interface(interface)
+            if metered != self._metered:
+                logging.info("Default route via %s is %s", interface, "metered" if metered else "not metered")
+            self._metered = metered
+            return metered
+
+
+metered_link = MeteredLinkMonitor()
+
+
+def data_saver_active(settings: "AppSettings") -> bool:
+    """DATA_SAVER config: true, false or "auto" (on while the default route is metered)."""
+    if settings.data_saver == "auto":
+        return metered_link.is_metered()
+    return bool(settings.data_saver)
@@ -0,0 +1,117 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Union
+
+from wb.cloud_agent.constants import LONG_POLL_MAX_TIMEOUT_S
+
+if TYPE_CHECKING:
+    from wb.cloud_agent.settings import AppSettings
+
+# Parameters the cloud can tune per endpoint prefix ("*" for all endpoints)
+# with their types and safe bounds
+TUNABLES: dict[str, tuple[type, Union[int, float], Union[int, float]]] = {
+    "connect_timeout": (float, 1, 120),
+    "deadline": (float, 5, 900),
+    "retries": (int, 0, 10),
+    "max_delay": (float, 1, 300),
+    "compressed": (bool, 0, 1),
+    "long_poll_timeout": (int, 0, LONG_POLL_MAX_TIMEOUT_S),  # events/ only
+    "bulk_rate": (int, 1024, 100 * 1024 * 1024),  # bytes/s of bulk uploads
+}
+
+ALL_ENDPOINTS = "*"
+
+
+class Tuning:
+    """
+    Transport parameters set by the cloud in x-agent-tuning response header.
+
+    The header holds a JSON object of endpoint prefixes to parameters, e.g.
+    {"*": {"connect_timeout": 20}, "events/": {"deadline": 30, "long_poll_timeout": 120}}.
+    Values are clamped to TUNABLES bounds, applied live and saved,
+    so they survive daemon restarts. An empty object resets tuning to defaults.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._header = None
+        self._values = self._load()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return parse_tuning(data) if isinstance(data, dict) else {}
+
+    def update(self, header: str) -> bool:
+        """Apply x-agent-tuning header value, returns True if tuning has changed."""
+        with self._lock:
+            # Every response carries the same header until the cloud changes it
+            if header == self._header:
+                return False
+            self._header = header
+
+            try:
+                data = json.loads(header)
+            except ValueError:
+                logging.warning("Invalid agent tuning from the cloud: %s", header)
+                return False
+            values = parse_tuning(data) if isinstance(data, dict) else {}
+            if values == self._values:
+                return False
+            self._values = values
+
+        logging.info("Agent tuning has been set by the cloud: %s", values)
+        try:
+            # Provider data dir is owned by provider lifecycle, never recreate it here
+            self.path.write_text(json.dumps(values, indent=4, sort_keys=True), encoding="utf-8")
+        except OSError as exc:
+            logging.debug("Cannot save tuning to %s: %s", self.path, exc)
+        return True
+
+    def for_endpoint(self, endpoint: str) -> dict[str, Any]:
+        """Parameters for the endpoint: set for all endpoints, overridden by the longest matching prefix."""
+        with self._lock:
+            values = dict(self._values.get(ALL_ENDPOINTS, {}))
+            prefixes = sorted((prefix for prefix in self._values if endpoint.startswith(prefix)), key=len)
+            for prefix in prefixes:
+                values.update(self._values[prefix])
+        return values
+
+
+def parse_tuning(data: dict) -> dict[str, dict[str, Any]]:
+    """Validate tuning: unknown and mistyped parameters are dropped, values are clamped."""
+    tuning = {}
+    for prefix, params in data.items():
+        if not isinstance(params, dict):
+            logging.warning("Invalid agent tuning for %s: %s", prefix, params)
+            continue
+        tuning[prefix] = {}
+        for name, value in params.items():
+            if name not in TUNABLES:
+                logging.debug("Unknown agent tuning parameter %s, ignored", name)
+                continue
+            value_type, minimum, maximum = TUNABLES[name]
+            # bool is an int too, don't take true for 1 retry
+            if isinstance(value, bool) != (value_type is bool) or not isinstance(value, (int, float)):
+                logging.warning("Invalid agent tuning %s for %s: %s", name, prefix, value)
+                continue
+            tuning[prefix][name] = value_type(max(minimum, min(value, maximum)))
+    return tuning
+
+
+_tunings: dict[str, Tuning] = {}
+_tunings_lock = threading.Lock()
+
+
+def get_tuning(settings: "AppSettings") -> Tuning:
+    with _tunings_lock:
+        tuning = _tunings.get(settings.provider_name)
+        if tuning is None:
+            tuning = Tuning(settings.tuning_file)
+            _tunings[settings.provider_name] = tuning
+        return tuning
@@ -0,0 +1,203 @@
+import logging
+import os
+import shlex
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Optional
+
+from wb.cloud_agent.constants import (
+    APP_DATA_DIR,
+    PROVIDERS_CONF_DIR,
+    UPLINK_AGENT_URL_HEADER,
+    UPLINK_ERROR_HEADER,
+    UPLINK_MEASUREMENTS_HEADER,
+    UPLINK_OPTIONS_HEADER,
+    UPLINK_RESOLVE_HEADER,
+    UPLINK_TRAFFIC_HEADER,
+)
+from wb.cloud_agent.handlers import libcurl
+from wb.cloud_agent.settings import AppSettings, get_provider_names
+from wb.cloud_agent.stats import Counters
+from wb.cloud_agent.traffic import Traffic
+
+# Hop-by-hop and framing headers of the cloud response, the uplink sets its own.
+# Content-Encoding too: libcurl has already decoded the body.
+SKIPPED_RESPONSE_HEADERS = (
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "content-length",
+    "content-encoding",
+)
+
+_provider_settings: dict[str, tuple[float, AppSettings]] = {}
+_provider_settings_lock = threading.Lock()
+
+
+def get_provider_settings(provider_name: str) -> Optional[AppSettings]:
+    """Settings of a configured provider, reloaded when its config file changes."""
+    if provider_name not in get_provider_names():
+        return None
+
+    try:
+        mtime = (Path(PROVIDERS_CONF_DIR) / provider_name / "wb-cloud-agent.conf").stat().st_mtime
+    except OSError:
+        return None
+
+    with _provider_settings_lock:
+        cached = _provider_settings.get(provider_name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, AppSettings(provider_name=provider_name))
+            _provider_settings[provider_name] = cached
+        return cached[1]
+
+
+class UplinkRequestHandler(BaseHTTPRequestHandler):
+    """
+    Forwards plain HTTP requests of the agents to the cloud.
+
+    Request path is /<provider name>/<agent API endpoint>, the cloud URL and the client
+    certificate are taken from the provider config. Transfer options of the attempt
+    (timeouts, compression) come as curl options in x-uplink-options header.
+    Transport errors are reported with 502 status and curl exit code in x-uplink-error header.
+    Bytes the request took are reported in x-uplink-traffic header (see traffic.Traffic),
+    stats counters and the connection in x-uplink-measurements header (see libcurl.Measurements),
+    the agent records them: the uplink never writes provider data files. For the same reason
+    the address to connect to comes from the agent's DNS cache in x-uplink-resolve header.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "UplinkServer"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self._forward("get")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        self._forward("post")
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        self._forward("put")
+
+    def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+        self._forward("delete")
+
+    def _forward(self, method: str) -> None:
+        provider_name, _, endpoint = self.path.lstrip("/").partition("/")
+        settings = get_provider_settings(provider_name)
+        if settings is None:
+            self._reply(404, b"", [])
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        params = libcurl.RawBody(
+            body,
+            self.headers.get("Content-Type", "application/octet-stream"),
+            self.headers.get("Content-Encoding"),
+        )
+        retry_opts = shlex.split(self.headers.get(UPLINK_OPTIONS_HEADER, ""))
+        # Agents select the endpoint, only root can talk to the uplink socket
+        agent_url = self.headers.get(UPLINK_AGENT_URL_HEADER)
+        self.server.counters.add("uplink_bytes_sent", len(body))
+        traffic = Traffic()
+        measurements = libcurl.Measurements()
+
+        try:
+            headers, response_body, http_code = libcurl.perform(
+                settings,
+                method,
+                endpoint,
+                params if body else None,
+                retry_opts,
+                agent_url=agent_url,
+                traffic=traffic,
+                measurements=measurements,
+                resolve_entry=self.headers.get(UPLINK_RESOLVE_HEADER),
+            )
+        except libcurl.LibcurlError as exc:
+            logging.debug("%s %s: %s", provider_name, endpoint, exc)
+            self._reply(
+                502,
+                b"",
+                [
+                    (UPLINK_ERROR_HEADER, str(exc.returncode)),
+                    _traffic_header(traffic),
+                    _measurements_header(measurements),
+                ],
+            )
+            return
+
+        self.server.counters.add("uplink_bytes_received", len(headers) + len(response_body))
+        self._reply(
+            http_code,
+            response_body,
+            _parse_response_headers(headers) + [_traffic_header(traffic), _measurements_header(measurements)],
+        )
+
+    def _reply(self, code: int, body: bytes, headers: list[tuple[str, str]]) -> None:
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:  # pylint: disable=redefined-builtin
+        logging.debug("Uplink: " + format, *args)
+
+    def address_string(self) -> str:
+        return "unix"
+
+
+def _traffic_header(traffic: Traffic) -> tuple[str, str]:
+    return UPLINK_TRAFFIC_HEADER, f"{traffic.sent} {traffic.received} {traffic.tls} {traffic.requests}"
+
+
+def _measurements_header(measurements: libcurl.Measurements) -> tuple[str, str]:
+    # name=value pairs: the counters, then the connection if a new one has been made
+    values = dict(measurements.counters)
+    if measurements.address:
+        values["address"] = measurements.address
+    if measurements.rtt is not None:
+        values["rtt"] = measurements.rtt
+    return UPLINK_MEASUREMENTS_HEADER, " ".join(f"{name}={value}" for name, value in values.items())
+
+
+def _parse_response_headers(headers: bytes) -> list[tuple[str, str]]:
+    parsed = []
+    for line in headers.decode("iso-8859-1").splitlines()[1:]:
+        name, sep, value = line.partition(":")
+        if sep and name.strip().lower() not in SKIPPED_RESPONSE_HEADERS:
+            parsed.append((name.strip(), value.strip()))
+    return parsed
+
+
+class UplinkServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str) -> None:
+        self.counters = Counters(Path(APP_DATA_DIR) / "uplink_stats.json")
+
+        try:
+            os.unlink(socket_path)  # stale socket of the previous run
+        except FileNotFoundError:
+            pass
+        # Agents run as root, nobody else may use the controller's identity
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, UplinkRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def run_uplink_server(socket_path: str) -> None:
+    if not libcurl.is_available():
+        raise RuntimeError("Uplink needs python3-pycurl")
+
+    with UplinkServer(socket_path) as server:
+        logging.info("Uplink is listening on %s", socket_path)
+        try:
+            server.serve_forever()
+        finally:
+            server.counters.flush(force=True)
@@ -2,12 +2,14 @@ import json
 import logging
 import subprocess
 import sys
+import time
+from email.utils import parsedate_to_datetime
 from functools import cache
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 from urllib.parse import urljoin
 
-from tabulate import tabulate
+from wb.cloud_agent.constants import CTRL_SERIAL_CACHE_FILE
 
 if TYPE_CHECKING:
     from wb.cloud_agent.mqtt import MQTTCloudAgent
@@ -16,7 +18,21 @@ if TYPE_CHECKING:
 
 @cache
 def get_ctrl_serial_number() -> str:
-    return subprocess.check_output("wb-gen-serial -s", shell=True).decode().strip()
+    """Controller serial number, wb-gen-serial is run once per boot, then it is read from /run."""
+    cache_file = Path(CTRL_SERIAL_CACHE_FILE)
+    try:
+        serial_number = cache_file.read_text(encoding="utf-8").strip()
+    except OSError:
+        serial_number = ""
+    if serial_number:
+        return serial_number
+
+    serial_number = subprocess.check_output(["wb-gen-serial", "-s"]).decode().strip()
+    try:
+        cache_file.write_text(serial_number, encoding="utf-8")
+    except OSError as exc:
+        logging.debug("Cannot save controller serial number to %s: %s", cache_file, exc)
+    return serial_number
 
 
 def normalize_base_url(base_url: str) -> str:
@@ -94,6 +110,9 @@ def show_providers_table(providers: list["Provider"]) -> None:
         print("No one provider was found")
         return
 
+    # Only the status command prints tables, the daemon doesn't load tabulate
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     table = [[p.name, p.display_url] for p in providers]
     headers = ["Provider", "Controller Url / Activation Url"]
     print(tabulate(table, headers=headers, tablefmt="github"))
@@ -108,19 +127,21 @@ def parse_headers(header_section: str) -> dict[str, str]:
     return headers
 
 
-def get_apt_package_version(package_name: str) -> str:
-    """Get version of installed APT package using dpkg-query."""
+def get_header(headers: dict[str, str], name: str) -> Optional[str]:
+    """Get a header value by case-insensitive name."""
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """Parse Retry-After header (delay in seconds or HTTP date), returns seconds to wait."""
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
     try:
-        result = subprocess.run(
-            ["dpkg-query", "--showformat=${Version}", "--show", package_name],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=5,
-        )
-        return result.stdout.strip()
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-        return "unknown"
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 def handle_connection_state(prev_value: bool, new_value: bool, msg: str, mqtt: "MQTTCloudAgent") -> bool: